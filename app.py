@@ -1,57 +1,282 @@
+import os
 import time
-from flask import Flask, send_from_directory, request
+import threading
+from flask import Flask, Response, send_from_directory, request, jsonify
 from flask_socketio import SocketIO, emit, join_room, leave_room
 import secrets
+from video_info import (
+    extract_video_ids, failed_lookups, fetch_video_infos, placeholder_video_info, timer_duration,
+    video_resolver
+)
+from video_queue import VideoQueue
+from scheduler import RoomScheduler
+from token_bucket import TokenBucket
+from room_store import MemoryRoomStore, encode_room, open_room_store
+from room_journal import RoomJournal, start_snapshots
+from local_broker import LocalBrokerManager
+from wire_codec import CodecPacket, ConnectionCodecs
+import metrics
+from metrics import FANOUT_BUCKETS, Counter, Gauge, Histogram, timed
 
 app = Flask(__name__, static_url_path='')
 app.config['SECRET_KEY'] = 'secret!'
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
-# --- IN-MEMORY DATA STORE ---
+# threading costs one OS thread per open WebSocket and suits development;
+# production runs eventlet (or gevent) through wsgi.py, which monkey-patches
+# before this module is imported. See README for the connection ceilings.
+ASYNC_MODE = os.environ.get('SYNCROOM_ASYNC_MODE', 'threading')
+
+# Running more than one worker: point every worker at the same room store
+# (SYNCROOM_ROOM_STORE=sqlite:///rooms.db) and the same message queue
+# (SYNCROOM_MESSAGE_QUEUE=redis://..., or tcp://host:port for a local_broker.py
+# stand-in) so an emit on one worker reaches sockets connected to the others.
+MESSAGE_QUEUE = os.environ.get('SYNCROOM_MESSAGE_QUEUE', '')
+if MESSAGE_QUEUE.startswith('tcp://'):
+    socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE, serializer=CodecPacket,
+                        client_manager=LocalBrokerManager(MESSAGE_QUEUE))
+else:
+    socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE, serializer=CodecPacket,
+                        message_queue=MESSAGE_QUEUE or None)
+
+# Clients that open with msgpack get msgpack back, the rest JSON; see wire_codec.py
+connection_codecs = ConnectionCodecs()
+connection_codecs.install(socketio.server)
+
+# --- ROOM STORE ---
+# In process memory by default; see room_store.py for shared backends.
+# Read and change a room only while holding room_lock(room).
 # Structure:
 # rooms = {
 #     'room_id': {
 #         'current_video': {'id': 'videoId', 'title': 'Title', 'start_time': 123456789},
-#         'queue': [{'id': 'vid', 'title': 'Title'}],
-#         'users': ['User1', 'User2']
+#         'queue': VideoQueue([{'id': 'vid', 'title': 'Title', 'entry_id': 'abc123'}]),
+#         'users': ['User1', 'User2'],
+#         'version': 42,
+#         'pause_time': None,  # server time the current video was paused, if it is
+#         'total_pause_duration': 0
 #     }
 # }
-rooms = {}
+# start_time is the server time the video was scheduled to be at 0:00; its
+# position is that offset minus any time spent paused.
+rooms = open_room_store(os.environ.get('SYNCROOM_ROOM_STORE', ''))
+
+# The in-memory store is journaled to SYNCROOM_SNAPSHOT every
+# SNAPSHOT_INTERVAL seconds and restored from it on startup (an empty value
+# turns this off; shared stores are durable already). Rooms that changed go
+# in dirty_rooms until the next snapshot.
+SNAPSHOT_PATH = os.environ.get('SYNCROOM_SNAPSHOT', 'rooms.journal')
+SNAPSHOT_INTERVAL = float(os.environ.get('SYNCROOM_SNAPSHOT_INTERVAL', 1))
+dirty_rooms = set()
+dirty_rooms_lock = threading.Lock()
+
+# Recent changes per room, so clients get small deltas instead of the whole
+# room and reconnecting clients can catch up on just what they missed.
+# The store keeps the last OP_LOG_SIZE per room. Each op is {'v': version, 'op': <kind>, ...} where kind is one of:
+#   append      {'videos': [...]}          videos added to the end of the queue
+#   prepend     {'videos': [...]}          videos inserted to play next
+#   remove      {'entry_id': e}            queue entry removed
+#   move        {'entry_id': e, 'to': i}   queue entry moved to position i
+#   update      {'id': vid, 'title': ..., 'duration': ...}  metadata resolved for queued/playing videos
+#   now_playing {'video': {...} or None, 'from_queue': bool}
+
+# Playback is scheduled this far in the future so every client has time to
+# receive play_video and load the video before the shared start instant
+PLAY_DELAY = 0.5
+
+# Every HEARTBEAT_INTERVAL seconds each playing room gets a compact
+# {id, pos, paused, ts} beat so clients can correct drift continuously.
+# Viewers further than OUT_OF_SYNC_THRESHOLD from the room are flagged.
+HEARTBEAT_INTERVAL = float(os.environ.get('SYNCROOM_HEARTBEAT_INTERVAL', 5))
+OUT_OF_SYNC_THRESHOLD = 0.5
+heartbeat_started = threading.Event()
+heartbeat_lock = threading.Lock()
+
+# The server, not the clients, decides when a video has ended: each playing
+# room has one timer at its video's computed end (pauses included). Durations
+# are looked up in the background when a video starts. Timers are per
+# worker, so a timer only acts if the room's shared state agrees it is due.
+scheduler = RoomScheduler(name="auto-advance")
+
+# Latest clock estimate and playback drift reported by each client, per room.
+# Kept per worker, for the sockets connected to it:
+# viewer_stats = {'room_id': {sid: {'user': 'User1', 'rtt': 0.04, 'offset': -0.012, 'drift': 0.08, 'updated': 123456789}}}
+viewer_stats = {}
+sid_rooms = {}  # sid -> room the socket joined
+
+# Chat goes out in per-room batches: the first message into an empty outbox
+# arms a CHAT_BATCH_WINDOW timer, and everything sent to the room before it
+# fires goes out as one `messages` event (a window of 0 sends each message
+# straight away). Each socket may send CHAT_RATE messages per second, in
+# bursts of up to CHAT_BURST; the rest are refused with `chat_throttled`.
+CHAT_BATCH_WINDOW = float(os.environ.get('SYNCROOM_CHAT_BATCH_WINDOW', 0.05))
+CHAT_BATCH_MAX = 500  # messages held per room per window; any more are dropped
+CHAT_RATE = float(os.environ.get('SYNCROOM_CHAT_RATE', 2))
+CHAT_BURST = int(os.environ.get('SYNCROOM_CHAT_BURST', 5))
+chat_outbox = {}  # room -> messages waiting for the next flush
+chat_outbox_lock = threading.Lock()
+chat_buckets = {}  # sid -> TokenBucket
+chat_flusher = RoomScheduler(name="chat-batches")
+
+# --- METRICS ---
+# Served on /metrics for Prometheus. Events per second is
+# rate(syncroom_socket_event_seconds_count[1m]) by event. Socket and
+# broadcast figures are per worker, like viewer_stats.
+SOCKET_EVENTS = Histogram('syncroom_socket_event_seconds', 'Socket.IO handler run time', ['event'])
+BROADCAST_RECIPIENTS = Histogram(
+    'syncroom_broadcast_recipients', 'Sockets on this worker a room broadcast was sent to', ['event'],
+    buckets=FANOUT_BUCKETS
+)
+# result is 'advanced', 'rescheduled' (the end moved) or 'stale' (video changed or paused)
+AUTO_ADVANCES = Counter('syncroom_auto_advance_total', 'Server-side end-of-video timer firings', ['result'])
+HEARTBEAT_ERRORS = Counter('syncroom_heartbeat_errors_total', 'Room heartbeats that failed with a store or broker error')
+# result is 'queued', 'throttled' (sender over its rate) or 'dropped' (room outbox full)
+CHAT_MESSAGES = Counter('syncroom_chat_messages_total', 'Chat messages received, by what became of them', ['result'])
+CHAT_BATCH_SIZE = Histogram(
+    'syncroom_chat_batch_messages', 'Chat messages per `messages` broadcast', buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500)
+)
+
+def sockets_per_room():
+    counts = {}
+    for room in list(sid_rooms.values()):
+        counts[room] = counts.get(room, 0) + 1
+    return counts
+
+Gauge('syncroom_rooms', 'Rooms in the room store').set_function(lambda: sum(1 for _ in rooms))
+Gauge('syncroom_connected_sockets', 'Sockets joined to a room on this worker').set_function(lambda: len(sid_rooms))
+Gauge('syncroom_room_sockets', 'Sockets joined to each room on this worker', ['room']).set_function(sockets_per_room)
+Gauge('syncroom_connections_by_codec', 'Open connections on this worker by wire encoding', ['codec']).set_function(
+    connection_codecs.counts
+)
+
+# One lock per room: handlers in the same room are serialized, different
+# rooms never wait on each other. Reentrant so helpers like play_next can
+# be called from a handler that already holds it.
+def room_lock(room):
+    return rooms.lock(room)
 
 @app.route('/')
 def index():
     return send_from_directory('static', 'index.html')
 
+@app.route('/api/rooms/<room>/sync')
+def room_sync_stats(room):
+    # Round-trip, clock-offset spread and playback drift across the clients in a room
+    if room not in rooms:
+        return jsonify({'error': 'no such room', 'room': room}), 404
+    # viewer_stats is per worker and not part of the room store, so no room
+    # lock: copying the values is enough to read them consistently
+    stats = [dict(s) for s in list(viewer_stats.get(room, {}).values())]
+    result = {'room': room, 'clients': len(stats)}
+    
+    clocked = [s for s in stats if 'rtt' in s]
+    if clocked:
+        rtts = [s['rtt'] * 1000 for s in clocked]
+        offsets = [s['offset'] * 1000 for s in clocked]
+        result['rtt_ms'] = {'mean': sum(rtts) / len(rtts), 'max': max(rtts)}
+        result['offset_ms'] = {'min': min(offsets), 'max': max(offsets), 'spread': max(offsets) - min(offsets)}
+    
+    reporting = [s for s in stats if 'drift' in s]
+    if reporting:
+        drifts = [abs(s['drift']) * 1000 for s in reporting]
+        result['drift_ms'] = {'mean': sum(drifts) / len(drifts), 'max': max(drifts)}
+        result['out_of_sync'] = [
+            {'user': s['user'], 'drift_ms': s['drift'] * 1000}
+            for s in reporting if abs(s['drift']) > OUT_OF_SYNC_THRESHOLD
+        ]
+    return jsonify(result)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/<path:path>')
 def static_files(path):
     return send_from_directory('static', path)
 
+def broadcast(event, data, room, local_only=False):
+    # socketio.emit to a room, recording how many of this worker's sockets it reaches.
+    # local_only skips the message queue: only this worker's sockets get it
+    members = socketio.server.manager.rooms.get('/', {}).get(room)
+    BROADCAST_RECIPIENTS.labels(event).observe(len(members) if members else 0)
+    socketio.emit(event, data, room=room, ignore_queue=local_only)
+
+# --- ROOM VERSIONING ---
+
+def record_op(room, op):
+    """Stamp a room change with the next version, log it and broadcast it as a delta.
+    Caller must hold room_lock(room) so ops go out in version order."""
+    rooms[room]['version'] += 1
+    op['v'] = rooms[room]['version']
+    rooms.log_op(room, op)
+    mark_dirty(room)
+    broadcast('room_op', op, room)
+
+def ops_since(room, version):
+    """Ops a client at `version` is missing, or None if only a full snapshot will do"""
+    current = rooms[room]['version']
+    if version == current:
+        return []
+    log = rooms.ops(room)
+    if version > current or not log or log[0]['v'] > version + 1:
+        return None
+    return [op for op in log if op['v'] > version]
+
+def room_snapshot(room):
+    return dict(rooms[room], queue=rooms[room]['queue'].to_list())
+
+def send_room_state(room, since_version=None):
+    # Send to ONLY the requesting user: missing ops if we still have them, else a snapshot
+    ops = ops_since(room, since_version) if since_version is not None else None
+    if ops is None:
+        emit('sync_state', room_snapshot(room), room=request.sid)
+    else:
+        emit('room_ops', {'ops': ops, 'version': rooms[room]['version']}, room=request.sid)
+
 # --- SOCKET EVENTS ---
 
 @socketio.on('join')
+@timed(SOCKET_EVENTS, 'join')
 def on_join(data):
     username = data['username']
     room = data['room']
     
     join_room(room)
     
-    if room not in rooms:
-        rooms[room] = {
-            'current_video': None,
-            'queue': [],
-            'users': []
-        }
-    
-    if username not in rooms[room]['users']:
-        rooms[room]['users'].append(username)
-    
-    # Notify room
-    emit('message', {'user': 'System', 'text': f'{username} has joined the room.'}, room=room)
-    
-    # Send current state to ONLY the new user
-    emit('sync_state', rooms[room], room=request.sid)
+    with room_lock(room):
+        if room not in rooms:
+            rooms[room] = {
+                'current_video': None,
+                'queue': VideoQueue(),
+                'users': [],
+                'version': 0,
+                'pause_time': None,
+                'total_pause_duration': 0
+            }
+        # Only once the room exists, so the heartbeat never finds a socket in a missing room
+        sid_rooms[request.sid] = room
+        start_heartbeat()
+        
+        if username not in rooms[room]['users']:
+            rooms[room]['users'].append(username)
+            mark_dirty(room)
+        
+        # Notify room
+        broadcast('message', {'user': 'System', 'text': f'{username} has joined the room.'}, room)
+        
+        # Reconnecting clients send the last version they saw
+        send_room_state(room, data.get('since_version'))
+
+@socketio.on('request_ops')
+@timed(SOCKET_EVENTS, 'request_ops')
+def on_request_ops(data):
+    # Client noticed a gap in the versions it received
+    room = data['room']
+    if room in rooms:
+        with room_lock(room):
+            send_room_state(room, data.get('since_version'))
 
 @socketio.on('add_to_queue')
+@timed(SOCKET_EVENTS, 'add_to_queue')
 def on_add_queue(data):
     room = data['room']
     video_id = data['video_id']
@@ -60,54 +285,424 @@ def on_add_queue(data):
     if room in rooms:
         video_data = {'id': video_id, 'title': title}
         
-        # If nothing playing, play immediately
+        with room_lock(room):
+            # If nothing playing, play immediately
+            if rooms[room]['current_video'] is None:
+                start_video(room, video_data)
+            elif data.get('play_next'):
+                rooms[room]['queue'].appendleft(video_data)
+                record_op(room, {'op': 'prepend', 'videos': [dict(video_data)]})
+            else:
+                rooms[room]['queue'].append(video_data)
+                record_op(room, {'op': 'append', 'videos': [dict(video_data)]})
+
+@socketio.on('remove_from_queue')
+@timed(SOCKET_EVENTS, 'remove_from_queue')
+def on_remove_from_queue(data):
+    room = data['room']
+    if room in rooms:
+        with room_lock(room):
+            if rooms[room]['queue'].remove(data['entry_id']) is not None:
+                record_op(room, {'op': 'remove', 'entry_id': data['entry_id']})
+
+@socketio.on('move_in_queue')
+@timed(SOCKET_EVENTS, 'move_in_queue')
+def on_move_in_queue(data):
+    room = data['room']
+    if room in rooms:
+        with room_lock(room):
+            queue = rooms[room]['queue']
+            position = max(0, min(int(data['position']), len(queue) - 1))
+            if queue.move(data['entry_id'], position):
+                record_op(room, {'op': 'move', 'entry_id': data['entry_id'], 'to': position})
+
+@socketio.on('add_to_queue_bulk')
+@timed(SOCKET_EVENTS, 'add_to_queue_bulk')
+def on_add_queue_bulk(data):
+    # Accepts either a list of URLs/IDs ('urls') or a pasted text blob ('text')
+    room = data['room']
+    if room not in rooms:
+        return
+    
+    video_ids = extract_video_ids(data.get('urls') or data.get('text', ''))
+    if not video_ids:
+        emit('import_progress', {'done': 0, 'total': 0}, room=request.sid)
+        return
+    
+    videos = [
+        {'id': video_id, 'title': placeholder_video_info(video_id)['title']}
+        for video_id in video_ids
+    ]
+    queued = videos
+    with room_lock(room):
         if rooms[room]['current_video'] is None:
-            rooms[room]['current_video'] = video_data
-            rooms[room]['current_video']['start_time'] = time.time()
-            emit('play_video', rooms[room]['current_video'], room=room)
-        else:
-            rooms[room]['queue'].append(video_data)
-            emit('update_queue', rooms[room]['queue'], room=room)
+            start_video(room, videos[0])
+            queued = videos[1:]
+        
+        if queued:
+            rooms[room]['queue'].extend(queued)
+            record_op(room, {'op': 'append', 'videos': [dict(video) for video in queued]})
+    broadcast('import_progress', {'done': 0, 'total': len(videos)}, room)
+    socketio.start_background_task(resolve_bulk, room, videos)
+
+def resolve_bulk(room, videos):
+    # Fetch titles concurrently and stream progress back to the room. The
+    # videos are patched by ID in the room's current state, since a shared
+    # store hands out a fresh copy of the room on every lock.
+    video_ids = list(dict.fromkeys(video['id'] for video in videos))
+    for done, (video_id, info) in enumerate(fetch_video_infos(video_ids), 1):
+        with room_lock(room):
+            patch_video(room, video_id, info)
+        broadcast('import_progress', {'done': done, 'total': len(video_ids)}, room)
+
+def patch_video(room, video_id, info):
+    # Caller must hold room_lock(room). Returns whether the room has the video.
+    # Every entry of the video gets the same fields, and the op carries only
+    # those that changed, so clients applying it agree with a full sync.
+    entries = [video for video in rooms[room]['queue'] if video['id'] == video_id]
+    current = rooms[room]['current_video']
+    playing = current is not None and current['id'] == video_id
+    if playing:
+        entries.append(current)
+    
+    changes = {}
+    if any(video.get('title') != info['title'] for video in entries):
+        changes['title'] = info['title']
+    # The duration the timer goes by; a known one is never replaced by a guess
+    duration = timer_duration(info)
+    if duration and any(video.get('duration') != duration for video in entries):
+        changes['duration'] = duration
+    if not changes:
+        return bool(entries)
+    
+    for video in entries:
+        video.update(changes)
+    if playing and 'duration' in changes:
+        schedule_end(room)
+    record_op(room, {'op': 'update', 'id': video_id, **changes})
+    return True
+
+def refresh_video_info(video_id, info):
+    # A background retry found metadata for a video whose lookup had failed:
+    # patch it wherever it is still playing or queued with the fallback
+    for room in list(rooms):
+        if room not in rooms:
+            continue
+        with room_lock(room):
+            if room in rooms:
+                patch_video(room, video_id, info)
+
+failed_lookups.add_listener(refresh_video_info)
 
 @socketio.on('video_ended')
+@timed(SOCKET_EVENTS, 'video_ended')
 def on_video_ended(data):
     # Logic: When a client reports video end, server decides next move.
-    # To prevent double-skipping if multiple clients report end, we check timestamps or lock.
-    # Simple approach: Trust the first reporter, but verify queue.
+    # If the server knows the duration (read from YouTube, never a guess), its
+    # own timer advances the room and client reports are ignored. Otherwise
+    # every client in the room reports the same end, so the report names the
+    # video (id + start_time) it watched finish; only the first report for the
+    # current video advances the queue.
     room = data['room']
     if room in rooms:
-        play_next(room)
+        with room_lock(room):
+            current = rooms[room]['current_video']
+            if current is None or current.get('duration') or data.get('video_id') != current['id']:
+                return
+            if 'start_time' in data and data['start_time'] != current['start_time']:
+                return
+            play_next(room)
 
 @socketio.on('skip')
+@timed(SOCKET_EVENTS, 'skip')
 def on_skip(data):
     room = data['room']
     if room in rooms:
-        play_next(room)
+        with room_lock(room):
+            play_next(room)
+
+@socketio.on('toggle_pause')
+@timed(SOCKET_EVENTS, 'toggle_pause')
+def on_toggle_pause(data):
+    room = data['room']
+    if room in rooms:
+        with room_lock(room):
+            if rooms[room]['current_video'] is None:
+                return
+            now = time.time()
+            if rooms[room]['pause_time'] is None:
+                rooms[room]['pause_time'] = now
+            else:
+                rooms[room]['total_pause_duration'] += now - rooms[room]['pause_time']
+                rooms[room]['pause_time'] = None
+            mark_dirty(room)
+            schedule_end(room)
+            # Don't wait for the next beat to tell everyone
+            broadcast('heartbeat', heartbeat_payload(room, now), room)
 
 @socketio.on('send_message')
+@timed(SOCKET_EVENTS, 'send_message')
 def on_send_message(data):
     room = data['room']
-    emit('message', data, room=room)
+    bucket = chat_buckets.get(request.sid)
+    if bucket is None:
+        bucket = chat_buckets.setdefault(request.sid, TokenBucket(CHAT_RATE, CHAT_BURST))
+    if not bucket.take():
+        CHAT_MESSAGES.labels('throttled').inc()
+        emit('chat_throttled', {'retry_after': round(bucket.wait_time(), 3)}, room=request.sid)
+        return
+    queue_chat(room, data)
+
+def queue_chat(room, message):
+    # Add a message to the room's outbox; the first one in arms the flush
+    with chat_outbox_lock:
+        outbox = chat_outbox.setdefault(room, [])
+        if len(outbox) >= CHAT_BATCH_MAX:
+            CHAT_MESSAGES.labels('dropped').inc()
+            return
+        outbox.append(message)
+        first = len(outbox) == 1
+    CHAT_MESSAGES.labels('queued').inc()
+    if not CHAT_BATCH_WINDOW:
+        flush_chat(room)
+    elif first:
+        chat_flusher.schedule(room, time.time() + CHAT_BATCH_WINDOW, flush_chat)
+
+def flush_chat(room, token=None):
+    with chat_outbox_lock:
+        batch = chat_outbox.pop(room, None)
+    if batch:
+        CHAT_BATCH_SIZE.observe(len(batch))
+        broadcast('messages', {'messages': batch}, room)
 
 @socketio.on('request_sync')
+@timed(SOCKET_EVENTS, 'request_sync')
 def on_request_sync(data):
     # Client asks "Where should I be?"
+    # Clients that ran time_ping should prefer start_time + their clock offset
+    # over elapsed, which is already stale by half a round trip on arrival.
+    room = data['room']
+    if room in rooms:
+        with room_lock(room):
+            video = rooms[room]['current_video']
+            if video:
+                now = time.time()
+                position = video_position(room, now)
+                emit('sync_time', {
+                    'elapsed': position,
+                    'position': position,
+                    'paused': rooms[room]['pause_time'] is not None,
+                    'start_time': video['start_time'],
+                    'server_time': now
+                }, room=request.sid)
+
+@socketio.on('time_ping')
+@timed(SOCKET_EVENTS, 'time_ping')
+def on_time_ping(data):
+    # NTP-style exchange: the client sends t0 (its clock), we answer with our
+    # receive (t1) and send (t2) times; with its receive time t3 the client
+    # gets rtt = (t3 - t0) - (t2 - t1) and offset = ((t1 - t0) + (t2 - t3)) / 2
+    t1 = time.time()
+    emit('time_pong', {'t0': data['t0'], 't1': t1, 't2': time.time()}, room=request.sid)
+
+@socketio.on('clock_report')
+@timed(SOCKET_EVENTS, 'clock_report')
+def on_clock_report(data):
+    # Client's best (lowest-rtt) estimate after a round of time_pings
+    room = data['room']
+    if room in rooms:
+        with room_lock(room):
+            viewer_stats.setdefault(room, {}).setdefault(request.sid, {}).update({
+                'user': data.get('user'),
+                'rtt': float(data['rtt']),
+                'offset': float(data['offset']),
+                'updated': time.time()
+            })
+
+@socketio.on('position_report')
+@timed(SOCKET_EVENTS, 'position_report')
+def on_position_report(data):
+    # Client's player position minus where the heartbeat said it should be
+    # (positive = ahead), measured before it applied any correction
     room = data['room']
-    if room in rooms and rooms[room]['current_video']:
+    if room in rooms:
+        with room_lock(room):
+            current = rooms[room]['current_video']
+            if current is None or data.get('id') != current['id']:
+                return
+            viewer_stats.setdefault(room, {}).setdefault(request.sid, {}).update({
+                'user': data.get('user'),
+                'drift': float(data['drift']),
+                'updated': time.time()
+            })
+
+@socketio.on('disconnect')
+@timed(SOCKET_EVENTS, 'disconnect')
+def on_disconnect(*args):
+    chat_buckets.pop(request.sid, None)
+    room = sid_rooms.pop(request.sid, None)
+    if room is not None:
+        with room_lock(room):
+            viewer_stats.get(room, {}).pop(request.sid, None)
+
+def video_position(room, now):
+    # Caller must hold room_lock(room)
+    paused_for = rooms[room]['total_pause_duration']
+    if rooms[room]['pause_time'] is not None:
+        paused_for += now - rooms[room]['pause_time']
+    return now - rooms[room]['current_video']['start_time'] - paused_for
+
+def heartbeat_payload(room, now):
+    # Caller must hold room_lock(room)
+    return {
+        'id': rooms[room]['current_video']['id'],
+        'pos': round(video_position(room, now), 3),
+        'paused': rooms[room]['pause_time'] is not None,
+        'ts': now
+    }
+
+def heartbeat_loop():
+    while True:
+        socketio.sleep(HEARTBEAT_INTERVAL)
+        # Each worker beats the rooms its own sockets are in
+        for room in set(sid_rooms.values()):
+            try:
+                if room not in rooms:
+                    continue
+                with room_lock(room):
+                    if room not in rooms or rooms[room]['current_video'] is None:
+                        continue
+                    payload = heartbeat_payload(room, time.time())
+                # Every worker beats its own sockets, so don't pass it on to the others
+                broadcast('heartbeat', payload, room, local_only=True)
+            except Exception:
+                # One room's store or broker error must not stop the beats for every room
+                HEARTBEAT_ERRORS.inc()
+
+def start_heartbeat():
+    # One heartbeat task per process, started by the first join
+    if not heartbeat_started.is_set():
+        with heartbeat_lock:
+            if not heartbeat_started.is_set():
+                heartbeat_started.set()
+                socketio.start_background_task(heartbeat_loop)
+
+def start_video(room, video_data, from_queue=False):
+    # Caller must hold room_lock(room)
+    now = time.time()
+    video_data['start_time'] = now + PLAY_DELAY  # Scheduled play-at instant
+    rooms[room]['current_video'] = video_data
+    rooms[room]['pause_time'] = None
+    rooms[room]['total_pause_duration'] = 0
+    record_op(room, {'op': 'now_playing', 'video': dict(video_data), 'from_queue': from_queue})
+    broadcast('play_video', dict(
+        video_data, server_time=now, play_at=video_data['start_time'], position=-PLAY_DELAY
+    ), room)
+    
+    if video_data.get('duration'):
+        schedule_end(room)
+    else:
+        scheduler.cancel(room)
+        token = (video_data['id'], video_data['start_time'])
+        video_resolver.resolve(video_data['id']).add_done_callback(
+            lambda future: apply_video_info(room, token, future)
+        )
+
+def apply_video_info(room, token, future):
+    try:
+        info = future.result()
+    except Exception:
+        return
+    with room_lock(room):
+        video = rooms[room]['current_video']
+        if video is None or (video['id'], video['start_time']) != token:
+            return
+        video['title'] = info['title']
+        video['duration'] = timer_duration(info)
+        record_op(room, {'op': 'update', 'id': video['id'], 'title': info['title'], 'duration': video['duration']})
+        schedule_end(room)
+
+def video_end_time(room):
+    # Caller must hold room_lock(room)
+    video = rooms[room]['current_video']
+    return video['start_time'] + rooms[room]['total_pause_duration'] + video['duration']
+
+def schedule_end(room):
+    # Caller must hold room_lock(room)
+    video = rooms[room]['current_video']
+    if video is None or rooms[room]['pause_time'] is not None or not video.get('duration'):
+        scheduler.cancel(room)
+        return
+    scheduler.schedule(room, video_end_time(room), auto_advance, (video['id'], video['start_time']))
+
+def auto_advance(room, token):
+    # Fired once by the scheduler when the video the timer was set for ends
+    with room_lock(room):
         video = rooms[room]['current_video']
-        elapsed = time.time() - video['start_time']
-        emit('sync_time', {'elapsed': elapsed}, room=request.sid)
+        if video is None or (video['id'], video['start_time']) != token:
+            AUTO_ADVANCES.labels('stale').inc()
+            return
+        if rooms[room]['pause_time'] is not None:
+            AUTO_ADVANCES.labels('stale').inc()
+            return
+        if video_end_time(room) > time.time():
+            # Paused and resumed on another worker since this timer was set
+            AUTO_ADVANCES.labels('rescheduled').inc()
+            schedule_end(room)
+            return
+        AUTO_ADVANCES.labels('advanced').inc()
+        play_next(room)
 
 def play_next(room):
+    # Caller must hold room_lock(room)
     if rooms[room]['queue']:
-        next_video = rooms[room]['queue'].pop(0)
-        next_video['start_time'] = time.time()
-        rooms[room]['current_video'] = next_video
-        emit('play_video', next_video, room=room)
-        emit('update_queue', rooms[room]['queue'], room=room)
+        start_video(room, rooms[room]['queue'].popleft(), from_queue=True)
     else:
         rooms[room]['current_video'] = None
-        emit('stop_video', {}, room=room)
+        scheduler.cancel(room)
+        record_op(room, {'op': 'now_playing', 'video': None, 'from_queue': False})
+        broadcast('stop_video', {}, room)
+
+# --- SNAPSHOTS ---
+
+def mark_dirty(room):
+    with dirty_rooms_lock:
+        dirty_rooms.add(room)
+
+def collect_dirty_rooms():
+    # Each room is encoded under its own lock, so a snapshot never blocks more than one room at a time
+    global dirty_rooms
+    with dirty_rooms_lock:
+        dirty, dirty_rooms = dirty_rooms, set()
+    changes = {}
+    for room in dirty:
+        with room_lock(room):
+            changes[room] = encode_room(rooms[room]) if room in rooms else None
+    return changes
+
+def restore_rooms(journal):
+    # Positions need no adjusting: they are computed from start_time and the
+    # pause totals, so a room resumes where it would be had the server never
+    # stopped, and a video that ended meanwhile advances as soon as its timer
+    # is re-armed.
+    for room, state in journal.load().items():
+        with room_lock(room):
+            rooms[room] = dict(state, queue=VideoQueue(state['queue']))
+            video = rooms[room]['current_video']
+            if video is None:
+                continue
+            if video.get('duration'):
+                schedule_end(room)
+            else:
+                token = (video['id'], video['start_time'])
+                video_resolver.resolve(video['id']).add_done_callback(
+                    lambda future, room=room, token=token: apply_video_info(room, token, future)
+                )
+
+if SNAPSHOT_PATH and isinstance(rooms, MemoryRoomStore):
+    room_journal = RoomJournal(SNAPSHOT_PATH)
+    restore_rooms(room_journal)
+    start_snapshots(room_journal, collect_dirty_rooms, SNAPSHOT_INTERVAL)
 
 if __name__ == '__main__':
-    socketio.run(app)
\ No newline at end of file
+    socketio.run(app, port=int(os.environ.get('PORT', 5000)))
\ No newline at end of file
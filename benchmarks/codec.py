@@ -0,0 +1,119 @@
+"""JSON vs msgpack on the events app.py actually sends.
+
+Builds a representative payload for each broadcast kind, then times the
+server-side encode (one per broadcast), the client-side decode (one per
+recipient) and the bytes on the wire for both encodings. The mix line weights
+them by how often each kind goes out in a busy room. Live, per-connection
+figures come from `load.py --codec mixed`.
+
+    python benchmarks/codec.py
+    python benchmarks/codec.py --queue 200 --number 20000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import msgpack
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from socketio import packet  # noqa: E402
+from wire_codec import CodecPacket  # noqa: E402
+
+# Broadcasts per minute in a busy room: a beat every 5 s, chat batches,
+# queue adds and title updates, a video change every few minutes
+MIX = {
+    'heartbeat': 12,
+    'messages': 30,
+    'room_op append': 4,
+    'room_op update': 4,
+    'room_op now_playing': 0.3,
+    'play_video': 0.3,
+    'sync_time': 6,
+    'sync_state': 1,
+}
+
+
+def video(index):
+    return {
+        'id': f'dQw4w9WgX{index % 100:02d}',
+        'title': f'Artist {index} - A fairly typical music video title (Official Video)',
+        'entry_id': f'{index:012x}',
+        'duration': 213 + index,
+    }
+
+
+def payloads(queue_size):
+    now = time.time()
+    playing = dict(video(0), start_time=now)
+    return {
+        'heartbeat': {'id': playing['id'], 'pos': 93.412, 'paused': False, 'ts': now},
+        'messages': {'messages': [
+            {'room': 'lounge', 'user': f'viewer{i}', 'text': 'this part is so good'} for i in range(3)
+        ]},
+        'room_op append': {'op': 'append', 'videos': [video(1)], 'v': 1042},
+        'room_op update': {'op': 'update', 'id': video(1)['id'], 'title': video(1)['title'], 'duration': 214,
+                           'v': 1043},
+        'room_op now_playing': {'op': 'now_playing', 'video': playing, 'from_queue': True, 'v': 1044},
+        'play_video': dict(playing, server_time=now, play_at=now + 0.5, position=-0.5),
+        'sync_time': {'elapsed': 93.4, 'position': 93.4, 'paused': False, 'start_time': now, 'server_time': now},
+        'sync_state': {
+            'current_video': playing,
+            'queue': [video(i) for i in range(1, queue_size + 1)],
+            'users': [f'viewer{i}' for i in range(30)],
+            'version': 1044,
+            'pause_time': None,
+            'total_pause_duration': 0,
+        },
+    }
+
+
+def per_call(func, number):
+    started = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - started) / number
+
+
+def measure(event, data, number):
+    event_name = event.split()[0]
+    pkt = CodecPacket(packet.EVENT, data=[event_name, data])
+    as_json = '4' + pkt.encode()  # Engine.IO message prefix
+    as_msgpack = pkt.encode_msgpack()
+    return {
+        'json_bytes': len(as_json.encode()),
+        'msgpack_bytes': len(as_msgpack),
+        'json_encode_us': per_call(lambda: CodecPacket(packet.EVENT, data=[event_name, data]).encode(), number) * 1e6,
+        'msgpack_encode_us': per_call(
+            lambda: CodecPacket(packet.EVENT, data=[event_name, data]).encode_msgpack(), number
+        ) * 1e6,
+        'json_decode_us': per_call(lambda: json.loads(as_json[2:]), number) * 1e6,
+        'msgpack_decode_us': per_call(lambda: msgpack.loads(as_msgpack), number) * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--queue', type=int, default=50, help='queue length in the sync_state snapshot')
+    parser.add_argument('--number', type=int, default=5000, help='repetitions per timing')
+    args = parser.parse_args()
+    
+    results = {event: measure(event, data, args.number) for event, data in payloads(args.queue).items()}
+    columns = ['json_bytes', 'msgpack_bytes', 'json_encode_us', 'msgpack_encode_us', 'json_decode_us',
+               'msgpack_decode_us']
+    print(f"{'event':<20}" + ''.join(f'{column:>18}' for column in columns))
+    for event, result in results.items():
+        print(f'{event:<20}' + ''.join(f'{result[column]:>18.1f}' for column in columns))
+    
+    total = sum(MIX.values())
+    mix = {column: sum(results[event][column] * weight for event, weight in MIX.items()) / total for column in columns}
+    print(f"{'mix (per event)':<20}" + ''.join(f'{mix[column]:>18.1f}' for column in columns))
+    print(f"\nmsgpack vs JSON on the mix: {100 * (1 - mix['msgpack_bytes'] / mix['json_bytes']):.0f}% fewer bytes, "
+          f"encode {mix['msgpack_encode_us'] / mix['json_encode_us']:.2f}x, "
+          f"decode {mix['msgpack_decode_us'] / mix['json_decode_us']:.2f}x the time")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Concurrent-connection ceiling of the Socket.IO server in each async mode.
+
+Starts the server in the chosen mode (wsgi.py for eventlet/gevent, gunicorn's
+threaded worker for threading), then ramps up WebSocket clients (joined to
+rooms of --room-size) in batches through each level in --levels. At every
+level one member of each room sends a chat message and the script times how
+long it takes to reach everyone in the room. A level passes if every client
+joined and the fan-out p95 stayed under --max-p95.
+
+    python benchmarks/connections.py --mode eventlet --levels 500,1000,2000,4000
+    python benchmarks/connections.py --mode threading --threads 1000 --levels 250,500,1000
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+from sio_client import LoadClient, percentile, process_stats
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def server_command(mode, port, threads):
+    if mode == 'threading':
+        return [sys.executable, '-m', 'gunicorn', '-w', '1', '--threads', str(threads),
+                '-b', f'127.0.0.1:{port}', '--log-level', 'warning', 'wsgi:app']
+    return [sys.executable, 'wsgi.py']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url, timeout=20):
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            opener.open(url, timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server at {url} did not come up')
+
+
+def worker_pid(master_pid):
+    # gunicorn serves from a forked worker; that's the process worth measuring
+    # (wsgi.py serves from the process itself)
+    try:
+        with open(f'/proc/{master_pid}/task/{master_pid}/children') as children:
+            pids = children.read().split()
+    except OSError:
+        pids = []
+    return int(pids[0]) if pids else master_pid
+
+
+async def connect_clients(url, count, first_index, room_of, batch, timeout, codec_of=lambda index: 'json'):
+    # Connect in batches, each client joining its room; a client counts once
+    # the server has answered its join with the room state
+    connected = []
+    for start in range(0, count, batch):
+        clients = [LoadClient(url, codec_of(index))
+                   for index in range(first_index + start, first_index + min(start + batch, count))]
+        results = await asyncio.gather(*(client.connect(timeout) for client in clients), return_exceptions=True)
+        joined = []
+        for index, (client, result) in enumerate(zip(clients, results), first_index + start):
+            if isinstance(result, Exception):
+                continue
+            client.room = room_of(index)
+            client.joined = asyncio.Event()
+            client.on('sync_state', lambda data, received_at, client=client: client.joined.set())
+            joined.append(client)
+        await asyncio.gather(*(
+            client.emit('join', {'username': f'user{id(client)}', 'room': client.room}) for client in joined
+        ))
+        for client in joined:
+            try:
+                await asyncio.wait_for(client.joined.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+            connected.append(client)
+    return connected, count - len(connected)
+
+
+async def measure_fanout(clients, timeout):
+    latencies = []
+    for client in clients:
+        client.on('messages', lambda data, received_at: latencies.extend(
+            received_at - message['sent'] for message in data['messages'] if 'sent' in message
+        ))
+    senders = {}
+    for client in clients:
+        senders.setdefault(client.room, client)
+    for room, sender in senders.items():
+        await sender.emit('send_message', {'room': room, 'user': 'bench', 'text': 'ping', 'sent': time.time()})
+    
+    deadline = time.time() + timeout
+    while len(latencies) < len(clients) and time.time() < deadline:
+        await asyncio.sleep(0.05)
+    return latencies
+
+
+async def run(args):
+    port = free_port()
+    url = f'http://127.0.0.1:{port}'
+    env = dict(os.environ, SYNCROOM_ASYNC_MODE=args.mode, SYNCROOM_VIDEO_CACHE='', SYNCROOM_SNAPSHOT='',
+               PORT=str(port), SYNCROOM_MAX_CONNECTIONS=str(args.max_connections))
+    server = subprocess.Popen(server_command(args.mode, port, args.threads), cwd=ROOT, env=env)
+    clients = []
+    try:
+        wait_until_up(url)
+        pid = worker_pid(server.pid)
+        print(f'mode={args.mode} pid={pid} baseline={process_stats(pid)}')
+        print(f"{'clients':>8} {'failed':>7} {'connect_s':>9} {'p50_ms':>8} {'p95_ms':>8} {'delivered':>9} "
+              f"{'rss_mb':>7} {'threads':>7}  result")
+        
+        for level in args.levels:
+            started = time.time()
+            new, failed = await connect_clients(
+                url, level - len(clients), len(clients), lambda index: f'bench-{index // args.room_size}',
+                args.batch, args.timeout
+            )
+            clients += new
+            connect_time = time.time() - started
+            
+            latencies = await measure_fanout(clients, args.timeout)
+            p50 = percentile(latencies, 50)
+            p95 = percentile(latencies, 95)
+            stats = process_stats(pid)
+            passed = failed == 0 and len(latencies) == len(clients) and p95 is not None and p95 <= args.max_p95
+            print(f'{level:>8} {failed:>7} {connect_time:>9.2f} '
+                  f"{(p50 or 0) * 1000:>8.1f} {(p95 or 0) * 1000:>8.1f} {len(latencies):>9} "
+                  f"{stats.get('rss_mb', 0):>7.1f} {stats.get('threads', 0):>7}  {'ok' if passed else 'FAIL'}")
+            if not passed:
+                break
+    finally:
+        await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--mode', choices=['threading', 'eventlet', 'gevent'], default='eventlet')
+    parser.add_argument('--levels', type=lambda s: [int(n) for n in s.split(',')], default=[250, 500, 1000, 2000])
+    parser.add_argument('--room-size', type=int, default=20)
+    parser.add_argument('--batch', type=int, default=100, help='clients connected at a time while ramping')
+    parser.add_argument('--threads', type=int, default=1000, help='gunicorn --threads in threading mode')
+    parser.add_argument('--max-connections', type=int, default=10000, help='SYNCROOM_MAX_CONNECTIONS in green modes')
+    parser.add_argument('--timeout', type=float, default=15)
+    parser.add_argument('--max-p95', type=float, default=1.0, help='fan-out p95 (seconds) a level must stay under')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Streaming embed-page duration scrape vs the old download-then-search.
+
+Serves stand-in embed pages from a local server: --size bytes each, with the
+duration field early, midway, late or missing, sent in chunks at --throughput
+bytes per second so reading less of a page saves real time. First checks that
+both methods find the same duration, and that the streaming scan still finds
+a field split across chunk boundaries. Then reports bytes read and median
+latency per page for each method.
+
+    python benchmarks/embed_scrape.py
+    python benchmarks/embed_scrape.py --size 1500000 --throughput 2000000 --repeat 10
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from video_info import (  # noqa: E402
+    EMBED_HEADERS, EMBED_MAX_BYTES, http_session, scan_embed_duration, scrape_embed_duration
+)
+
+FILLER = b'<script>var ytcfg={"EXPERIMENT_FLAGS":{"web_player_flag":true},"INNERTUBE_CONTEXT_CLIENT_VERSION":"1.2"};</script>\n'
+# page name -> (where the field sits as a fraction of the page, the field)
+PAGES = {
+    'early': (0.05, b'"approxDurationMs": "213480"'),
+    'middle': (0.5, b'"length_seconds": "213"'),
+    'late': (0.95, b'data-duration="213"'),
+    'missing': (None, None),
+}
+SEND_CHUNK = 8 * 1024
+
+
+def build_page(size, position, field):
+    body = (FILLER * (size // len(FILLER) + 1))[:size]
+    if field is None:
+        return body
+    at = int(size * position)
+    return body[:at] + field + body[at + len(field):]
+
+
+def start_server(pages, throughput):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        
+        def do_GET(self):
+            page = pages.get(self.path.rsplit('/', 1)[-1])
+            if page is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(page)))
+            self.end_headers()
+            try:
+                for start in range(0, len(page), SEND_CHUNK):
+                    self.wfile.write(page[start:start + SEND_CHUNK])
+                    time.sleep(SEND_CHUNK / throughput)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the streaming scrape hung up early, as intended
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def old_scrape(embed_url):
+    """get_video_duration's scrape before streaming: the whole page, then four searches in turn"""
+    response = http_session.get(embed_url, headers=EMBED_HEADERS, timeout=30)
+    html = response.text
+    patterns = [
+        r'"length_seconds":\s*"(\d+)"',
+        r'"approxDurationMs":\s*"(\d+)"',
+        r'"duration":\s*"(\d+)"',
+        r'data\-duration="(\d+)"'
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, html)
+        if match:
+            if 'approxDurationMs' in pattern:
+                return int(match.group(1)) // 1000, len(response.content)
+            return int(match.group(1)), len(response.content)
+    return None, len(response.content)
+
+
+def new_scrape(embed_url, max_bytes):
+    return scrape_embed_duration(embed_url, max_bytes=max_bytes, timeout=30)
+
+
+def check(pages, base_url, max_bytes):
+    for name, page in pages.items():
+        expected, _ = old_scrape(base_url + name)
+        _, field = PAGES[name]
+        if field is not None and page.index(field) + len(field) > max_bytes:
+            expected = None  # past the ceiling, which the old method doesn't have
+        found, _ = new_scrape(base_url + name, max_bytes)
+        assert found == expected, f'{name}: streaming found {found}, old method {expected}'
+        # Tiny chunks split every field across boundaries
+        split, _ = scan_embed_duration((page[i:i + 7] for i in range(0, len(page), 7)), max_bytes)
+        assert split == expected, f'{name}: split into 7-byte chunks found {split}, expected {expected}'
+        print(f'{name:<10} duration {expected}')
+
+
+def measure(scrape, url, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _, read = scrape(url)
+        timings.append(time.perf_counter() - started)
+    return read, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=600_000, help='bytes per stand-in embed page')
+    parser.add_argument('--throughput', type=float, default=4_000_000, help='bytes per second the server sends')
+    parser.add_argument('--max-bytes', type=int, default=EMBED_MAX_BYTES, help='byte ceiling for the streaming scan')
+    parser.add_argument('--repeat', type=int, default=5, help='timed fetches per page and method')
+    args = parser.parse_args()
+    
+    pages = {name: build_page(args.size, position, field) for name, (position, field) in PAGES.items()}
+    server = start_server(pages, args.throughput)
+    base_url = f'http://127.0.0.1:{server.server_address[1]}/embed/'
+    
+    check(pages, base_url, args.max_bytes)
+    print(f"\n{'page':<10} {'old_bytes':>10} {'new_bytes':>10} {'old_ms':>9} {'new_ms':>9}")
+    for name in pages:
+        old_read, old_seconds = measure(old_scrape, base_url + name, args.repeat)
+        new_read, new_seconds = measure(lambda url: new_scrape(url, args.max_bytes), base_url + name, args.repeat)
+        print(f'{name:<10} {old_read:>10} {new_read:>10} {old_seconds * 1000:>9.1f} {new_seconds * 1000:>9.1f}')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
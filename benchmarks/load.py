@@ -0,0 +1,293 @@
+"""Socket.IO load generator for app.py.
+
+Connects --clients simulated viewers spread over --rooms rooms, then has every
+client fire join / add_to_queue / send_message / request_sync / skip /
+video_ended at its own Poisson rate for --duration seconds. Reports events
+sent and delivered per second, fan-out latency percentiles for each kind of
+broadcast, server memory per connection and CPU. --max-p95-ms turns it into a
+regression gate: the run exits non-zero if any fan-out p95 is over the limit.
+
+    python benchmarks/load.py --clients 500 --rooms 25 --duration 30
+    python benchmarks/load.py --rates send_message=2,skip=0.05 --json load.json
+    python benchmarks/load.py --url http://127.0.0.1:5000 --server-pid 1234
+    python benchmarks/load.py --codec mixed  # half the clients on msgpack
+
+Started servers get a throwaway video cache pre-filled with the IDs the
+clients queue, so a run never fetches anything from YouTube.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from connections import ROOT, connect_clients, free_port, server_command, wait_until_up, worker_pid
+from sio_client import cpu_seconds, percentile, process_stats
+
+sys.path.insert(0, ROOT)
+from video_info import VideoInfoCache  # noqa: E402
+
+EVENTS = ['join', 'add_to_queue', 'send_message', 'request_sync', 'skip', 'video_ended']
+# Per client, per second
+DEFAULT_RATES = 'join=0.005,add_to_queue=0.05,send_message=0.2,request_sync=0.1,skip=0.01,video_ended=0.01'
+VIDEO_POOL = 200
+
+
+def parse_rates(text):
+    rates = dict.fromkeys(EVENTS, 0.0)
+    for item in text.split(','):
+        event, rate = item.split('=')
+        if event not in rates:
+            raise argparse.ArgumentTypeError(f'Unknown event {event!r}; expected one of {", ".join(EVENTS)}')
+        rates[event] = float(rate)
+    return rates
+
+
+def video_pool(size):
+    alphabet = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_'
+    rng = random.Random(42)
+    return [''.join(rng.choice(alphabet) for _ in range(11)) for _ in range(size)]
+
+
+def seed_video_cache(path, video_ids, duration):
+    cache = VideoInfoCache(db_path=path)
+    for video_id in video_ids:
+        cache.set(video_id, {
+            'title': f'Load test {video_id}',
+            'thumbnail': '',
+            'author': 'load test',
+            'duration': duration
+        })
+
+
+class Tracker:
+    """Counts what was sent and received and matches broadcasts back to the emit that caused them.
+
+    Chat messages carry their send time. Queued videos are matched by a
+    unique title. A now_playing op that isn't a freshly queued video is
+    matched to the room's most recent skip/video_ended (within 5 s), which
+    is approximate when several land in the same room at once.
+    """
+    def __init__(self):
+        self.sent = dict.fromkeys(EVENTS, 0)
+        self.delivered = 0
+        self.throttled = 0
+        self.latencies = {'message': [], 'queue': [], 'advance': [], 'request_sync': []}
+        self.queued = {}  # title -> send time
+        self.advanced = {}  # room -> send time of the latest skip/video_ended
+    
+    def attach(self, client):
+        client.current = None
+        client.sync_sent = None
+        client.on('message', lambda data, at: self.on_message(data, at))
+        client.on('messages', lambda data, at: [self.on_message(message, at) for message in data['messages']])
+        client.on('chat_throttled', lambda data, at: self.on_throttled())
+        client.on('room_op', lambda op, at: self.on_op(client, op, at))
+        client.on('room_ops', lambda data, at: [self.on_op(client, op, at) for op in data['ops']])
+        client.on('sync_state', lambda state, at: setattr(client, 'current', state.get('current_video')))
+        client.on('sync_time', lambda data, at: self.on_sync_time(client, at))
+    
+    def on_message(self, data, at):
+        self.delivered += 1
+        if isinstance(data, dict) and 'sent' in data:
+            self.latencies['message'].append(at - data['sent'])
+    
+    def on_throttled(self):
+        self.throttled += 1
+    
+    def on_op(self, client, op, at):
+        self.delivered += 1
+        if op['op'] in ('append', 'prepend'):
+            for video in op['videos']:
+                if video['title'] in self.queued:
+                    self.latencies['queue'].append(at - self.queued[video['title']])
+        elif op['op'] == 'now_playing':
+            client.current = op['video']
+            video = op['video'] or {}
+            if not op['from_queue'] and video.get('title') in self.queued:
+                self.latencies['queue'].append(at - self.queued[video['title']])
+            elif client.room in self.advanced and at - self.advanced[client.room] < 5:
+                self.latencies['advance'].append(at - self.advanced[client.room])
+    
+    def on_sync_time(self, client, at):
+        if client.sync_sent is not None:
+            self.latencies['request_sync'].append(at - client.sync_sent)
+            client.sync_sent = None
+    
+    async def send(self, client, event, videos):
+        data = {'room': client.room}
+        if event == 'join':
+            data.update(username=client.username, since_version=None)
+        elif event == 'add_to_queue':
+            title = f'load-{uuid.uuid4().hex[:12]}'
+            self.queued[title] = time.time()
+            data.update(video_id=random.choice(videos), title=title)
+        elif event == 'send_message':
+            data.update(user=client.username, text='load test message', sent=time.time())
+        elif event == 'request_sync':
+            client.sync_sent = time.time()
+        elif event in ('skip', 'video_ended'):
+            if event == 'video_ended':
+                if client.current is None:
+                    return
+                data.update(video_id=client.current['id'], start_time=client.current.get('start_time'))
+            self.advanced[client.room] = time.time()
+        self.sent[event] += 1
+        await client.emit(event, data)
+
+
+async def drive(client, tracker, rates, videos, until):
+    # Each client fires its events as independent Poisson processes
+    total = sum(rates.values())
+    if not total:
+        return
+    events, weights = zip(*rates.items())
+    while True:
+        delay = random.expovariate(total)
+        if time.time() + delay >= until:
+            return
+        await asyncio.sleep(delay)
+        await tracker.send(client, random.choices(events, weights)[0], videos)
+
+
+async def run(args):
+    videos = video_pool(VIDEO_POOL)
+    server = None
+    cache_dir = tempfile.TemporaryDirectory()
+    if args.url:
+        url, pid = args.url, args.server_pid
+    else:
+        port = free_port()
+        url = f'http://127.0.0.1:{port}'
+        cache_path = os.path.join(cache_dir.name, 'video_cache.db')
+        seed_video_cache(cache_path, videos, args.video_duration)
+        env = dict(os.environ, SYNCROOM_ASYNC_MODE=args.mode, SYNCROOM_VIDEO_CACHE=cache_path, SYNCROOM_SNAPSHOT='',
+                   PORT=str(port))
+        server = subprocess.Popen(server_command(args.mode, port, args.threads), cwd=ROOT, env=env)
+    
+    tracker = Tracker()
+    clients = []
+    try:
+        wait_until_up(url)
+        if server is not None:
+            pid = worker_pid(server.pid)
+        baseline = process_stats(pid) if pid else {}
+        
+        codecs = ['json', 'msgpack'] if args.codec == 'mixed' else [args.codec]
+        clients, failed = await connect_clients(
+            url, args.clients, 0, lambda index: f'load-{index % args.rooms}', args.batch, args.timeout,
+            lambda index: codecs[index % len(codecs)]
+        )
+        for index, client in enumerate(clients):
+            client.username = f'viewer{index}'
+            tracker.attach(client)
+        loaded = process_stats(pid) if pid else {}
+        
+        cpu_start, client_cpu_start, started = cpu_seconds(pid) if pid else None, time.process_time(), time.time()
+        until = started + args.duration
+        await asyncio.gather(*(drive(client, tracker, args.rates, videos, until) for client in clients))
+        load_elapsed = time.time() - started
+        await asyncio.sleep(args.drain)  # let in-flight broadcasts land
+        elapsed = time.time() - started
+        cpu_end = cpu_seconds(pid) if pid else None
+        client_cpu = time.process_time() - client_cpu_start
+    finally:
+        await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+        if server is not None:
+            server.terminate()
+            server.wait()
+        cache_dir.cleanup()
+    
+    result = {
+        'mode': args.mode if server is not None else None,
+        'clients': len(clients),
+        'failed_connections': failed,
+        'rooms': args.rooms,
+        'duration_s': round(load_elapsed, 2),
+        'sent': tracker.sent,
+        'sent_per_s': round(sum(tracker.sent.values()) / load_elapsed, 1),
+        'chat_throttled': tracker.throttled,
+        'delivered_per_s': round(tracker.delivered / elapsed, 1),
+        'latency_ms': {
+            kind: {
+                'count': len(values),
+                **{f'p{pct}': round(percentile(values, pct) * 1000, 1) for pct in (50, 95, 99) if values}
+            }
+            for kind, values in tracker.latencies.items()
+        },
+        'client_cpu_pct': round(100 * client_cpu / elapsed, 1),
+        'bytes_per_event': {},
+    }
+    for codec in ('json', 'msgpack'):
+        received = [client for client in clients if client.codec == codec]
+        events = sum(client.received for client in received)
+        if events:
+            result['bytes_per_event'][codec] = round(sum(client.bytes_received for client in received) / events, 1)
+    if 'rss_mb' in loaded and 'rss_mb' in baseline and clients:
+        result['server_rss_mb'] = round(loaded['rss_mb'], 1)
+        result['kb_per_connection'] = round((loaded['rss_mb'] - baseline['rss_mb']) * 1024 / len(clients), 1)
+        result['server_threads'] = loaded.get('threads')
+    if cpu_end is not None and cpu_start is not None:
+        result['server_cpu_pct'] = round(100 * (cpu_end - cpu_start) / elapsed, 1)
+    return result
+
+
+def report(result):
+    print(f"clients={result['clients']} (failed {result['failed_connections']}) rooms={result['rooms']} "
+          f"duration={result['duration_s']}s mode={result['mode']}")
+    print('sent: ' + ', '.join(f'{event}={count}' for event, count in result['sent'].items())
+          + f" (chat throttled {result['chat_throttled']})")
+    print(f"throughput: {result['sent_per_s']} events/s in, {result['delivered_per_s']} events/s delivered")
+    print(f"{'latency':>13} {'count':>7} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8}")
+    for kind, stats in result['latency_ms'].items():
+        print(f"{kind:>13} {stats['count']:>7} {stats.get('p50', '-'):>8} {stats.get('p95', '-'):>8} "
+              f"{stats.get('p99', '-'):>8}")
+    if result['bytes_per_event']:
+        print('bytes/event received: ' + ', '.join(f'{codec}={size}' for codec, size in result['bytes_per_event'].items()))
+    if 'kb_per_connection' in result:
+        print(f"server: {result['server_rss_mb']} MB RSS, {result['kb_per_connection']} KB/connection, "
+              f"{result['server_threads']} threads")
+    if 'server_cpu_pct' in result:
+        print(f"cpu: server {result['server_cpu_pct']}%, load generator {result['client_cpu_pct']}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--rooms', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=20, help='seconds of load after everyone joined')
+    parser.add_argument('--rates', type=parse_rates, default=parse_rates(DEFAULT_RATES),
+                        help=f'events per second per client (default {DEFAULT_RATES})')
+    parser.add_argument('--mode', choices=['threading', 'eventlet', 'gevent'], default='eventlet')
+    parser.add_argument('--codec', choices=['json', 'msgpack', 'mixed'], default='json',
+                        help='wire encoding the clients speak; mixed alternates them')
+    parser.add_argument('--threads', type=int, default=1000, help='gunicorn --threads in threading mode')
+    parser.add_argument('--url', help='load an already running server instead of starting one')
+    parser.add_argument('--server-pid', type=int, help='PID of the --url server, for memory and CPU figures')
+    parser.add_argument('--video-duration', type=int, default=600, help='duration seeded for every test video')
+    parser.add_argument('--batch', type=int, default=100, help='clients connected at a time')
+    parser.add_argument('--timeout', type=float, default=15)
+    parser.add_argument('--drain', type=float, default=2, help='seconds to wait for broadcasts after the run')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--max-p95-ms', type=float, help='exit non-zero if any fan-out p95 is above this')
+    args = parser.parse_args()
+    
+    result = asyncio.run(run(args))
+    report(result)
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump(result, out, indent=2)
+    if args.max_p95_ms is not None:
+        slow = [kind for kind, stats in result['latency_ms'].items() if stats.get('p95', 0) > args.max_p95_ms]
+        if slow:
+            print(f"FAIL: p95 over {args.max_p95_ms} ms for {', '.join(slow)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
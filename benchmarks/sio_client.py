@@ -0,0 +1,132 @@
+"""Lightweight asyncio Socket.IO client for load tests.
+
+Speaks just enough Engine.IO v4 / Socket.IO v5 over a WebSocket to connect to
+the default namespace, emit events and receive them, so one process can hold
+thousands of connections. Needs the `websockets` package, and `msgpack` for
+codec='msgpack' clients.
+"""
+import asyncio
+import json
+import os
+import time
+
+import websockets
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+CONNECT, EVENT, CONNECT_ERROR = 0, 2, 4
+
+
+class LoadClient:
+    """codec is the Socket.IO encoding to speak: 'json' text frames or 'msgpack' binary ones"""
+    def __init__(self, base_url, codec='json'):
+        self.url = base_url.replace('http', 'ws', 1).rstrip('/') + '/socket.io/?EIO=4&transport=websocket'
+        self.codec = codec
+        self.handlers = {}  # event -> handler(data, received_at)
+        self.received = 0
+        self.bytes_received = 0  # Socket.IO event frames only
+        self._ws = None
+        self._reader = None
+    
+    def on(self, event, handler):
+        self.handlers[event] = handler
+    
+    async def connect(self, timeout=10):
+        self._ws = await websockets.connect(
+            self.url, open_timeout=timeout, ping_interval=None, compression=None, max_size=None
+        )
+        opening = await asyncio.wait_for(self._ws.recv(), timeout)
+        if not opening.startswith('0'):
+            raise ConnectionError(f'Unexpected Engine.IO open packet: {opening[:40]!r}')
+        await self._ws.send(self._encode(CONNECT))
+        while True:
+            packet = self._decode(await asyncio.wait_for(self._ws.recv(), timeout))
+            if packet is None:
+                continue
+            if packet[0] == CONNECT:
+                break
+            if packet[0] == CONNECT_ERROR:
+                raise ConnectionError(f'Namespace connect refused: {packet[1]}')
+        self._reader = asyncio.create_task(self._read())
+    
+    async def emit(self, event, data):
+        await self._ws.send(self._encode(EVENT, [event, data]))
+    
+    def _encode(self, packet_type, data=None):
+        if self.codec == 'msgpack':
+            packet = {'type': packet_type, 'nsp': '/'}
+            if data is not None:
+                packet['data'] = data
+            return msgpack.dumps(packet)
+        return f'4{packet_type}' + ('' if data is None else json.dumps(data))
+    
+    def _decode(self, frame):
+        # (Socket.IO packet type, data) of an Engine.IO message, None for other Engine.IO packets
+        if isinstance(frame, bytes):
+            packet = msgpack.loads(frame)
+            return packet['type'], packet.get('data')
+        if frame.startswith('4'):
+            body = frame[2:]
+            return int(frame[1]), json.loads(body) if body else None
+        return None
+    
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._ws is not None:
+            await self._ws.close()
+    
+    async def _read(self):
+        try:
+            async for frame in self._ws:
+                if frame == '2':
+                    await self._ws.send('3')
+                    continue
+                received_at = time.time()
+                packet = self._decode(frame)
+                if packet is None or packet[0] != EVENT:
+                    continue
+                self.received += 1
+                self.bytes_received += len(frame) if isinstance(frame, bytes) else len(frame.encode())
+                event, *args = packet[1]
+                handler = self.handlers.get(event)
+                if handler is not None:
+                    handler(args[0] if args else None, received_at)
+        except websockets.ConnectionClosed:
+            pass
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def process_stats(pid):
+    """Resident memory (MB) and thread count of a process, from /proc"""
+    stats = {}
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    stats['rss_mb'] = int(line.split()[1]) / 1024
+                elif line.startswith('Threads:'):
+                    stats['threads'] = int(line.split()[1])
+    except OSError:
+        pass
+    return stats
+
+
+def cpu_seconds(pid):
+    """User + system CPU time a process has used so far"""
+    try:
+        with open(f'/proc/{pid}/stat') as stat:
+            fields = stat.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
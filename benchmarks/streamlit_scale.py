@@ -0,0 +1,166 @@
+"""RoomManager at scale, and where a Streamlit rerun spends its time.
+
+Drives the shared RoomManager headlessly (--rooms rooms, one of them with a
+--queue item queue and a chat buffer filled past capacity) and reports the
+cost of each operation. Then runs streamlit_app.py through Streamlit's
+AppTest as a viewer of that big room, --reruns times, and prints the
+per-section timings the script logs through section_timer. --profile adds a
+cProfile of the reruns.
+
+    python benchmarks/streamlit_scale.py --rooms 10000 --queue 1000
+    python benchmarks/streamlit_scale.py --rooms 1000 --reruns 5 --profile
+"""
+import argparse
+import cProfile
+import logging
+import os
+import pstats
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ['SYNCROOM_VIDEO_CACHE'] = ''  # keep the benchmark's metadata in memory
+os.environ.pop('SYNCROOM_CHAT_SPILL_DIR', None)
+os.environ['SYNCROOM_STREAMLIT_SNAPSHOT'] = ''
+
+import section_timer  # noqa: E402
+from room_manager import CHAT_HISTORY_SIZE, get_room_manager  # noqa: E402
+from video_info import get_video_cache  # noqa: E402
+
+BIG_ROOM = 'bench-big'
+
+
+def timed(results, name, count, func):
+    started = time.perf_counter()
+    for i in range(count):
+        func(i)
+    elapsed = time.perf_counter() - started
+    results.append((name, count, elapsed))
+
+
+def seed_videos(count):
+    rng = random.Random(7)
+    alphabet = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_'
+    video_ids = [''.join(rng.choice(alphabet) for _ in range(11)) for _ in range(count)]
+    cache = get_video_cache()
+    for video_id in video_ids:
+        cache.set(video_id, {'title': f'Benchmark video {video_id}', 'thumbnail': '', 'author': 'bench', 'duration': 3600})
+    return video_ids
+
+
+def bench_manager(manager, args):
+    results = []
+    video_ids = seed_videos(max(args.queue, 100))
+    rooms = [f'bench-{i}' for i in range(args.rooms - 1)] + [BIG_ROOM]
+    
+    timed(results, 'get_room (create)', len(rooms), lambda i: manager.get_room(rooms[i]))
+    timed(results, 'add_user', len(rooms), lambda i: manager.add_user(rooms[i], f'user{i}'))
+    timed(results, 'get_room (existing)', len(rooms), lambda i: manager.get_room(rooms[i]))
+    timed(results, 'list_rooms', 100, lambda i: manager.list_rooms())
+    timed(results, 'cleanup_inactive_rooms', 100, lambda i: manager.cleanup_inactive_rooms())
+    
+    timed(results, f'add_video (to {args.queue})', args.queue,
+          lambda i: manager.add_video(BIG_ROOM, video_ids[i % len(video_ids)], 'bench'))
+    queue = manager.get_room(BIG_ROOM)['queue']
+    # The first video plays rather than queues, so a --queue of 1 leaves nothing to move
+    if queue:
+        timed(results, 'move_in_queue', 200,
+              lambda i: manager.move_in_queue(BIG_ROOM, queue[random.randrange(len(queue))]['entry_id'],
+                                              random.randrange(len(queue))))
+        # Each call removes one, so never more than are queued
+        timed(results, 'remove_from_queue', min(100, len(queue)),
+              lambda i: manager.remove_from_queue(BIG_ROOM, queue[random.randrange(len(queue))]['entry_id']))
+    timed(results, 'skip', 100, lambda i: manager.skip(BIG_ROOM, 'bench'))
+    timed(results, 'add_video (refill)', 200,
+          lambda i: manager.add_video(BIG_ROOM, video_ids[i % len(video_ids)], 'bench'))
+    
+    timed(results, f'add_msg (x2 capacity {CHAT_HISTORY_SIZE})', 2 * CHAT_HISTORY_SIZE,
+          lambda i: manager.add_msg(BIG_ROOM, f'user{i % 50}', f'message {i}'))
+    last_id = manager.get_room(BIG_ROOM)['chat'].last_id
+    timed(results, 'get_messages_since (latest)', 1000, lambda i: manager.get_messages_since(BIG_ROOM, last_id))
+    timed(results, 'get_messages_since (full)', 1000, lambda i: manager.get_messages_since(BIG_ROOM, 0))
+    timed(results, 'get_version', 10000, lambda i: manager.get_version(rooms[i % len(rooms)]))
+    # First call renders, the rest are what every other viewer of the room pays
+    timed(results, 'chat_html (shared)', 1000, lambda i: manager.chat_html(BIG_ROOM, 25))
+    timed(results, 'queue_html (shared)', 1000, lambda i: manager.queue_html(BIG_ROOM))
+    timed(results, 'queue_html (after a change)', 100,
+          lambda i: (manager.toggle_auto_skip(BIG_ROOM), manager.queue_html(BIG_ROOM)))
+    
+    print(f'RoomManager: {args.rooms} rooms, {len(queue)} queued in {BIG_ROOM}, '
+          f'{len(manager.get_room(BIG_ROOM)["chat"])} chat messages kept')
+    print(f"{'operation':<36} {'count':>7} {'total_ms':>10} {'per_op_us':>10}")
+    for name, count, elapsed in results:
+        print(f'{name:<36} {count:>7} {elapsed * 1000:>10.1f} {elapsed / count * 1e6:>10.1f}')
+
+
+class TimingCapture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.runs = []
+    
+    def emit(self, record):
+        timings = getattr(record, 'timings', None)
+        if timings is not None:
+            self.runs.append(timings)
+
+
+def bench_reruns(manager, args):
+    from streamlit.testing.v1 import AppTest
+    
+    section_timer.TIMING_RATE = 1
+    capture = TimingCapture()
+    section_timer.logger.addHandler(capture)
+    section_timer.logger.setLevel(logging.INFO)
+    
+    success, username = manager.add_user(BIG_ROOM, 'viewer')
+    app = AppTest.from_file(os.path.join(ROOT, 'streamlit_app.py'), default_timeout=120)
+    app.session_state['username'] = username
+    app.session_state['current_room'] = BIG_ROOM
+    app.session_state['joined'] = True
+    app.run()  # warm-up: imports, first render
+    capture.runs.clear()
+    
+    profiler = cProfile.Profile() if args.profile else None
+    for _ in range(args.reruns):
+        manager.add_msg(BIG_ROOM, 'someone', 'new message between reruns')
+        if profiler:
+            profiler.enable()
+        app.run()
+        if profiler:
+            profiler.disable()
+    if app.exception:
+        print('Script raised:', app.exception)
+    
+    sections = {}
+    for run in capture.runs:
+        for name, seconds in run.items():
+            sections.setdefault(name, []).append(seconds)
+    print(f'\nStreamlit rerun as a viewer of {BIG_ROOM} ({len(capture.runs)} timed runs):')
+    print(f"{'section':<12} {'mean_ms':>9} {'max_ms':>9}")
+    for name, values in sections.items():
+        print(f'{name:<12} {sum(values) / len(values) * 1000:>9.1f} {max(values) * 1000:>9.1f}')
+    
+    if profiler:
+        print()
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(args.profile_lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rooms', type=int, default=10000)
+    parser.add_argument('--queue', type=int, default=1000)
+    parser.add_argument('--reruns', type=int, default=10)
+    parser.add_argument('--profile', action='store_true', help='cProfile the reruns')
+    parser.add_argument('--profile-lines', type=int, default=30)
+    args = parser.parse_args()
+    
+    manager = get_room_manager()
+    bench_manager(manager, args)
+    if args.reruns:
+        bench_reruns(manager, args)
+
+
+if __name__ == '__main__':
+    main()
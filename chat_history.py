@@ -0,0 +1,108 @@
+"""Per-room chat history: a fixed-size ring buffer with optional on-disk scrollback"""
+import json
+import threading
+
+
+class ChatHistory:
+    """Fixed-capacity ring buffer of chat messages with monotonically increasing IDs.
+
+    The newest `capacity` messages stay in memory. If `spill_path` is set,
+    messages pushed out of the buffer are appended to that file (one JSON
+    object per line) so older scrollback can still be read back.
+    """
+    def __init__(self, capacity=100, spill_path=None):
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self._buffer = [None] * capacity
+        self._next_id = 1
+        self._oldest_id = 1  # a restored history may hold fewer messages than fit
+        self._lock = threading.Lock()
+    
+    @property
+    def last_id(self):
+        """ID of the newest message, or 0 if nothing has been posted yet"""
+        return self._next_id - 1
+    
+    @property
+    def first_id(self):
+        """ID of the oldest message still held in memory"""
+        return max(self._oldest_id, self._next_id - self.capacity)
+    
+    def append(self, message):
+        with self._lock:
+            message = dict(message, id=self._next_id)
+            slot = (self._next_id - 1) % self.capacity
+            evicted = self._buffer[slot]
+            self._buffer[slot] = message
+            self._next_id += 1
+            if evicted is not None and self.spill_path:
+                self._spill(evicted)
+        return message
+    
+    def since(self, last_id, limit=None):
+        """Messages newer than last_id, oldest first (at most `limit`, keeping the newest)"""
+        with self._lock:
+            start = max(last_id + 1, self.first_id)
+            if limit is not None:
+                start = max(start, self._next_id - limit)
+            return [self._buffer[(i - 1) % self.capacity] for i in range(start, self._next_id)]
+    
+    def latest(self, count):
+        return self.since(0, limit=count)
+    
+    def before(self, before_id, limit=50):
+        """Up to `limit` messages older than before_id, reading spilled scrollback from disk if needed"""
+        with self._lock:
+            first_id = self.first_id
+            in_memory = [
+                self._buffer[(i - 1) % self.capacity]
+                for i in range(max(first_id, before_id - limit), min(before_id, self._next_id))
+            ]
+        
+        missing = limit - len(in_memory)
+        if missing <= 0 or not self.spill_path or min(before_id, first_id) <= 1:
+            return in_memory
+        
+        older = []
+        try:
+            with open(self.spill_path, encoding='utf-8') as f:
+                for line in f:
+                    message = json.loads(line)
+                    if message['id'] < min(before_id, first_id):
+                        older.append(message)
+                        if len(older) > missing:
+                            older.pop(0)
+        except (OSError, ValueError):
+            pass
+        return older + in_memory
+    
+    def snapshot(self):
+        """The messages held in memory and the next ID, as JSON-ready data"""
+        with self._lock:
+            messages = [self._buffer[(i - 1) % self.capacity] for i in range(self.first_id, self._next_id)]
+            return {'next_id': self._next_id, 'messages': messages}
+    
+    @classmethod
+    def restore(cls, snapshot, capacity=100, spill_path=None):
+        """Rebuild a history from snapshot(), carrying on its message IDs"""
+        history = cls(capacity, spill_path)
+        messages = snapshot['messages'][-capacity:]
+        for message in messages:
+            history._buffer[(message['id'] - 1) % capacity] = message
+        history._next_id = snapshot['next_id']
+        history._oldest_id = messages[0]['id'] if messages else snapshot['next_id']
+        return history
+    
+    def _spill(self, message):
+        try:
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(message) + '\n')
+        except OSError:
+            # Scrollback is best effort; never let it break posting a message
+            pass
+    
+    def __len__(self):
+        return self._next_id - self.first_id
+    
+    def __iter__(self):
+        return iter(self.since(0))
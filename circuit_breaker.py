@@ -0,0 +1,55 @@
+"""Fail-fast guard for remote endpoints that may be slow or down"""
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Stops calling an endpoint after `failures` consecutive failures.
+
+    While closed every call is allowed. Once open, allow() refuses calls for
+    `reset_timeout` seconds, then lets a single trial call through (half-open):
+    its success closes the breaker, its failure opens it again. A failures
+    threshold of 0 disables the breaker.
+    """
+    def __init__(self, failures=5, reset_timeout=30):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+    
+    def allow(self):
+        """Whether to make the call now; every allowed call must end in record_success or record_failure"""
+        if not self.failures:
+            return True
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = HALF_OPEN
+                self._trial_running = False
+            if self.state == HALF_OPEN:
+                if self._trial_running:
+                    return False
+                self._trial_running = True
+            return True
+    
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self.state = CLOSED
+    
+    def record_failure(self):
+        if not self.failures:
+            return
+        with self._lock:
+            self._consecutive += 1
+            if self.state == HALF_OPEN or self._consecutive >= self.failures:
+                self.state = OPEN
+                self._opened_at = time.monotonic()
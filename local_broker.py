@@ -0,0 +1,92 @@
+"""Stand-in message broker for running several app.py workers on one machine.
+
+Run `python local_broker.py [port]` and start each worker with
+SYNCROOM_MESSAGE_QUEUE=tcp://127.0.0.1:<port>. Every line a worker sends is
+forwarded to every connected worker, which is all Socket.IO's pub/sub fan-out
+needs. Production should point SYNCROOM_MESSAGE_QUEUE at Redis instead.
+"""
+import socket
+import socketserver
+import sys
+import threading
+from urllib.parse import urlparse
+
+from socketio import PubSubManager
+
+DEFAULT_PORT = 5600
+
+
+class LocalBrokerManager(PubSubManager):
+    """Socket.IO client manager that publishes through a local_broker.py process.
+
+    One connection both publishes and receives; the broker never echoes a
+    line back to the connection that sent it.
+    """
+    name = 'local-broker'
+    
+    def __init__(self, url=f'tcp://127.0.0.1:{DEFAULT_PORT}', channel='socketio', write_only=False,
+                 logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or '127.0.0.1', parsed.port or DEFAULT_PORT)
+        self._conn = None
+        self._conn_lock = threading.Lock()
+    
+    def _connection(self):
+        with self._conn_lock:
+            if self._conn is None:
+                self._conn = socket.create_connection(self.address)
+            return self._conn
+    
+    def _publish(self, data):
+        line = self.json.dumps({'channel': self.channel, 'data': data}).encode() + b'\n'
+        conn = self._connection()
+        with self._conn_lock:
+            conn.sendall(line)
+    
+    def _listen(self):
+        for line in self._connection().makefile('rb'):
+            try:
+                message = self.json.loads(line)
+            except ValueError:
+                continue
+            if message.get('channel') == self.channel:
+                yield message['data']
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        with self.server.lock:
+            self.server.clients.add(self.wfile)
+        try:
+            for line in self.rfile:
+                with self.server.lock:
+                    clients = list(self.server.clients)
+                for client in clients:
+                    if client is self.wfile:
+                        continue
+                    try:
+                        client.write(line)
+                        client.flush()
+                    except OSError:
+                        pass
+        finally:
+            with self.server.lock:
+                self.server.clients.discard(self.wfile)
+
+
+class Broker(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    
+    def __init__(self, address):
+        super().__init__(address, _BrokerHandler)
+        self.clients = set()
+        self.lock = threading.Lock()
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    with Broker(('127.0.0.1', port)) as broker:
+        print(f'Broker listening on tcp://127.0.0.1:{port}')
+        broker.serve_forever()
@@ -0,0 +1,265 @@
+"""Counters, gauges and histograms for the hot paths, served in Prometheus' text format.
+
+Recording is a lock and an add, so metrics stay on whether or not anything
+scrapes them. Gauges that are cheap to compute from live state (rooms,
+sockets) use set_function() and are only evaluated when /metrics is read.
+
+app.py serves them on its own /metrics route. The Streamlit process has no
+routes of its own, so SYNCROOM_METRICS_PORT starts a small HTTP server for
+them instead (see start_http_server).
+"""
+import bisect
+import threading
+import time
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds: from a dict update to a slow YouTube request
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Sockets a broadcast was delivered to
+FANOUT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _label_text(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Value:
+    __slots__ = ('value', '_lock')
+    
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+    
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+    
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+    
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramValue:
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+    
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0
+        self._lock = threading.Lock()
+    
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+    
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    """Observes the seconds spent inside a with block, exceptions included"""
+    __slots__ = ('_child', '_start')
+    
+    def __init__(self, child):
+        self._child = child
+    
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class Metric:
+    """A named metric with one child per combination of label values.
+
+    labels(*values) returns (and keeps) the child for those values; an
+    unlabelled metric is used directly, e.g. `ROOMS_CREATED.inc()`.
+    """
+    type = 'untyped'
+    
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        self._function = None
+        (REGISTRY if registry is None else registry).register(self)
+    
+    def _new_child(self):
+        return _Value()
+    
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f'{self.name} takes labels {self.labelnames}, got {values}')
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+    
+    def samples(self):
+        """(suffix, label values, extra label, value) for every series, in render order"""
+        if self._function is not None:
+            result = self._function()
+            if not isinstance(result, dict):
+                result = {(): result}
+            for values, value in result.items():
+                yield '', values if isinstance(values, tuple) else (values,), '', value
+            return
+        for values, child in list(self._children.items()):
+            yield '', values, '', child.value
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for suffix, values, extra, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_label_text(self.labelnames, values, extra)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """Only ever goes up; Prometheus' rate() turns it into a per-second figure"""
+    type = 'counter'
+    
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    """A value that goes up and down, set directly or computed when scraped"""
+    type = 'gauge'
+    
+    def set(self, value):
+        self.labels().set(value)
+    
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+    
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+    
+    def set_function(self, function):
+        """Compute the gauge at scrape time instead of tracking it.
+
+        function() returns a number, or for a labelled gauge a dict of
+        {label value (or tuple of them): number}.
+        """
+        self._function = function
+
+
+class Histogram(Metric):
+    """Counts observations into cumulative buckets, with their sum and count"""
+    type = 'histogram'
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+    
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+    
+    def observe(self, value):
+        self.labels().observe(value)
+    
+    def time(self):
+        return self.labels().time()
+    
+    def samples(self):
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield '_bucket', values, f'le="{_format_value(float(bound))}"', cumulative
+            yield '_sum', values, '', total
+            yield '_count', values, '', cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+    
+    def register(self, metric):
+        # A re-imported module (Streamlit reloads edited modules) replaces its old metrics
+        with self._lock:
+            self._metrics[metric.name] = metric
+    
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def render():
+    """Every registered metric in Prometheus' text exposition format"""
+    return REGISTRY.render()
+
+
+def timed(histogram, *labels):
+    """Decorator that observes each call's run time in histogram.labels(*labels)"""
+    child = histogram.labels(*labels)
+    
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, addr='0.0.0.0'):
+    """Serve /metrics on a daemon thread; returns the server"""
+    server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
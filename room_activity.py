@@ -0,0 +1,94 @@
+"""Index of rooms by last activity time"""
+import heapq
+import threading
+import time
+
+
+class ActivityIndex:
+    """Last-active time per room, backed by a min-heap so idle rooms can be found without a full scan.
+
+    Touching a room is O(log n): the new time is pushed and the old heap
+    entry is left behind and skipped lazily (the heap is rebuilt when stale
+    entries outnumber live ones, so memory stays bounded). Popping the k
+    rooms idle for longer than a threshold is O(k log n). The sorted room
+    list is cached and only rebuilt when rooms come or go.
+    """
+    def __init__(self):
+        self._last_active = {}  # room -> last active time
+        self._heap = []  # (last active time, room), possibly stale
+        self._sorted = None
+        self._lock = threading.Lock()
+    
+    def touch(self, room, when=None):
+        when = time.time() if when is None else when
+        with self._lock:
+            if room not in self._last_active:
+                self._sorted = None
+            self._last_active[room] = when
+            heapq.heappush(self._heap, (when, room))
+            if len(self._heap) > 2 * len(self._last_active) + 64:
+                self._compact()
+    
+    def remove(self, room):
+        with self._lock:
+            if self._last_active.pop(room, None) is not None:
+                self._sorted = None
+    
+    def pop_idle(self, max_idle, now=None):
+        """Remove and return every room idle for longer than max_idle seconds, oldest first"""
+        cutoff = (time.time() if now is None else now) - max_idle
+        idle = []
+        with self._lock:
+            while self._heap and self._heap[0][0] < cutoff:
+                when, room = heapq.heappop(self._heap)
+                if self._last_active.get(room) == when:
+                    del self._last_active[room]
+                    idle.append(room)
+            if idle:
+                self._sorted = None
+        return idle
+    
+    def oldest(self):
+        """Earliest last-active time of any room, or None if the index is empty"""
+        with self._lock:
+            while self._heap and self._last_active.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+    
+    def sorted_rooms(self):
+        with self._lock:
+            if self._sorted is None:
+                self._sorted = sorted(self._last_active)
+            return list(self._sorted)
+    
+    def active_rooms(self, max_idle, now=None):
+        """Sorted rooms active within the last max_idle seconds, leaving idle ones in the index"""
+        cutoff = (time.time() if now is None else now) - max_idle
+        oldest = self.oldest()
+        rooms = self.sorted_rooms()
+        if oldest is None or oldest >= cutoff:
+            # The usual case: the eviction timer has already dealt with idle rooms
+            return rooms
+        return [room for room in rooms if self._last_active.get(room, cutoff) >= cutoff]
+    
+    def _compact(self):
+        self._heap = [(when, room) for room, when in self._last_active.items()]
+        heapq.heapify(self._heap)
+    
+    def get(self, room, default=None):
+        return self._last_active.get(room, default)
+    
+    def __getitem__(self, room):
+        return self._last_active[room]
+    
+    def __setitem__(self, room, when):
+        self.touch(room, when)
+    
+    def __delitem__(self, room):
+        self.remove(room)
+    
+    def __contains__(self, room):
+        return room in self._last_active
+    
+    def __len__(self):
+        return len(self._last_active)
@@ -0,0 +1,33 @@
+"""HTML for the Streamlit chat and queue panels, rendered once per room and shared by every viewer.
+
+Everything taken from users (names, messages, video titles) is escaped.
+"""
+from html import escape
+
+
+def chat_message_html(msg):
+    """(html, own_html): the message as everyone sees it, and as its sender sees it"""
+    user, sent, text = escape(msg['user']), escape(msg['time']), escape(msg['text'])
+    if msg['user'] == "System":
+        html = f"<div class='system-message chat-message'><small>[{sent}]</small><br>{text}</div>"
+        return html, html
+    return (
+        f"<div class='user-message chat-message'>"
+        f"<strong>{user}</strong> <small>[{sent}]</small><br>{text}</div>",
+        # Highlight the current user's messages
+        f"<div class='user-message chat-message' style='border-left-color: #00ff88;'>"
+        f"<strong>👉 {user}</strong> <small>[{sent}]</small><br>{text}</div>"
+    )
+
+
+def queue_entry_html(position, song):
+    title = song['title'][:40] + ('...' if len(song['title']) > 40 else '')
+    added_by = escape(str(song.get('added_by', 'Unknown')))
+    if song.get('duration', 0) > 0:
+        detail = f"⏱️ {song['duration'] // 60}:{song['duration'] % 60:02d} • by {added_by}"
+    elif song.get('pending'):
+        detail = f"⏳ Fetching details... • by {added_by}"
+    else:
+        detail = f"by {added_by}"
+    return (f"<div><strong>{position}.</strong> {escape(title)}<br>"
+            f"<small style='color: #888;'>{detail}</small></div>")
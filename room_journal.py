@@ -0,0 +1,119 @@
+"""Append-only journal of room states, so rooms survive a restart.
+
+Every snapshot interval the rooms that changed since the last one are
+re-encoded (each under its own lock, so a snapshot never stops the world)
+and appended as one line per room. Restoring reads the file once, keeping
+the last line per room. When superseded lines outnumber live ones the
+journal is compacted: the live lines are rewritten to a temporary file that
+replaces the journal atomically.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+
+# Compact once the file holds this many times more lines than there are rooms
+COMPACT_RATIO = 4
+COMPACT_MIN_LINES = 1000
+
+
+class RoomJournal:
+    """One JSON object per line: {"room": name, "state": {...}}, or "state": null for a room that was removed"""
+    def __init__(self, path):
+        self.path = path
+        self._live = {}  # room -> its latest line
+        self._lines = 0
+        self._file = None
+        self._damaged = False  # a torn last line must not get the next append glued onto it
+        self._lock = threading.Lock()
+    
+    def load(self):
+        """Latest saved state of every room, as decoded JSON"""
+        self._live = {}
+        self._lines = 0
+        states = {}
+        try:
+            with open(self.path, encoding='utf-8') as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                        room = entry['room']
+                    except (ValueError, KeyError):
+                        self._damaged = True  # a line cut short by a crash
+                        continue
+                    self._lines += 1
+                    if entry.get('state') is None:
+                        self._live.pop(room, None)
+                        states.pop(room, None)
+                    else:
+                        self._live[room] = line
+                        states[room] = entry['state']
+        except FileNotFoundError:
+            pass
+        return states
+    
+    def record(self, changes):
+        """Append {room: encoded JSON state, or None if the room is gone}"""
+        if not changes:
+            return
+        with self._lock:
+            if self._damaged:
+                self._compact()
+                self._damaged = False
+            lines = []
+            for room, state in changes.items():
+                line = f'{{"room": {json.dumps(room)}, "state": {state if state is not None else "null"}}}\n'
+                lines.append(line)
+                if state is None:
+                    self._live.pop(room, None)
+                else:
+                    self._live[room] = line
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(''.join(lines))
+            self._file.flush()
+            self._lines += len(lines)
+            if self._lines > max(COMPACT_MIN_LINES, COMPACT_RATIO * len(self._live)):
+                self._compact()
+    
+    def _compact(self):
+        # Caller holds self._lock
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as compacted:
+            compacted.writelines(self._live.values())
+            compacted.flush()
+            os.fsync(compacted.fileno())
+        if self._file is not None:
+            self._file.close()
+        os.replace(temp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._lines = len(self._live)
+    
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def start_snapshots(journal, collect, interval, name="room-snapshots"):
+    """Every `interval` seconds, append collect()'s changed rooms to the journal.
+
+    collect() returns {room: encoded JSON state or None}. A last snapshot is
+    taken at interpreter exit.
+    """
+    def snapshot():
+        try:
+            journal.record(collect())
+        except Exception:
+            # Keep serving; the next interval tries again
+            pass
+    
+    def loop():
+        while True:
+            time.sleep(interval)
+            snapshot()
+    
+    threading.Thread(target=loop, name=name, daemon=True).start()
+    atexit.register(snapshot)
@@ -0,0 +1,662 @@
+"""Room state for the Streamlit front end, shared by every session in the process"""
+import time
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from functools import wraps
+from video_info import (
+    extract_video_id, extract_video_ids, failed_lookups, get_video_cache, placeholder_video_info,
+    timer_duration, video_resolver
+)
+from video_queue import VideoQueue
+from chat_history import ChatHistory
+from scheduler import RoomScheduler
+from room_activity import ActivityIndex
+from room_journal import RoomJournal, start_snapshots
+from room_html import chat_message_html, queue_entry_html
+from metrics import Counter, Gauge, Histogram, start_http_server, timed
+
+# Chat retention: messages kept in memory per room, plus an optional directory
+# where older messages are spilled so scrollback survives the ring buffer
+CHAT_HISTORY_SIZE = int(os.environ.get('SYNCROOM_CHAT_HISTORY', 100))
+CHAT_SPILL_DIR = os.environ.get('SYNCROOM_CHAT_SPILL_DIR', '')
+# Rooms idle this long are dropped from the list and evicted by the cleanup timer
+ROOM_IDLE_TIMEOUT = 7200  # 2 hours
+# Scheduler key for the eviction sweep; a tuple so it can't clash with a room name
+CLEANUP_TIMER = ('cleanup',)
+# Rooms are journaled here every SNAPSHOT_INTERVAL seconds and restored on
+# startup; an empty SYNCROOM_STREAMLIT_SNAPSHOT turns that off
+SNAPSHOT_PATH = os.environ.get('SYNCROOM_STREAMLIT_SNAPSHOT', 'streamlit_rooms.journal')
+SNAPSHOT_INTERVAL = float(os.environ.get('SYNCROOM_SNAPSHOT_INTERVAL', 1))
+# Streamlit serves no routes of our own, so metrics get their own port when this is set
+METRICS_PORT = int(os.environ.get('SYNCROOM_METRICS_PORT', 0) or 0)
+
+MANAGER_CALLS = Histogram('syncroom_room_manager_seconds', 'RoomManager method run time', ['method'])
+# result is 'skipped', or 'stale' when the video changed or was paused after the timer was set
+AUTO_SKIPS = Counter('syncroom_auto_skip_total', 'Auto-skip timer firings', ['result'])
+
+
+def with_room_lock(method):
+    """Run a RoomManager method holding the lock of the room it is given"""
+    @wraps(method)
+    def wrapper(self, room_name, *args, **kwargs):
+        with self.room_lock(room_name):
+            return method(self, room_name, *args, **kwargs)
+    return wrapper
+
+class RoomManager:
+    def __init__(self):
+        self.rooms = {}
+        self.users = {}  # Track active users by room
+        self.room_activity = ActivityIndex()  # Last activity time per room, oldest first
+        # Per-room change counters, plus a condition to wait on for each.
+        # state_versions ignores chat messages
+        self.room_versions = {}
+        self.state_versions = {}
+        self.room_changed = {}
+        # Per-room locks serializing changes from sessions, the auto-skip
+        # timer and metadata lookups, so rooms never wait on each other
+        self.room_locks = {}
+        # Rooms changed since the last snapshot
+        self.dirty_rooms = set()
+        self.dirty_lock = threading.Lock()
+        # Chat and queue HTML per room, shared by every session viewing it
+        self.render_cache = {}
+        # Cache for video metadata to avoid repeated API calls
+        self.video_cache = get_video_cache()
+        # Background pool that fills in metadata after a video is enqueued,
+        # shared with every other lookup in the process
+        self.video_resolver = video_resolver
+        # Lookups that failed are retried later; patch the entries when one works
+        failed_lookups.add_listener(self._refresh_video_info)
+        # Fires auto-skip at each room's computed end time, and evicts idle
+        # rooms, whether or not anyone is refreshing the page
+        self.scheduler = RoomScheduler(name="room-timers")
+    
+    def get_room(self, room_name):
+        if room_name not in self.rooms:
+            self._add_room(room_name, {
+                'current_video': None,  # {'id': '...', 'url': '...', 'title': '...', 'start_time': 12345, 'duration': 0}
+                'queue': VideoQueue(),
+                'chat': ChatHistory(CHAT_HISTORY_SIZE, self._chat_spill_path(room_name)),
+                'paused': False,
+                'pause_time': None,
+                'total_pause_duration': 0,
+                'room_creator': None,
+                'created_at': time.time(),
+                'last_video_change': 0,
+                'auto_skip_enabled': True,  # Auto-skip when video ends
+                'import_progress': None  # {'done': n, 'total': m} while a bulk import resolves
+            }, time.time())
+        return self.rooms[room_name]
+    
+    def _add_room(self, room_name, room, last_active):
+        self.rooms[room_name] = room
+        self.users[room_name] = set()
+        self.room_activity[room_name] = last_active
+        self.room_versions[room_name] = 0
+        self.state_versions[room_name] = 0
+        self.room_changed[room_name] = threading.Condition()
+        self._schedule_cleanup()
+    
+    def room_lock(self, room_name):
+        """The re-entrant lock guarding one room's state"""
+        lock = self.room_locks.get(room_name)
+        if lock is None:
+            lock = self.room_locks.setdefault(room_name, threading.RLock())
+        return lock
+    
+    def _chat_spill_path(self, room_name, fresh=True):
+        if not CHAT_SPILL_DIR:
+            return None
+        os.makedirs(CHAT_SPILL_DIR, exist_ok=True)
+        path = os.path.join(CHAT_SPILL_DIR, hashlib.sha1(room_name.encode()).hexdigest() + '.jsonl')
+        # A new room starts with fresh IDs, so drop scrollback left by an older one
+        if fresh and os.path.exists(path):
+            os.remove(path)
+        return path
+    
+    def _touch(self, room_name, chat_only=False):
+        """Record activity in a room and wake up anyone waiting for it to change"""
+        self.room_activity[room_name] = time.time()
+        self._bump_version(room_name, chat_only)
+        self._schedule_auto_skip(room_name)
+    
+    def _bump_version(self, room_name, chat_only=False):
+        with self.dirty_lock:
+            if room_name not in self.room_versions:
+                return
+            self.dirty_rooms.add(room_name)
+            self.room_versions[room_name] += 1
+            if not chat_only:
+                self.state_versions[room_name] += 1
+        changed = self.room_changed.get(room_name)
+        if changed is not None:
+            with changed:
+                changed.notify_all()
+    
+    def get_version(self, room_name):
+        """Counter that moves every time anything visible in the room changes"""
+        return self.room_versions.get(room_name, 0)
+    
+    def get_state_version(self, room_name):
+        """Like get_version, but chat messages alone don't move it"""
+        return self.state_versions.get(room_name, 0)
+    
+    def wait_for_change(self, room_name, since_version, timeout=None):
+        """Block until the room's version differs from since_version (or timeout), returning the current version.
+
+        Waiters on a room that gets evicted wake up too, and see version 0.
+        """
+        changed = self.room_changed.get(room_name)
+        if changed is None:
+            return self.get_version(room_name)
+        with changed:
+            changed.wait_for(
+                lambda: self.get_version(room_name) != since_version or self.room_changed.get(room_name) is not changed,
+                timeout
+            )
+            return self.get_version(room_name)
+    
+    @timed(MANAGER_CALLS, 'add_user')
+    @with_room_lock
+    def add_user(self, room_name, username):
+        room = self.get_room(room_name)
+        
+        # Check if username is already in use in this room
+        if username in self.users[room_name]:
+            # Add a number to make it unique
+            counter = 1
+            while f"{username}_{counter}" in self.users[room_name]:
+                counter += 1
+            username = f"{username}_{counter}"
+        
+        self.users[room_name].add(username)
+        self.add_msg(room_name, "System", f"🎉 {username} joined the room")
+        
+        # Set room creator if it's the first user
+        if room['room_creator'] is None:
+            room['room_creator'] = username
+        self._bump_version(room_name)
+            
+        return True, username
+    
+    @timed(MANAGER_CALLS, 'remove_user')
+    @with_room_lock
+    def remove_user(self, room_name, username):
+        if room_name in self.users and username in self.users[room_name]:
+            self.users[room_name].remove(username)
+            self.add_msg(room_name, "System", f"👋 {username} left the room")
+            
+            # If room is empty, mark for cleanup
+            if len(self.users[room_name]) == 0:
+                self.room_activity[room_name] = time.time() - 7000  # Mark as inactive
+                self._schedule_cleanup()
+            self._bump_version(room_name)
+    
+    @timed(MANAGER_CALLS, 'add_video')
+    @with_room_lock
+    def add_video(self, room_name, url, username="", play_next=False):
+        room = self.get_room(room_name)
+        
+        # Extract and validate video ID
+        video_id = self.extract_video_id(url)
+        if not video_id:
+            return False, "Invalid YouTube URL"
+        
+        video_data = self._make_video_data(video_id, url, username)
+        if video_data['pending']:
+            self._resolve_later(room_name, video_data)
+        
+        message = self._enqueue(room, video_data, play_next)
+        
+        self._touch(room_name)
+        if username:
+            self.add_msg(room_name, "System", f"🎵 {username} {message}: {video_data['title']}")
+        
+        return True, message
+    
+    @timed(MANAGER_CALLS, 'add_videos_bulk')
+    @with_room_lock
+    def add_videos_bulk(self, room_name, urls, username=""):
+        """Enqueue a list of URLs/IDs or a pasted text blob, fetching metadata concurrently in the background"""
+        room = self.get_room(room_name)
+        
+        video_ids = extract_video_ids(urls)
+        if not video_ids:
+            return False, "No valid YouTube URLs found"
+        
+        pending = {}
+        for video_id in video_ids:
+            video_data = self._make_video_data(video_id, video_id, username)
+            self._enqueue(room, video_data)
+            if video_data['pending']:
+                pending[video_id] = video_data
+        
+        if pending:
+            room['import_progress'] = {'done': 0, 'total': len(pending)}
+            threading.Thread(
+                target=self._resolve_bulk, args=(room_name, pending), daemon=True
+            ).start()
+        
+        self._touch(room_name)
+        if username:
+            self.add_msg(room_name, "System", f"📥 {username} imported {len(video_ids)} songs")
+        
+        return True, f"Imported {len(video_ids)} songs"
+    
+    def _make_video_data(self, video_id, url, username):
+        # Use cached info if we have it, otherwise start with placeholder
+        # metadata that gets patched in place once the real info arrives
+        video_info = self.video_cache.peek(video_id)
+        pending = video_info is None
+        if pending:
+            video_info = placeholder_video_info(video_id)
+        
+        return {
+            'id': video_id,
+            'url': url,
+            'title': video_info['title'],
+            'thumbnail': video_info['thumbnail'],
+            'author': video_info['author'],
+            'duration': timer_duration(video_info),
+            'added_by': username,
+            'added_at': time.time(),
+            'pending': pending
+        }
+    
+    def _enqueue(self, room, video_data, play_next=False):
+        if room['current_video'] is None:
+            video_data['start_time'] = time.time()
+            room['current_video'] = video_data
+            room['last_video_change'] = time.time()
+            return "Started playing"
+        
+        if play_next:
+            room['queue'].appendleft(video_data)
+            return "Playing next"
+        room['queue'].append(video_data)
+        return "Added to queue"
+    
+    def _resolve_later(self, room_name, video_data):
+        future = self.video_resolver.resolve(video_data['id'])
+        future.add_done_callback(
+            lambda f: self._apply_video_info(room_name, video_data, f)
+        )
+    
+    def _apply_video_info(self, room_name, video_data, future):
+        """Patch a queued or playing entry once its metadata has been resolved"""
+        try:
+            video_info = future.result()
+        except Exception:
+            video_info = dict(placeholder_video_info(video_data['id']), fallback=True)
+        
+        with self.room_lock(room_name):
+            self._patch_video_data(video_data, video_info)
+            if room_name in self.room_activity:
+                self._touch(room_name)
+    
+    def _resolve_bulk(self, room_name, pending):
+        room = self.rooms.get(room_name)
+        for done, (video_id, video_info) in enumerate(self.video_resolver.resolve_many(pending), 1):
+            with self.room_lock(room_name):
+                self._patch_video_data(pending[video_id], video_info)
+                if room is not None:
+                    room['import_progress'] = {'done': done, 'total': len(pending)}
+                self._bump_version(room_name)
+        
+        with self.room_lock(room_name):
+            if room is not None:
+                room['import_progress'] = None
+            if room_name in self.room_activity:
+                self._touch(room_name)
+    
+    def _refresh_video_info(self, video_id, video_info):
+        """Patch every playing or queued entry of a video whose metadata a background retry found"""
+        for room_name, room in list(self.rooms.items()):
+            with self.room_lock(room_name):
+                entries = [room['current_video'], *room['queue']]
+                matched = [video for video in entries if video is not None and video['id'] == video_id]
+                for video_data in matched:
+                    self._patch_video_data(video_data, video_info)
+                if matched and room_name in self.room_activity:
+                    self._touch(room_name)
+    
+    def _patch_video_data(self, video_data, video_info):
+        video_data.update({
+            'title': video_info['title'],
+            'thumbnail': video_info['thumbnail'],
+            'author': video_info['author'],
+            # A guessed length would auto-skip a long video or stream partway through
+            'duration': timer_duration(video_info),
+            'pending': False,
+            # The lookup failed and this is stand-in metadata, worth asking for again
+            'fallback': bool(video_info.get('fallback'))
+        })
+    
+    def extract_video_id(self, url):
+        """Extract YouTube video ID from various URL formats"""
+        return extract_video_id(url)
+    
+    @timed(MANAGER_CALLS, 'skip')
+    @with_room_lock
+    def skip(self, room_name, username=""):
+        room = self.get_room(room_name)
+        if room['queue']:
+            next_vid = room['queue'].popleft()
+            next_vid['start_time'] = time.time() - room.get('total_pause_duration', 0)
+            room['current_video'] = next_vid
+            room['paused'] = False
+            room['pause_time'] = None
+            room['total_pause_duration'] = 0
+            room['last_video_change'] = time.time()
+            
+            self._touch(room_name)
+            if username:
+                self.add_msg(room_name, "System", f"⏭️ {username} skipped to: {next_vid['title']}")
+            return True
+        else:
+            room['current_video'] = None
+            room['last_video_change'] = time.time()
+            self._touch(room_name)
+            if username:
+                self.add_msg(room_name, "System", f"⏹️ {username} stopped playback")
+            return False
+    
+    @timed(MANAGER_CALLS, 'stop')
+    @with_room_lock
+    def stop(self, room_name, username=""):
+        room = self.get_room(room_name)
+        if room['current_video'] is None:
+            return False
+        room['current_video'] = None
+        room['last_video_change'] = time.time()
+        self._touch(room_name)
+        if username:
+            self.add_msg(room_name, "System", f"⏹️ {username} stopped playback")
+        return True
+    
+    def _schedule_auto_skip(self, room_name):
+        """(Re)schedule the current video's auto-skip from its start time, duration and pauses"""
+        room = self.rooms.get(room_name)
+        video = room['current_video'] if room else None
+        if not video or room['paused'] or not room['auto_skip_enabled'] or not video.get('duration'):
+            # Nothing playing, paused, disabled, or duration unknown: nothing to fire
+            self.scheduler.cancel(room_name)
+            return
+        
+        # Skip 5 seconds before the end, as the embed can't tell us it finished
+        end_time = video['start_time'] + room.get('total_pause_duration', 0) + video['duration'] - 5
+        self.scheduler.schedule(room_name, end_time, self._auto_skip, (video['id'], video['start_time']))
+    
+    def _auto_skip(self, room_name, token):
+        if room_name not in self.rooms:
+            AUTO_SKIPS.labels('stale').inc()
+            return
+        # Held across the check and the skip, so a manual skip can't land in between
+        with self.room_lock(room_name):
+            room = self.rooms.get(room_name)
+            video = room['current_video'] if room else None
+            # Only skip the exact video this timer was set for
+            if video and (video['id'], video['start_time']) == token and not room['paused']:
+                AUTO_SKIPS.labels('skipped').inc()
+                self.skip(room_name, "Auto-skip")
+            else:
+                AUTO_SKIPS.labels('stale').inc()
+    
+    @timed(MANAGER_CALLS, 'remove_from_queue')
+    @with_room_lock
+    def remove_from_queue(self, room_name, entry_id, username=""):
+        room = self.get_room(room_name)
+        removed = room['queue'].remove(entry_id)
+        if removed is not None:
+            self._touch(room_name)
+            if username:
+                self.add_msg(room_name, "System", f"🗑️ {username} removed: {removed['title']}")
+            return True
+        return False
+    
+    @timed(MANAGER_CALLS, 'move_in_queue')
+    @with_room_lock
+    def move_in_queue(self, room_name, entry_id, position, username=""):
+        room = self.get_room(room_name)
+        if 0 <= position < len(room['queue']) and room['queue'].move(entry_id, position):
+            self._touch(room_name)
+            if username:
+                self.add_msg(room_name, "System", f"↕️ {username} moved song in queue")
+            return True
+        return False
+    
+    @timed(MANAGER_CALLS, 'clear_queue')
+    @with_room_lock
+    def clear_queue(self, room_name, username=""):
+        room = self.get_room(room_name)
+        room['queue'].clear()
+        self._touch(room_name)
+        if username:
+            self.add_msg(room_name, "System", f"🧹 {username} cleared the queue")
+    
+    @timed(MANAGER_CALLS, 'toggle_pause')
+    @with_room_lock
+    def toggle_pause(self, room_name, username=""):
+        room = self.get_room(room_name)
+        if room['current_video']:
+            if not room['paused']:
+                room['paused'] = True
+                room['pause_time'] = time.time()
+                action = "paused"
+            else:
+                room['paused'] = False
+                if room['pause_time']:
+                    pause_duration = time.time() - room['pause_time']
+                    room['total_pause_duration'] += pause_duration
+                room['pause_time'] = None
+                action = "resumed"
+            
+            self._touch(room_name)
+            if username:
+                self.add_msg(room_name, "System", f"⏯️ {username} {action} the video")
+            return True
+        return False
+    
+    @timed(MANAGER_CALLS, 'toggle_auto_skip')
+    @with_room_lock
+    def toggle_auto_skip(self, room_name, username=""):
+        room = self.get_room(room_name)
+        room['auto_skip_enabled'] = not room['auto_skip_enabled']
+        status = "enabled" if room['auto_skip_enabled'] else "disabled"
+        self._touch(room_name)
+        if username:
+            self.add_msg(room_name, "System", f"⚡ {username} {status} auto-skip")
+        return room['auto_skip_enabled']
+    
+    @timed(MANAGER_CALLS, 'add_msg')
+    @with_room_lock
+    def add_msg(self, room_name, user, text):
+        room = self.get_room(room_name)
+        timestamp = datetime.now().strftime("%H:%M")
+        room['chat'].append({
+            'user': user,
+            'text': text,
+            'time': timestamp
+        })
+        self._touch(room_name, chat_only=True)
+    
+    @timed(MANAGER_CALLS, 'get_messages_since')
+    def get_messages_since(self, room_name, last_id, limit=None):
+        """Chat messages with an ID greater than last_id, oldest first"""
+        return self.get_room(room_name)['chat'].since(last_id, limit)
+    
+    @timed(MANAGER_CALLS, 'get_chat_scrollback')
+    def get_chat_scrollback(self, room_name, before_id, limit=50):
+        """Older chat messages, including ones spilled to disk"""
+        return self.get_room(room_name)['chat'].before(before_id, limit)
+    
+    @timed(MANAGER_CALLS, 'chat_html')
+    def chat_html(self, room_name, count):
+        """The room's newest `count` chat messages as HTML, built once for all its viewers.
+
+        Returns (last_id, entries), entries being (user, html, own_html) oldest
+        first; each session shows own_html for its own messages. When messages
+        arrive only the new ones are rendered.
+        """
+        chat = self.get_room(room_name)['chat']
+        cache = self.render_cache.setdefault(room_name, {})
+        last_id, entries = cache.get(('chat', count), (0, ()))
+        if last_id != chat.last_id:
+            messages = chat.since(last_id, limit=count)
+            if messages:
+                rendered = tuple((msg['user'],) + chat_message_html(msg) for msg in messages)
+                last_id, entries = messages[-1]['id'], (entries + rendered)[-count:]
+                # Sessions racing here build the same thing; whichever lands is fine
+                cache[('chat', count)] = (last_id, entries)
+        return last_id, entries
+    
+    @timed(MANAGER_CALLS, 'queue_html')
+    def queue_html(self, room_name):
+        """The queue as (entry_id, html) rows, rebuilt only after the room changed"""
+        queue = self.get_room(room_name)['queue']
+        cache = self.render_cache.setdefault(room_name, {})
+        # Read the version first: a change made while rendering forces a rebuild next time
+        version = self.get_state_version(room_name)
+        cached = cache.get('queue')
+        if cached is None or cached[0] != version:
+            rows = [(song['entry_id'], queue_entry_html(i + 1, song)) for i, song in enumerate(queue)]
+            cached = cache['queue'] = (version, rows)
+        return cached[1]
+    
+    @timed(MANAGER_CALLS, 'list_rooms')
+    def list_rooms(self):
+        # Only return rooms with recent activity; eviction is left to the cleanup timer
+        return self.room_activity.active_rooms(ROOM_IDLE_TIMEOUT)
+    
+    @timed(MANAGER_CALLS, 'cleanup_inactive_rooms')
+    def cleanup_inactive_rooms(self, max_inactive_time=ROOM_IDLE_TIMEOUT):
+        """Evict rooms idle for max_inactive_time that nobody is in and nothing is playing in"""
+        removed = 0
+        for room_name in self.room_activity.pop_idle(max_inactive_time):
+            with self.room_lock(room_name):
+                if self._in_use(room_name):
+                    # Quiet, not abandoned: check again in another idle period
+                    self.room_activity[room_name] = time.time()
+                    continue
+                self._evict(room_name)
+            removed += 1
+        return removed
+    
+    def _in_use(self, room_name):
+        """Whether a room has users, or a video that is still playing"""
+        if self.users.get(room_name):
+            return True
+        room = self.rooms.get(room_name)
+        video = room['current_video'] if room else None
+        if video is None or room['paused']:
+            return False
+        if not video.get('duration'):
+            # A stream, or a video we don't know the length of
+            return True
+        return video['start_time'] + room.get('total_pause_duration', 0) + video['duration'] > time.time()
+    
+    def _evict(self, room_name):
+        if room_name in self.rooms:
+            spill_path = self.rooms[room_name]['chat'].spill_path
+            if spill_path and os.path.exists(spill_path):
+                os.remove(spill_path)
+            del self.rooms[room_name]
+        if room_name in self.users:
+            del self.users[room_name]
+        self._bump_version(room_name)
+        with self.dirty_lock:
+            self.room_versions.pop(room_name, None)
+            self.state_versions.pop(room_name, None)
+        changed = self.room_changed.pop(room_name, None)
+        if changed is not None:
+            with changed:
+                changed.notify_all()
+        self.render_cache.pop(room_name, None)
+        self.room_locks.pop(room_name, None)
+        self.scheduler.cancel(room_name)
+    
+    def collect_dirty_rooms(self):
+        """Encoded state of every room changed since the last call (None for evicted ones), for the journal"""
+        with self.dirty_lock:
+            dirty, self.dirty_rooms = self.dirty_rooms, set()
+        changes = {}
+        for room_name in dirty:
+            if room_name not in self.rooms:
+                changes[room_name] = None
+                continue
+            # Under the room's lock, so a half-done skip or pause is never saved
+            with self.room_lock(room_name):
+                room = self.rooms.get(room_name)
+                if room is None:
+                    changes[room_name] = None
+                    continue
+                state = dict(room, queue=room['queue'].to_list(), chat=room['chat'].snapshot(),
+                             last_active=self.room_activity.get(room_name))
+                del state['import_progress']
+                changes[room_name] = json.dumps(state)
+        return changes
+    
+    def restore_rooms(self, saved_rooms):
+        """Bring back rooms from collect_dirty_rooms() output, decoded.
+        
+        Users are not restored (their sessions did not survive the restart).
+        Playback positions follow from the saved start time and pause totals,
+        and auto-skip is re-armed, so a video that ended meanwhile moves on.
+        Entries still waiting for metadata when they were saved, or holding
+        a fallback from a failed lookup, are looked up again: their lookups
+        and retries died with the old process.
+        """
+        for room_name, state in saved_rooms.items():
+            last_active = state.pop('last_active', None) or time.time()
+            state['queue'] = VideoQueue(state['queue'])
+            state['chat'] = ChatHistory.restore(
+                state['chat'], CHAT_HISTORY_SIZE, self._chat_spill_path(room_name, fresh=False)
+            )
+            state['import_progress'] = None
+            self._add_room(room_name, state, last_active)
+            self._schedule_auto_skip(room_name)
+            for video_data in [state['current_video'], *state['queue']]:
+                if video_data is not None and (video_data.get('pending') or video_data.get('fallback')):
+                    self._resolve_later(room_name, video_data)
+    
+    def _schedule_cleanup(self):
+        """Arm the eviction timer for when the least recently active room goes idle"""
+        oldest = self.room_activity.oldest()
+        if oldest is None:
+            return
+        due = oldest + ROOM_IDLE_TIMEOUT
+        pending = self.scheduler.due_time(CLEANUP_TIMER)
+        if pending is None or due < pending:
+            self.scheduler.schedule(CLEANUP_TIMER, due, self._cleanup_sweep)
+    
+    def _cleanup_sweep(self, key, token):
+        self.cleanup_inactive_rooms()
+        self._schedule_cleanup()
+
+_room_manager = None
+_room_manager_lock = threading.Lock()
+
+def get_room_manager():
+    """Process-wide RoomManager: the same rooms for every session and every rerun"""
+    global _room_manager
+    with _room_manager_lock:
+        if _room_manager is None:
+            _room_manager = RoomManager()
+            if SNAPSHOT_PATH:
+                journal = RoomJournal(SNAPSHOT_PATH)
+                _room_manager.restore_rooms(journal.load())
+                start_snapshots(journal, _room_manager.collect_dirty_rooms, SNAPSHOT_INTERVAL)
+            _register_gauges(_room_manager)
+            if METRICS_PORT:
+                start_http_server(METRICS_PORT)
+    return _room_manager
+
+def _register_gauges(manager):
+    Gauge('syncroom_manager_rooms', 'Rooms held by the RoomManager').set_function(lambda: len(manager.rooms))
+    Gauge('syncroom_manager_room_users', 'Users in each room', ['room']).set_function(
+        lambda: {room: len(users) for room, users in list(manager.users.items())}
+    )
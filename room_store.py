@@ -0,0 +1,271 @@
+"""Where app.py keeps room state, so several worker processes can share it"""
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+
+from video_queue import VideoQueue
+
+OP_LOG_SIZE = 500
+# SQLite room locks: a holder that died is presumed gone after LOCK_LEASE
+# seconds, and a waiter checks again every LOCK_POLL seconds
+LOCK_LEASE = 10
+LOCK_POLL = 0.005
+
+
+class RoomStore(ABC):
+    """Room state plus each room's recent op log, accessed under a per-room lock.
+    
+    Everything that reads or changes a room happens inside `with
+    store.lock(room):`. Inside the lock `store[room]` is the room's state
+    dict (its 'queue' a VideoQueue) and may be modified in place; a shared
+    backend loads it when the outermost lock is taken and writes it back when
+    that lock is released. Locks are reentrant.
+    
+    A backend implements every abstract method: lock(), __contains__,
+    __getitem__, __setitem__, __iter__ (room names), log_op() and ops(), and
+    one that misses any fails when it is created. MemoryRoomStore is the
+    single-process default; SQLiteRoomStore is shared by every process on
+    the host, and a Redis-compatible store would follow the same shape
+    (a lock key per room, the state as one JSON value, the op log a
+    capped list).
+    """
+    @abstractmethod
+    def lock(self, room):
+        """Reentrant context manager holding the room"""
+    
+    @abstractmethod
+    def log_op(self, room, op):
+        """Append a versioned op to the room's log, dropping the oldest past OP_LOG_SIZE"""
+    
+    @abstractmethod
+    def ops(self, room):
+        """The room's logged ops, oldest first"""
+    
+    @abstractmethod
+    def __contains__(self, room):
+        """Whether the room exists"""
+    
+    @abstractmethod
+    def __getitem__(self, room):
+        """The room's state; KeyError if it doesn't exist"""
+    
+    @abstractmethod
+    def __setitem__(self, room, state):
+        """Create or replace the room's state"""
+    
+    @abstractmethod
+    def __iter__(self):
+        """Names of every room"""
+
+
+class MemoryRoomStore(RoomStore):
+    """Rooms as live dicts in this process"""
+    def __init__(self):
+        self._rooms = {}
+        self._op_logs = {}
+        self._locks = {}
+    
+    def lock(self, room):
+        lock = self._locks.get(room)
+        if lock is None:
+            # setdefault is atomic, so concurrent first joins agree on one lock
+            lock = self._locks.setdefault(room, threading.RLock())
+        return lock
+    
+    def log_op(self, room, op):
+        self._op_logs[room].append(op)
+    
+    def ops(self, room):
+        return list(self._op_logs[room])
+    
+    def __contains__(self, room):
+        return room in self._rooms
+    
+    def __getitem__(self, room):
+        return self._rooms[room]
+    
+    def __setitem__(self, room, state):
+        self._op_logs.setdefault(room, deque(maxlen=OP_LOG_SIZE))
+        self._rooms[room] = state
+    
+    def __iter__(self):
+        return iter(list(self._rooms))
+
+
+def encode_room(state):
+    return json.dumps(dict(state, queue=state['queue'].to_list()))
+
+
+def decode_room(data):
+    state = json.loads(data)
+    state['queue'] = VideoQueue(state['queue'])
+    return state
+
+
+class SQLiteRoomStore(RoomStore):
+    """Rooms in a SQLite file, shared by every process that opens the same path.
+    
+    Taking a room's lock claims the room's row in room_locks, a lease that
+    excludes other processes until it is released (or expires, if its
+    holder died), so a worker always sees the state the previous one left.
+    No transaction stays open while the lock is held: each statement
+    commits on its own, and the save on release is one short transaction.
+    A handler can yield to other green threads while it holds a room
+    without another room's lock ever waiting on it.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()  # one connection per thread
+        self._locks = {}
+        self._open = {}  # room -> state loaded by the lock holder
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS rooms (name TEXT PRIMARY KEY, state TEXT NOT NULL)')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS ops (room TEXT NOT NULL, v INTEGER NOT NULL, op TEXT NOT NULL, '
+                'PRIMARY KEY (room, v))'
+            )
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS room_locks (room TEXT PRIMARY KEY, owner TEXT NOT NULL, '
+                'expires REAL NOT NULL)'
+            )
+    
+    def _connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            self._local.db = db
+        return db
+    
+    def lock(self, room):
+        lock = self._locks.get(room)
+        if lock is None:
+            lock = self._locks.setdefault(room, _SQLiteRoomLock(self, room))
+        return lock
+    
+    def log_op(self, room, op):
+        db = self._connect()
+        db.execute('INSERT OR REPLACE INTO ops (room, v, op) VALUES (?, ?, ?)', (room, op['v'], json.dumps(op)))
+        db.execute('DELETE FROM ops WHERE room = ? AND v <= ?', (room, op['v'] - OP_LOG_SIZE))
+    
+    def ops(self, room):
+        rows = self._connect().execute('SELECT op FROM ops WHERE room = ? ORDER BY v', (room,))
+        return [json.loads(op) for (op,) in rows]
+    
+    def _load(self, room):
+        row = self._connect().execute('SELECT state FROM rooms WHERE name = ?', (room,)).fetchone()
+        return decode_room(row[0]) if row else None
+    
+    def _save(self, room, state):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO rooms (name, state) VALUES (?, ?)', (room, encode_room(state))
+        )
+    
+    def __contains__(self, room):
+        if self._open.get(room) is not None:
+            return True
+        return self._connect().execute('SELECT 1 FROM rooms WHERE name = ?', (room,)).fetchone() is not None
+    
+    def __getitem__(self, room):
+        state = self._open.get(room)
+        if state is None:
+            # Outside the lock this is a read-only copy
+            state = self._load(room)
+            if state is None:
+                raise KeyError(room)
+        return state
+    
+    def __setitem__(self, room, state):
+        if room in self._open:
+            self._open[room] = state
+        else:
+            self._save(room, state)
+    
+    def __iter__(self):
+        return iter([name for (name,) in self._connect().execute('SELECT name FROM rooms')])
+
+
+class _SQLiteRoomLock:
+    """Reentrant room lock that loads the room on first entry and saves it on last exit.
+    
+    Threads of this process queue on an in-process lock; only its holder
+    competes for the room's lease with other processes.
+    """
+    def __init__(self, store, room):
+        self._store = store
+        self._room = room
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._owner = None
+    
+    def __enter__(self):
+        self._lock.acquire()
+        self._depth += 1
+        if self._depth == 1:
+            try:
+                self._acquire_lease()
+                self._store._open[self._room] = self._store._load(self._room)
+            except Exception:
+                self._release_lease()
+                self._depth -= 1
+                self._lock.release()
+                raise
+        return self
+    
+    def __exit__(self, *exc):
+        try:
+            if self._depth == 1:
+                state = self._store._open.pop(self._room, None)
+                self._release_lease(state)
+        finally:
+            self._depth -= 1
+            self._lock.release()
+    
+    def _acquire_lease(self):
+        db = self._store._connect()
+        owner = uuid.uuid4().hex
+        while True:
+            now = time.time()
+            claimed = db.execute(
+                'INSERT INTO room_locks (room, owner, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT (room) DO UPDATE SET owner = excluded.owner, expires = excluded.expires '
+                'WHERE room_locks.expires < ?',
+                (self._room, owner, now + LOCK_LEASE, now)
+            ).rowcount
+            if claimed:
+                self._owner = owner
+                return
+            # time.sleep is green under eventlet/gevent, so waiting never stalls the hub
+            time.sleep(LOCK_POLL)
+    
+    def _release_lease(self, state=None):
+        """Save state (unless None) and give up the lease, in one transaction"""
+        if self._owner is None:
+            return
+        store = self._store
+        db = store._connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            held = db.execute(
+                'DELETE FROM room_locks WHERE room = ? AND owner = ?', (self._room, self._owner)
+            ).rowcount
+            if state is not None and held:
+                store._save(self._room, state)
+        finally:
+            db.execute('COMMIT')
+            self._owner = None
+        if state is not None and not held:
+            raise RuntimeError(f'Lock on room {self._room!r} expired after {LOCK_LEASE}s; changes not saved')
+
+
+def open_room_store(url):
+    """Room store for a SYNCROOM_ROOM_STORE value: '' or 'memory://', or 'sqlite:///path/to/rooms.db'"""
+    if not url or url == 'memory://':
+        return MemoryRoomStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteRoomStore(url[len('sqlite:///'):])
+    raise ValueError(f'Unsupported room store: {url}')
@@ -0,0 +1,74 @@
+"""Server-side timers shared by the Streamlit and Socket.IO front ends"""
+import heapq
+import itertools
+import threading
+import time
+
+
+class RoomScheduler:
+    """One background thread firing at most one pending timer per room.
+
+    schedule() replaces whatever was pending for the room; the callback is
+    called as callback(room, token) once its due time (a time.time() value)
+    passes. Superseded entries stay in the heap and are skipped lazily, and
+    re-scheduling the same due time and token is a no-op, so it is cheap to
+    call on every room change.
+    """
+    def __init__(self, name="room-scheduler"):
+        self._heap = []  # (due, seq, room)
+        self._pending = {}  # room -> (due, seq, callback, token)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.fired = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+    
+    def schedule(self, room, due, callback, token=None):
+        with self._cond:
+            pending = self._pending.get(room)
+            if pending is not None and pending[0] == due and pending[3] == token:
+                return
+            seq = next(self._seq)
+            self._pending[room] = (due, seq, callback, token)
+            heapq.heappush(self._heap, (due, seq, room))
+            self._cond.notify()
+    
+    def cancel(self, room):
+        with self._cond:
+            self._pending.pop(room, None)
+    
+    def due_time(self, room):
+        """When the room's timer fires, or None if nothing is scheduled"""
+        pending = self._pending.get(room)
+        return pending[0] if pending is not None else None
+    
+    def __len__(self):
+        return len(self._pending)
+    
+    def _is_current(self, entry):
+        pending = self._pending.get(entry[2])
+        return pending is not None and pending[1] == entry[1]
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    while self._heap and not self._is_current(self._heap[0]):
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - time.time()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                
+                _, _, room = heapq.heappop(self._heap)
+                _, _, callback, token = self._pending.pop(room)
+                self.fired += 1
+            
+            try:
+                callback(room, token)
+            except Exception:
+                # A failing callback must not take the scheduler thread down
+                pass
@@ -0,0 +1,54 @@
+"""Per-section timing of a Streamlit script run, cheap enough to leave in production"""
+import logging
+import os
+import random
+import time
+
+logger = logging.getLogger('syncroom.timing')
+
+# SYNCROOM_TIMING is the fraction of runs to time: 1 for all of them, 0.05
+# for one in twenty, unset or 0 for none. Lines go to stderr, or to the file
+# named by SYNCROOM_TIMING_LOG.
+TIMING_RATE = float(os.environ.get('SYNCROOM_TIMING', 0) or 0)
+TIMING_LOG = os.environ.get('SYNCROOM_TIMING_LOG', '')
+
+if TIMING_RATE and not logger.handlers:
+    handler = logging.FileHandler(TIMING_LOG) if TIMING_LOG else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class SectionTimer:
+    """Splits one script run into named sections by wall-clock laps.
+
+    lap(name) charges the time since the previous lap (or since the timer was
+    created) to `name`; finish() logs one line with every section and the
+    total. When the run isn't sampled both are no-ops.
+    """
+    def __init__(self, rate=None):
+        rate = TIMING_RATE if rate is None else rate
+        self.enabled = rate >= 1 or (rate > 0 and random.random() < rate)
+        self.sections = {}
+        self._start = self._last = time.perf_counter()
+    
+    def lap(self, name):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.sections[name] = self.sections.get(name, 0) + now - self._last
+        self._last = now
+    
+    def finish(self, **context):
+        """Log this run's sections; returns {section: seconds, ..., 'total': seconds}"""
+        if not self.enabled:
+            return None
+        timings = dict(self.sections, total=time.perf_counter() - self._start)
+        logger.info(
+            'run %s %s',
+            ' '.join(f'{name}={seconds * 1000:.1f}ms' for name, seconds in timings.items()),
+            ' '.join(f'{key}={value}' for key, value in context.items()),
+            extra={'timings': timings, 'context': context}
+        )
+        return timings
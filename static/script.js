@@ -4,6 +4,25 @@ let roomID = "";
 let username = "";
 let isApiReady = false;
 
+// Local copy of the room, kept up to date by applying versioned ops
+let roomVersion = null;
+let queue = [];
+let currentVideo = null;
+let awaitingOps = false;
+
+// Clock sync: offset = server clock - our clock, both in seconds
+const CLOCK_SAMPLES = 5;
+const CLOCK_RESYNC_MS = 60000;
+let clockOffset = 0;
+let clockRtt = null;
+let clockSamples = [];
+let clockTimer = null;
+
+// Drift correction: nudge the playback rate for small drift, seek for large
+const RATE_CORRECTION_THRESHOLD = 0.1;
+const SEEK_CORRECTION_THRESHOLD = 1.0;
+let rateTimer = null;
+
 // 1. YouTube IFrame API Setup
 var tag = document.createElement('script');
 tag.src = "https://www.youtube.com/iframe_api";
@@ -34,12 +53,110 @@ function onPlayerReady(event) {
 
 function onPlayerStateChange(event) {
     // If video ends (state=0), tell server
-    if (event.data === YT.PlayerState.ENDED) {
-        socket.emit('video_ended', { room: roomID });
+    // Name the video that ended so duplicate reports from other viewers are ignored
+    if (event.data === YT.PlayerState.ENDED && currentVideo) {
+        socket.emit('video_ended', {
+            room: roomID,
+            video_id: currentVideo.id,
+            start_time: currentVideo.start_time
+        });
+    }
+}
+
+// 2. Clock Sync
+// A short burst of NTP-style pings; the lowest-RTT sample gives the best
+// offset estimate because its timing is the least skewed by queueing.
+function syncClock() {
+    clockSamples = [];
+    sendTimePing();
+}
+
+function sendTimePing() {
+    socket.emit('time_ping', { t0: Date.now() / 1000 });
+}
+
+function serverNow() {
+    return Date.now() / 1000 + clockOffset;
+}
+
+socket.on('time_pong', (data) => {
+    const t3 = Date.now() / 1000;
+    clockSamples.push({
+        rtt: (t3 - data.t0) - (data.t2 - data.t1),
+        offset: ((data.t1 - data.t0) + (data.t2 - t3)) / 2
+    });
+    if (clockSamples.length < CLOCK_SAMPLES) {
+        setTimeout(sendTimePing, 100);
+        return;
+    }
+    const best = clockSamples.reduce((a, b) => (a.rtt <= b.rtt ? a : b));
+    clockOffset = best.offset;
+    clockRtt = best.rtt;
+    socket.emit('clock_report', { room: roomID, user: username, rtt: clockRtt, offset: clockOffset });
+});
+
+// Where the room's video is right now, given its position at serverTime
+function targetPosition(position, serverTime, paused) {
+    return paused ? position : position + (serverNow() - serverTime);
+}
+
+// Seek to where the room's video is right now (by the server's clock), or
+// hold at 0:00 until its scheduled start if that hasn't arrived yet
+function playAtServerPosition(position, serverTime, paused) {
+    if (!player || !player.seekTo) return;
+    const target = targetPosition(position, serverTime, paused);
+    if (paused) {
+        player.seekTo(Math.max(0, target), true);
+        player.pauseVideo();
+    } else if (target < 0) {
+        player.seekTo(0, true);
+        player.pauseVideo();
+        setTimeout(() => player.playVideo(), -target * 1000);
+    } else {
+        player.seekTo(target, true);
+        player.playVideo();
     }
 }
 
-// 2. Room & UI Logic
+function correctDrift(beat) {
+    if (!player || !player.getCurrentTime || !currentVideo || beat.id !== currentVideo.id) return;
+    
+    // The room's pause state wins over the local player's
+    const state = player.getPlayerState();
+    if (beat.paused) {
+        if (state === YT.PlayerState.PLAYING) playAtServerPosition(beat.pos, beat.ts, true);
+        return;
+    }
+    if (state === YT.PlayerState.PAUSED) {
+        playAtServerPosition(beat.pos, beat.ts, false);
+        return;
+    }
+    if (state !== YT.PlayerState.PLAYING) return;  // Still loading; measure on the next beat
+    
+    const target = targetPosition(beat.pos, beat.ts, false);
+    const drift = player.getCurrentTime() - target;  // positive = we are ahead
+    socket.emit('position_report', { room: roomID, user: username, id: beat.id, drift: drift });
+    
+    clearTimeout(rateTimer);
+    if (Math.abs(drift) >= SEEK_CORRECTION_THRESHOLD) {
+        player.setPlaybackRate(1);
+        player.seekTo(target, true);
+    } else if (Math.abs(drift) >= RATE_CORRECTION_THRESHOLD) {
+        // Use the nearest supported rate on the right side of 1x, and only
+        // for as long as it takes to absorb the drift
+        const rates = player.getAvailablePlaybackRates();
+        const rate = drift > 0
+            ? Math.max(...rates.filter(r => r < 1))
+            : Math.min(...rates.filter(r => r > 1));
+        if (!isFinite(rate)) return;
+        player.setPlaybackRate(rate);
+        rateTimer = setTimeout(() => player.setPlaybackRate(1), Math.abs(drift / (rate - 1)) * 1000);
+    } else {
+        player.setPlaybackRate(1);
+    }
+}
+
+// 3. Room & UI Logic
 function joinRoom() {
     username = document.getElementById('username').value || 'Guest';
     // Check URL params first, then input
@@ -53,8 +170,19 @@ function joinRoom() {
     document.getElementById('room-display').innerText = `Room: ${roomID}`;
 
     socket.emit('join', { username: username, room: roomID });
+    syncClock();
+    clearInterval(clockTimer);
+    clockTimer = setInterval(syncClock, CLOCK_RESYNC_MS);
 }
 
+// On reconnect, rejoin and ask only for the changes we missed
+socket.on('connect', () => {
+    if (roomID) {
+        socket.emit('join', { username: username, room: roomID, since_version: roomVersion });
+        syncClock();
+    }
+});
+
 // Auto-join if URL has ?room=XYZ
 window.onload = () => {
     const urlParams = new URLSearchParams(window.location.search);
@@ -73,10 +201,21 @@ function leaveRoom() {
     window.location.href = "/";
 }
 
-// 3. Playback Logic
+// 4. Playback Logic
+function togglePause() {
+    socket.emit('toggle_pause', { room: roomID });
+}
+
 function addSong() {
     const url = document.getElementById('youtube-url').value;
     
+    // Several links pasted at once go through the bulk importer
+    if (url.trim().split(/[\s,]+/).length > 1) {
+        socket.emit('add_to_queue_bulk', { room: roomID, text: url });
+        document.getElementById('youtube-url').value = "";
+        return;
+    }
+    
     // Improved logic to extract ID from standard URLs (v=) AND short URLs (youtu.be)
     // It also ignores extra parameters like ?si= or &t=
     let vidId = "";
@@ -99,52 +238,175 @@ function addSong() {
     }
 }
 
-// 4. Socket Listeners
+// 5. Socket Listeners
 
-socket.on('message', (data) => {
+function appendChat(data) {
     const box = document.getElementById('chat-box');
     const msg = document.createElement('div');
     msg.className = 'chat-msg';
     msg.innerHTML = `<b>${data.user}:</b> ${data.text}`;
     box.appendChild(msg);
     box.scrollTop = box.scrollHeight;
+}
+
+socket.on('message', appendChat);
+
+// Chat arrives in per-room batches collected over a few tens of milliseconds
+socket.on('messages', (data) => {
+    data.messages.forEach(appendChat);
+});
+
+socket.on('chat_throttled', (data) => {
+    appendChat({ user: 'System', text: `Slow down: you can send again in ${Math.ceil(data.retry_after)}s.` });
 });
 
 socket.on('play_video', (data) => {
+    currentVideo = data;
     if(!isApiReady) return;
     
     document.getElementById('current-song').innerText = `Playing: ${data.title}`;
     player.loadVideoById(data.id);
     
-    // Calculate sync time
-    // Server time vs local time diff is handled roughly here.
-    // For precision, we use the server's elapsed calculation.
-    socket.emit('request_sync', { room: roomID });
+    // The server schedules a shared play-at instant; our clock offset turns
+    // it into local time, so no extra request_sync round trip is needed
+    playAtServerPosition(data.position, data.server_time, false);
 });
 
 socket.on('sync_time', (data) => {
-    if(player && player.seekTo) {
-        player.seekTo(data.elapsed, true);
-        player.playVideo();
-    }
+    playAtServerPosition(data.position, data.server_time, data.paused);
+});
+
+socket.on('heartbeat', (beat) => {
+    correctDrift(beat);
 });
 
 socket.on('stop_video', () => {
+    currentVideo = null;
     if(player) player.stopVideo();
     document.getElementById('current-song').innerText = "Nothing Playing";
 });
 
-socket.on('update_queue', (queue) => {
+function renderQueue() {
     const list = document.getElementById('queue-list');
     list.innerHTML = "";
-    queue.forEach(vid => {
+    queue.forEach((vid, index) => {
         const li = document.createElement('li');
-        li.innerText = vid.title;
+        const title = document.createElement('span');
+        title.innerText = vid.title;
+        li.appendChild(title);
+        
+        if (index > 0) {
+            const up = document.createElement('button');
+            up.className = 'queue-btn';
+            up.title = 'Move up';
+            up.innerHTML = '<i class="fa-solid fa-arrow-up"></i>';
+            up.onclick = () => socket.emit('move_in_queue', { room: roomID, entry_id: vid.entry_id, position: index - 1 });
+            li.appendChild(up);
+        }
+        const remove = document.createElement('button');
+        remove.className = 'queue-btn';
+        remove.title = 'Remove';
+        remove.innerHTML = '<i class="fa-solid fa-xmark"></i>';
+        remove.onclick = () => socket.emit('remove_from_queue', { room: roomID, entry_id: vid.entry_id });
+        li.appendChild(remove);
+        
         list.appendChild(li);
     });
+}
+
+function queueIndex(entryId) {
+    return queue.findIndex(vid => vid.entry_id === entryId);
+}
+
+function applyOp(op) {
+    switch (op.op) {
+        case 'append':
+            queue.push(...op.videos);
+            break;
+        case 'prepend':
+            queue.unshift(...op.videos);
+            break;
+        case 'remove': {
+            const index = queueIndex(op.entry_id);
+            if (index >= 0) queue.splice(index, 1);
+            break;
+        }
+        case 'move': {
+            const index = queueIndex(op.entry_id);
+            if (index >= 0) queue.splice(op.to, 0, queue.splice(index, 1)[0]);
+            break;
+        }
+        case 'update': {
+            // Only the fields that changed are sent
+            const fields = {};
+            if ('title' in op) fields.title = op.title;
+            if ('duration' in op) fields.duration = op.duration;
+            queue.filter(vid => vid.id === op.id).forEach(vid => Object.assign(vid, fields));
+            if (currentVideo && currentVideo.id === op.id) {
+                Object.assign(currentVideo, fields);
+                document.getElementById('current-song').innerText = `Playing: ${currentVideo.title}`;
+            }
+            break;
+        }
+        case 'now_playing':
+            if (op.from_queue) queue.shift();
+            currentVideo = op.video;
+            break;
+    }
+    roomVersion = op.v;
+}
+
+socket.on('room_op', (op) => {
+    if (roomVersion === null || op.v <= roomVersion) return;
+    if (op.v !== roomVersion + 1) {
+        // We missed something; fetch the gap instead of applying out of order
+        if (!awaitingOps) {
+            awaitingOps = true;
+            socket.emit('request_ops', { room: roomID, since_version: roomVersion });
+        }
+        return;
+    }
+    applyOp(op);
+    renderQueue();
+});
+
+socket.on('room_ops', (data) => {
+    awaitingOps = false;
+    const playingBefore = currentVideo ? currentVideo.id : null;
+    data.ops.forEach(op => {
+        if (op.v === roomVersion + 1) applyOp(op);
+    });
+    renderQueue();
+    
+    // Catch up with a video change that happened while we were away
+    const playingNow = currentVideo ? currentVideo.id : null;
+    if (playingNow !== playingBefore && isApiReady) {
+        if (currentVideo) {
+            document.getElementById('current-song').innerText = `Playing: ${currentVideo.title}`;
+            player.loadVideoById(currentVideo.id);
+            socket.emit('request_sync', { room: roomID });
+        } else {
+            player.stopVideo();
+            document.getElementById('current-song').innerText = "Nothing Playing";
+        }
+    }
+});
+
+socket.on('import_progress', (data) => {
+    const input = document.getElementById('youtube-url');
+    if (data.total === 0) {
+        alert("No valid YouTube links found.");
+    } else if (data.done < data.total) {
+        input.placeholder = `Importing ${data.done}/${data.total}...`;
+    } else {
+        input.placeholder = "Paste YouTube Link here...";
+    }
 });
 
 socket.on('sync_state', (state) => {
+    awaitingOps = false;
+    roomVersion = state.version;
+    currentVideo = state.current_video;
     if (state.current_video) {
         document.getElementById('current-song').innerText = `Playing: ${state.current_video.title}`;
         player.loadVideoById(state.current_video.id);
@@ -155,15 +417,8 @@ socket.on('sync_state', (state) => {
         document.getElementById('overlay').style.display = 'flex'; // Ask user to click to sync
     }
     // Update queue
-    if (state.queue) {
-        const list = document.getElementById('queue-list');
-        list.innerHTML = "";
-        state.queue.forEach(vid => {
-            const li = document.createElement('li');
-            li.innerText = vid.title;
-            list.appendChild(li);
-        });
-    }
+    queue = state.queue || [];
+    renderQueue();
 });
 
 // Chat
@@ -1,10 +1,13 @@
 import streamlit as st
 import time
-import re
-import requests
-import json
 from datetime import datetime
-from streamlit_autorefresh import st_autorefresh
+from room_manager import get_room_manager
+from section_timer import SectionTimer
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from youtube_player import youtube_player
+
+# Wall-clock time per section of this run, logged when SYNCROOM_TIMING is set
+run_timer = SectionTimer()
 
 # --- 1. CONFIGURATION ---
 st.set_page_config(
@@ -122,367 +125,11 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- 2. GLOBAL STATE (The "Server" Memory) ---
-@st.cache_resource
-class RoomManager:
-    def __init__(self):
-        self.rooms = {}
-        self.users = {}  # Track active users by room
-        self.room_activity = {}  # Track last activity time for cleanup
-        # Cache for video durations to avoid repeated API calls
-        self.video_duration_cache = {}
-    
-    def get_room(self, room_name):
-        if room_name not in self.rooms:
-            self.rooms[room_name] = {
-                'current_video': None,  # {'id': '...', 'url': '...', 'title': '...', 'start_time': 12345, 'duration': 0}
-                'queue': [],
-                'chat': [],
-                'paused': False,
-                'pause_time': None,
-                'total_pause_duration': 0,
-                'room_creator': None,
-                'created_at': time.time(),
-                'last_video_change': 0,
-                'auto_skip_enabled': True  # Auto-skip when video ends
-            }
-            self.users[room_name] = set()
-            self.room_activity[room_name] = time.time()
-        return self.rooms[room_name]
-    
-    def add_user(self, room_name, username):
-        room = self.get_room(room_name)
-        
-        # Check if username is already in use in this room
-        if username in self.users[room_name]:
-            # Add a number to make it unique
-            counter = 1
-            while f"{username}_{counter}" in self.users[room_name]:
-                counter += 1
-            username = f"{username}_{counter}"
-        
-        self.users[room_name].add(username)
-        self.add_msg(room_name, "System", f"🎉 {username} joined the room")
-        
-        # Set room creator if it's the first user
-        if room['room_creator'] is None:
-            room['room_creator'] = username
-            
-        return True, username
-    
-    def remove_user(self, room_name, username):
-        if room_name in self.users and username in self.users[room_name]:
-            self.users[room_name].remove(username)
-            self.add_msg(room_name, "System", f"👋 {username} left the room")
-            
-            # If room is empty, mark for cleanup
-            if len(self.users[room_name]) == 0:
-                self.room_activity[room_name] = time.time() - 7000  # Mark as inactive
-    
-    def add_video(self, room_name, url, username=""):
-        room = self.get_room(room_name)
-        
-        # Extract and validate video ID
-        video_id = self.extract_video_id(url)
-        if not video_id:
-            return False, "Invalid YouTube URL"
-        
-        # Get video info including duration
-        video_info = get_video_info(video_id)
-        
-        video_data = {
-            'id': video_id,
-            'url': url,
-            'title': video_info['title'],
-            'thumbnail': video_info['thumbnail'],
-            'author': video_info['author'],
-            'duration': video_info['duration'],
-            'added_by': username,
-            'added_at': time.time()
-        }
-        
-        if room['current_video'] is None:
-            video_data['start_time'] = time.time()
-            room['current_video'] = video_data
-            room['last_video_change'] = time.time()
-            message = "Started playing"
-        else:
-            room['queue'].append(video_data)
-            message = "Added to queue"
-        
-        self.room_activity[room_name] = time.time()
-        if username:
-            self.add_msg(room_name, "System", f"🎵 {username} {message}: {video_info['title']}")
-        
-        return True, message
-    
-    def extract_video_id(self, url):
-        """Extract YouTube video ID from various URL formats"""
-        # Clean the URL
-        url = url.strip()
-        
-        # Common patterns
-        patterns = [
-            r'(?:youtube\.com\/watch\?v=)([\w-]{11})',
-            r'(?:youtu\.be\/)([\w-]{11})',
-            r'(?:youtube\.com\/embed\/)([\w-]{11})',
-            r'(?:youtube\.com\/v\/)([\w-]{11})',
-            r'(?:youtube\.com\/shorts\/)([\w-]{11})'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, url)
-            if match:
-                return match.group(1)
-        
-        # Also check if it's just a video ID
-        if re.match(r'^[\w-]{11}$', url):
-            return url
-        
-        return None
-    
-    def skip(self, room_name, username=""):
-        room = self.get_room(room_name)
-        if room['queue']:
-            next_vid = room['queue'].pop(0)
-            next_vid['start_time'] = time.time() - room.get('total_pause_duration', 0)
-            room['current_video'] = next_vid
-            room['paused'] = False
-            room['pause_time'] = None
-            room['total_pause_duration'] = 0
-            room['last_video_change'] = time.time()
-            
-            self.room_activity[room_name] = time.time()
-            if username:
-                self.add_msg(room_name, "System", f"⏭️ {username} skipped to: {next_vid['title']}")
-            return True
-        else:
-            room['current_video'] = None
-            room['last_video_change'] = time.time()
-            if username:
-                self.add_msg(room_name, "System", f"⏹️ {username} stopped playback")
-            return False
-    
-    def check_and_skip_if_finished(self, room_name):
-        """Check if current video has finished and skip to next automatically"""
-        room = self.get_room(room_name)
-        
-        if not room['current_video'] or room['paused']:
-            return False
-        
-        if 'duration' not in room['current_video'] or room['current_video']['duration'] == 0:
-            # Duration unknown, can't auto-skip
-            return False
-        
-        # Calculate elapsed time considering pauses
-        if room['paused'] and room['pause_time']:
-            current_pause_duration = time.time() - room['pause_time']
-        else:
-            current_pause_duration = 0
-        
-        total_pause = room.get('total_pause_duration', 0) + current_pause_duration
-        elapsed = time.time() - room['current_video']['start_time'] - total_pause
-        
-        # Check if video has finished (with 5-second buffer)
-        if elapsed >= room['current_video']['duration'] - 5:  # 5 seconds before end
-            return self.skip(room_name, "Auto-skip")
-        
-        return False
-    
-    def remove_from_queue(self, room_name, index, username=""):
-        room = self.get_room(room_name)
-        if 0 <= index < len(room['queue']):
-            removed = room['queue'].pop(index)
-            self.room_activity[room_name] = time.time()
-            if username:
-                self.add_msg(room_name, "System", f"🗑️ {username} removed: {removed['title']}")
-            return True
-        return False
-    
-    def move_in_queue(self, room_name, from_idx, to_idx, username=""):
-        room = self.get_room(room_name)
-        if 0 <= from_idx < len(room['queue']) and 0 <= to_idx < len(room['queue']):
-            item = room['queue'].pop(from_idx)
-            room['queue'].insert(to_idx, item)
-            self.room_activity[room_name] = time.time()
-            if username:
-                self.add_msg(room_name, "System", f"↕️ {username} moved song in queue")
-            return True
-        return False
-    
-    def clear_queue(self, room_name, username=""):
-        room = self.get_room(room_name)
-        room['queue'].clear()
-        self.room_activity[room_name] = time.time()
-        if username:
-            self.add_msg(room_name, "System", f"🧹 {username} cleared the queue")
-    
-    def toggle_pause(self, room_name, username=""):
-        room = self.get_room(room_name)
-        if room['current_video']:
-            if not room['paused']:
-                room['paused'] = True
-                room['pause_time'] = time.time()
-                action = "paused"
-            else:
-                room['paused'] = False
-                if room['pause_time']:
-                    pause_duration = time.time() - room['pause_time']
-                    room['total_pause_duration'] += pause_duration
-                room['pause_time'] = None
-                action = "resumed"
-            
-            self.room_activity[room_name] = time.time()
-            if username:
-                self.add_msg(room_name, "System", f"⏯️ {username} {action} the video")
-            return True
-        return False
-    
-    def toggle_auto_skip(self, room_name, username=""):
-        room = self.get_room(room_name)
-        room['auto_skip_enabled'] = not room['auto_skip_enabled']
-        status = "enabled" if room['auto_skip_enabled'] else "disabled"
-        self.room_activity[room_name] = time.time()
-        if username:
-            self.add_msg(room_name, "System", f"⚡ {username} {status} auto-skip")
-        return room['auto_skip_enabled']
-    
-    def add_msg(self, room_name, user, text):
-        room = self.get_room(room_name)
-        timestamp = datetime.now().strftime("%H:%M")
-        room['chat'].append({
-            'user': user,
-            'text': text,
-            'time': timestamp
-        })
-        if len(room['chat']) > 100:  # Keep chat manageable
-            room['chat'].pop(0)
-        self.room_activity[room_name] = time.time()
-    
-    def list_rooms(self):
-        # Only return rooms with recent activity
-        current_time = time.time()
-        active_rooms = []
-        for room_name, last_active in self.room_activity.items():
-            if current_time - last_active < 7200:  # 2 hours
-                active_rooms.append(room_name)
-        return sorted(active_rooms)
-    
-    def cleanup_inactive_rooms(self, max_inactive_time=7200):  # 2 hours
-        current_time = time.time()
-        to_remove = []
-        for room_name, last_active in self.room_activity.items():
-            if current_time - last_active > max_inactive_time:
-                to_remove.append(room_name)
-        
-        for room_name in to_remove:
-            if room_name in self.rooms:
-                del self.rooms[room_name]
-            if room_name in self.users:
-                del self.users[room_name]
-            if room_name in self.room_activity:
-                del self.room_activity[room_name]
-        
-        return len(to_remove)
-
-def get_video_info(video_id):
-    """Fetch video title, thumbnail, and duration using YouTube API"""
-    try:
-        # Try to get video info from YouTube oEmbed (title and thumbnail)
-        oembed_url = f"https://www.youtube.com/oembed?url=https://www.youtube.com/watch?v={video_id}&format=json"
-        response = requests.get(oembed_url, timeout=3)
-        
-        if response.status_code == 200:
-            data = response.json()
-            title = data.get('title', f'Video {video_id}')
-            thumbnail = data.get('thumbnail_url', f'https://img.youtube.com/vi/{video_id}/0.jpg')
-            author = data.get('author_name', 'Unknown')
-        else:
-            title = f'Video {video_id}'
-            thumbnail = f'https://img.youtube.com/vi/{video_id}/0.jpg'
-            author = 'Unknown'
-        
-        # Try to get duration from YouTube (various methods)
-        duration = get_video_duration(video_id)
-        
-        return {
-            'title': title,
-            'thumbnail': thumbnail,
-            'author': author,
-            'duration': duration
-        }
-    except:
-        pass
-    
-    # Fallback if API fails
-    return {
-        'title': f'Video {video_id}',
-        'thumbnail': f'https://img.youtube.com/vi/{video_id}/0.jpg',
-        'author': 'Unknown',
-        'duration': 0  # Unknown duration
-    }
-
-def get_video_duration(video_id):
-    """Get video duration in seconds using various methods"""
-    try:
-        # Method 1: Try to extract from YouTube embed page
-        embed_url = f"https://www.youtube.com/embed/{video_id}"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        response = requests.get(embed_url, headers=headers, timeout=5)
-        if response.status_code == 200:
-            # Search for duration in the page
-            html = response.text
-            # Look for patterns that might contain duration
-            patterns = [
-                r'"length_seconds":\s*"(\d+)"',
-                r'"approxDurationMs":\s*"(\d+)"',
-                r'"duration":\s*"(\d+)"',
-                r'data\-duration="(\d+)"'
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, html)
-                if match:
-                    duration_str = match.group(1)
-                    if 'approxDurationMs' in pattern:
-                        # Convert milliseconds to seconds
-                        return int(duration_str) // 1000
-                    else:
-                        return int(duration_str)
-    except:
-        pass
-    
-    # Method 2: Use YouTube Data API if you have an API key
-    # Uncomment and add your API key if you have one
-    """
-    try:
-        api_key = "YOUR_YOUTUBE_API_KEY"  # Replace with your API key
-        api_url = f"https://www.googleapis.com/youtube/v3/videos?id={video_id}&part=contentDetails&key={api_key}"
-        response = requests.get(api_url, timeout=3)
-        if response.status_code == 200:
-            data = response.json()
-            if 'items' in data and len(data['items']) > 0:
-                duration_str = data['items'][0]['contentDetails']['duration']
-                # Parse ISO 8601 duration (e.g., PT1H30M15S)
-                import isodate
-                duration = isodate.parse_duration(duration_str)
-                return int(duration.total_seconds())
-    except:
-        pass
-    """
-    
-    # Method 3: Use a fallback based on video type
-    # Check if it's a short (typically less than 60 seconds)
-    if re.search(r'^shorts', video_id, re.I):
-        return 60  # Assume 60 seconds for shorts
-    
-    # Default fallback - most music videos are 3-5 minutes
-    return 240  # Default to 4 minutes (240 seconds)
+# Rooms live in room_manager.py; being a module, it outlives reruns and is
+# shared by every session, and benchmarks can drive it without a browser.
 
 # --- 3. INITIALIZE MANAGER ---
-manager = RoomManager()
+manager = get_room_manager()
 
 # --- 4. SESSION STATE INITIALIZATION ---
 # Initialize session state for user
@@ -498,10 +145,63 @@ if 'last_sync_time' not in st.session_state:
     st.session_state.last_sync_time = 0
 if 'auto_refresh_interval' not in st.session_state:
     st.session_state.auto_refresh_interval = 2000  # Start with 2 seconds
-if 'last_auto_skip_check' not in st.session_state:
-    st.session_state.last_auto_skip_check = 0
+if 'seen_state_version' not in st.session_state:
+    st.session_state.seen_state_version = 0
+
+# Each panel (player, chat, queue, room stats) is a fragment: using it, or its
+# own refresh tick, reruns that panel rather than the whole page. Seconds
+# between refreshes; the player follows the rate picked in the sidebar.
+CHAT_REFRESH = 1
+QUEUE_REFRESH = 5
+STATS_REFRESH = 10
+
+def fragment_timer():
+    """Timer for a fragment rerunning on its own; in a full run, run_timer covers it"""
+    ctx = get_script_run_ctx()
+    return SectionTimer(rate=None if ctx is not None and ctx.fragment_ids_this_run else 0)
+
+def panel_action(action, room_name, *args):
+    """on_click handler for a change only its own panel shows.
+
+    The panel reruns and shows it, so the room watcher needn't rerun the whole
+    page for it; anything someone else changed at the same moment reaches the
+    other panels at their next refresh.
+    """
+    action(room_name, *args)
+    st.session_state.seen_state_version = manager.get_state_version(room_name)
+
+run_timer.lap('setup')
 
 # --- 5. SIDEBAR: ROOM SELECTION & LOGIN ---
+@st.fragment(run_every=STATS_REFRESH)
+def room_stats(room_name):
+    timer = fragment_timer()
+    st.subheader("📊 Room Stats")
+    
+    room_data = manager.get_room(room_name)
+    users = manager.users.get(room_name, set())
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("👥 Users", len(users))
+    with col2:
+        st.metric("🎵 Queue", len(room_data['queue']))
+    
+    # Active users list
+    with st.expander("See who's online"):
+        for user in sorted(users):
+            if user == st.session_state.username:
+                st.write(f"**👉 {user} (You)**")
+            else:
+                st.write(f"• {user}")
+    
+    # Room creator info
+    if room_data.get('room_creator'):
+        created_time = datetime.fromtimestamp(room_data['created_at']).strftime("%H:%M")
+        st.caption(f"Created by {room_data['room_creator']} at {created_time}")
+    timer.lap('sidebar')
+    timer.finish(room=room_name, fragment='room_stats')
+
 with st.sidebar:
     # Custom header with logo
     st.markdown("""
@@ -588,28 +288,7 @@ with st.sidebar:
     
     # Room info section (only if joined)
     if st.session_state.joined and room_name in manager.users:
-        st.subheader("📊 Room Stats")
-        
-        room_data = manager.get_room(room_name)
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            st.metric("👥 Users", len(manager.users[room_name]))
-        with col2:
-            st.metric("🎵 Queue", len(room_data['queue']))
-        
-        # Active users list
-        with st.expander("See who's online"):
-            for user in sorted(manager.users[room_name]):
-                if user == st.session_state.username:
-                    st.write(f"**👉 {user} (You)**")
-                else:
-                    st.write(f"• {user}")
-        
-        # Room creator info
-        if room_data.get('room_creator'):
-            created_time = datetime.fromtimestamp(room_data['created_at']).strftime("%H:%M")
-            st.caption(f"Created by {room_data['room_creator']} at {created_time}")
+        room_stats(room_name)
     
     st.divider()
     
@@ -621,7 +300,7 @@ with st.sidebar:
         "Auto-refresh rate",
         options=["Slow (10s)", "Normal (5s)", "Fast (3s)", "Realtime (1s)"],
         value="Normal (5s)",
-        help="Faster refresh = better sync but more data usage"
+        help="Room changes show up immediately; this sets how often the clock and progress bar refresh"
     )
     
     # Map selection to milliseconds
@@ -637,6 +316,9 @@ with st.sidebar:
     if st.button("🔄 Manual Refresh", use_container_width=True):
         st.rerun()
     
+    cache_stats = manager.video_cache.stats()
+    st.caption(f"🎞️ Video cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses ({cache_stats['size']} cached)")
+    
     st.divider()
     
     # Quick help
@@ -655,6 +337,8 @@ with st.sidebar:
         • Use the queue to plan ahead
         """)
 
+run_timer.lap('sidebar')
+
 # --- 6. CHECK USER JOIN STATUS ---
 # Check if user has joined
 if not st.session_state.joined:
@@ -684,6 +368,8 @@ if not st.session_state.joined:
                 users_count = len(manager.users.get(room, []))
                 st.metric(f"#{room}", f"{users_count} user{'s' if users_count != 1 else ''}")
     
+    run_timer.lap('welcome')
+    run_timer.finish(room=None)
     st.stop()
 
 # --- 7. MAIN APP LOGIC ---
@@ -691,20 +377,20 @@ username = st.session_state.username
 room_name = st.session_state.current_room
 room_data = manager.get_room(room_name)
 
-# Check if current video has finished and skip automatically
-# Only check every 3 seconds to avoid excessive checks
-current_time = time.time()
-if current_time - st.session_state.last_auto_skip_check > 3:
-    if room_data.get('auto_skip_enabled', True):
-        manager.check_and_skip_if_finished(room_name)
-    st.session_state.last_auto_skip_check = current_time
+# Watch for room changes instead of blindly re-running the whole script.
+# The fragment below only compares version numbers, and asks for a full
+# rerun when the room itself changed (new video, queue edits, users joining).
+# Chat messages don't count: the chat panel picks those up on its own, as
+# the player does the clock and progress bar.
+st.session_state.seen_state_version = manager.get_state_version(room_name)
 
-# Apply auto-refresh
-count = st_autorefresh(
-    interval=st.session_state.auto_refresh_interval, 
-    key="autorefresh",
-    limit=100000
-)
+@st.fragment(run_every=1)
+def watch_room_changes():
+    if manager.get_state_version(room_name) != st.session_state.seen_state_version:
+        st.rerun()
+
+watch_room_changes()
+run_timer.lap('watcher')
 
 # --- 8. MAIN APP INTERFACE ---
 # Header
@@ -717,16 +403,20 @@ st.markdown(f"""
         </p>
     </div>
     <div style="text-align: right;">
-        <small>🔄 Refreshing every {st.session_state.auto_refresh_interval//1000}s</small>
+        <small>🔄 Live updates • clock every {st.session_state.auto_refresh_interval//1000}s</small>
     </div>
 </div>
 """, unsafe_allow_html=True)
+run_timer.lap('header')
 
 # Main columns
 col1, col2 = st.columns([2, 1])
 
 # --- LEFT COLUMN: VIDEO PLAYER ---
-with col1:
+@st.fragment(run_every=st.session_state.auto_refresh_interval / 1000)
+def player_panel(room_name, username):
+    timer = fragment_timer()
+    room_data = manager.get_room(room_name)
     # Current video player
     current = room_data['current_video']
     
@@ -780,31 +470,16 @@ with col1:
         if duration > 0:
             st.progress(progress, text=f"Progress: {progress_percent}%")
         
-        # YouTube embed
-        start_time_seconds = int(elapsed)
-        video_url = f"https://www.youtube.com/embed/{current['id']}?start={start_time_seconds}&autoplay=1&controls=1&modestbranding=1&rel=0"
-        
-        youtube_embed = f"""
-        <div class="youtube-player" id="ytplayer-{current['id']}">
-            <iframe 
-                width="100%" 
-                height="450" 
-                src="{video_url}" 
-                frameborder="0" 
-                allow="accelerometer; autoplay; clipboard-write; encrypted-media; gyroscope; picture-in-picture" 
-                allowfullscreen
-                style="border-radius: 10px; box-shadow: 0 10px 30px rgba(0,0,0,0.3);">
-            </iframe>
-        </div>
-        """
-        
-        st.components.v1.html(youtube_embed, height=470)
+        # YouTube embed: the same iframe across reruns, told about changes
+        # (new video, pause, resume) rather than reloaded with a new offset
+        youtube_player(room_data)
         
         # Auto-skip warning if video is ending soon
         if duration > 0 and remaining < 30 and room_data.get('auto_skip_enabled', True):
             st.warning(f"⏳ Video ends in {int(remaining)} seconds. Next: {room_data['queue'][0]['title'][:30] if room_data['queue'] else 'Nothing in queue'}")
         
-        # Playback controls
+        # Playback controls. Skip, auto-skip and clear show up elsewhere on the
+        # page (queue, header), so those rerun it all; pausing only the player
         st.markdown("### 🎛️ Controls")
         control_cols = st.columns(4)
         with control_cols[0]:
@@ -813,9 +488,8 @@ with col1:
                 st.rerun()
         with control_cols[1]:
             pause_text = "▶️ Resume" if room_data['paused'] else "⏸️ Pause"
-            if st.button(pause_text, use_container_width=True, help="Pause/Resume playback"):
-                manager.toggle_pause(room_name, username)
-                st.rerun()
+            st.button(pause_text, use_container_width=True, help="Pause/Resume playback",
+                      on_click=panel_action, args=(manager.toggle_pause, room_name, username))
         with control_cols[2]:
             auto_skip_status = "🔴 Disable Auto-skip" if room_data.get('auto_skip_enabled', True) else "🟢 Enable Auto-skip"
             if st.button(auto_skip_status, use_container_width=True, help="Toggle auto-skip when video ends"):
@@ -823,9 +497,7 @@ with col1:
                 st.rerun()
         with control_cols[3]:
             if st.button("🗑️ Clear", use_container_width=True, help="Stop playback"):
-                if room_data['current_video']:
-                    room_data['current_video'] = None
-                    room_data['last_video_change'] = time.time()
+                if manager.stop(room_name, username):
                     st.rerun()
         
     else:
@@ -850,12 +522,26 @@ with col1:
             <p>Paste a YouTube URL below to begin</p>
         </div>
         """, unsafe_allow_html=True)
-    
-    # Add Song Section
+    timer.lap('player')
+    timer.finish(room=room_name, fragment='player')
+
+# Add Song Section. A fragment too, so switching tabs or modes stays local;
+# adding a song changes the queue and player, so that reruns the page
+@st.fragment
+def add_music_panel(room_name, username):
+    timer = fragment_timer()
+    room_data = manager.get_room(room_name)
     st.divider()
     st.markdown("### ➕ Add Music")
     
-    add_tab1, add_tab2 = st.tabs(["🔗 Paste URL", "🔍 Quick Add"])
+    import_progress = room_data.get('import_progress')
+    if import_progress:
+        st.progress(
+            import_progress['done'] / import_progress['total'],
+            text=f"📥 Fetching song details: {import_progress['done']}/{import_progress['total']}"
+        )
+    
+    add_tab1, add_tab2, add_tab3 = st.tabs(["🔗 Paste URL", "🔍 Quick Add", "📥 Bulk Import"])
     
     with add_tab1:
         url_input = st.text_input(
@@ -866,15 +552,18 @@ with col1:
         
         col_add1, col_add2 = st.columns([3, 1])
         with col_add1:
-            add_mode = st.radio("Add to:", ["Queue", "Play Now"], horizontal=True)
+            add_mode = st.radio("Add to:", ["Queue", "Play Next", "Play Now"], horizontal=True)
         with col_add2:
             if st.button("🎵 Add", use_container_width=True, type="primary"):
                 if url_input:
-                    success, message = manager.add_video(room_name, url_input, username)
+                    was_playing = room_data['current_video'] is not None
+                    success, message = manager.add_video(
+                        room_name, url_input, username, play_next=add_mode != "Queue"
+                    )
                     if success:
                         # If "Play Now" is selected and there's a current video, skip to this one
-                        if add_mode == "Play Now" and room_data['current_video']:
-                            # Add to queue first, then skip
+                        if add_mode == "Play Now" and was_playing:
+                            # Added to the front of the queue, so skipping plays it
                             manager.skip(room_name, username)
                         st.success(message)
                         time.sleep(0.3)
@@ -912,111 +601,143 @@ with col1:
             if st.button("Pop", use_container_width=True):
                 manager.add_video(room_name, quick_links["🎶 Pop Hits"], username)
                 st.rerun()
+    
+    with add_tab3:
+        bulk_input = st.text_area(
+            "YouTube URLs or Video IDs",
+            placeholder="Paste links separated by spaces, commas or new lines...",
+            key="bulk_url_input",
+            height=150
+        )
+        if st.button("📥 Import All", use_container_width=True, type="primary"):
+            if bulk_input.strip():
+                success, message = manager.add_videos_bulk(room_name, bulk_input, username)
+                if success:
+                    st.success(message)
+                    st.rerun()
+                else:
+                    st.error(message)
+            else:
+                st.warning("Please paste at least one URL")
+    timer.lap('add_music')
+    timer.finish(room=room_name, fragment='add_music')
+
+with col1:
+    player_panel(room_name, username)
+    run_timer.lap('player')
+    
+    add_music_panel(room_name, username)
+    run_timer.lap('add_music')
 
 # --- RIGHT COLUMN: CHAT & QUEUE ---
+CHAT_VISIBLE = 25  # Show last 25 messages
+
+def send_chat(room_name, username):
+    # Runs before the chat panel's rerun, which then shows the message
+    text = st.session_state.chat_msg.strip()
+    if text:
+        manager.add_msg(room_name, username, text)
+        st.session_state.chat_msg = ""
+
+@st.fragment(run_every=CHAT_REFRESH)
+def chat_panel(room_name, username):
+    timer = fragment_timer()
+    # Chat messages
+    chat_container = st.container(height=350)
+    
+    # The HTML is built once per room for every viewer; this session only
+    # picks the highlighted version of its own messages
+    last_id, entries = manager.chat_html(room_name, CHAT_VISIBLE)
+    with chat_container:
+        st.markdown("\n".join(own_html if user == username else html for user, html, own_html in entries),
+                    unsafe_allow_html=True)
+    
+    if st.toggle("🕘 Show earlier messages", key="show_scrollback"):
+        first_shown = max(1, last_id - len(entries) + 1)
+        older = manager.get_chat_scrollback(room_name, first_shown)
+        if older:
+            for msg in older:
+                st.caption(f"[{msg['time']}] {msg['user']}: {msg['text']}")
+        else:
+            st.caption("No earlier messages")
+    
+    # Chat input
+    st.divider()
+    chat_input_cols = st.columns([4, 1])
+    with chat_input_cols[0]:
+        st.text_input("Type a message...", key="chat_msg", label_visibility="collapsed")
+    with chat_input_cols[1]:
+        st.button("Send", use_container_width=True, on_click=send_chat, args=(room_name, username))
+    timer.lap('chat')
+    timer.finish(room=room_name, fragment='chat')
+
+@st.fragment(run_every=QUEUE_REFRESH)
+def queue_panel(room_name, username):
+    timer = fragment_timer()
+    # Queue display, each row's text rendered once per room change for every viewer
+    queue_container = st.container(height=350)
+    rows = manager.queue_html(room_name)
+    
+    with queue_container:
+        if rows:
+            st.markdown(f"### 📋 Queue ({len(rows)} songs)")
+            
+            for i, (entry_id, row_html) in enumerate(rows):
+                with st.container():
+                    col_s1, col_s2, col_s3 = st.columns([6, 1, 1])
+                    with col_s1:
+                        st.markdown(row_html, unsafe_allow_html=True)
+                    with col_s2:
+                        st.button("↑", key=f"up_{entry_id}", help="Move up",
+                                  on_click=panel_action if i > 0 else None,
+                                  args=(manager.move_in_queue, room_name, entry_id, i-1, username))
+                    with col_s3:
+                        st.button("🗑", key=f"del_{entry_id}", help="Remove", on_click=panel_action,
+                                  args=(manager.remove_from_queue, room_name, entry_id, username))
+                    
+                    st.divider()
+            
+            # Queue management buttons
+            st.markdown("### 🛠️ Queue Tools")
+            col_qm1, col_qm2 = st.columns(2)
+            with col_qm1:
+                if st.button("Clear All", use_container_width=True):
+                    if st.checkbox("Are you sure? This cannot be undone!"):
+                        manager.clear_queue(room_name, username)
+                        st.rerun()
+            with col_qm2:
+                if st.button("Skip All", use_container_width=True, disabled=True):
+                    st.info("Coming soon!")
+        
+        else:
+            st.markdown("""
+            <div style="
+                height: 300px; 
+                display: flex; 
+                flex-direction: column; 
+                justify-content: center; 
+                align-items: center; 
+                text-align: center;
+                color: #888;
+            ">
+                <h1 style="font-size: 64px; margin: 0;">🎵</h1>
+                <h3>Queue is empty</h3>
+                <p>Add some songs to get started!</p>
+            </div>
+            """, unsafe_allow_html=True)
+    timer.lap('queue')
+    timer.finish(room=room_name, fragment='queue')
+
 with col2:
     tab1, tab2 = st.tabs(["💬 Live Chat", "📜 Song Queue"])
     
     with tab1:
-        # Chat messages
-        chat_container = st.container(height=350)
-        
-        with chat_container:
-            for msg in room_data['chat'][-25:]:  # Show last 25 messages
-                if msg['user'] == "System":
-                    st.markdown(f"""
-                    <div class='system-message chat-message'>
-                        <small>[{msg['time']}]</small><br>
-                        {msg['text']}
-                    </div>
-                    """, unsafe_allow_html=True)
-                else:
-                    # Highlight current user's messages
-                    if msg['user'] == username:
-                        st.markdown(f"""
-                        <div class='user-message chat-message' style='border-left-color: #00ff88;'>
-                            <strong>👉 {msg['user']}</strong> <small>[{msg['time']}]</small><br>
-                            {msg['text']}
-                        </div>
-                        """, unsafe_allow_html=True)
-                    else:
-                        st.markdown(f"""
-                        <div class='user-message chat-message'>
-                            <strong>{msg['user']}</strong> <small>[{msg['time']}]</small><br>
-                            {msg['text']}
-                        </div>
-                        """, unsafe_allow_html=True)
-        
-        # Chat input
-        st.divider()
-        chat_input_cols = st.columns([4, 1])
-        with chat_input_cols[0]:
-            chat_msg = st.text_input("Type a message...", key="chat_msg", label_visibility="collapsed")
-        with chat_input_cols[1]:
-            if st.button("Send", use_container_width=True):
-                if chat_msg.strip():
-                    manager.add_msg(room_name, username, chat_msg.strip())
-                    st.rerun()
+        chat_panel(room_name, username)
+    run_timer.lap('chat')
     
     with tab2:
-        # Queue display
-        queue_container = st.container(height=350)
-        
-        with queue_container:
-            if room_data['queue']:
-                st.markdown(f"### 📋 Queue ({len(room_data['queue'])} songs)")
-                
-                for i, song in enumerate(room_data['queue']):
-                    with st.container():
-                        col_s1, col_s2, col_s3 = st.columns([6, 1, 1])
-                        with col_s1:
-                            st.markdown(f"**{i+1}.** {song['title'][:40]}{'...' if len(song['title']) > 40 else ''}")
-                            if song.get('duration', 0) > 0:
-                                duration_min = song['duration'] // 60
-                                duration_sec = song['duration'] % 60
-                                st.caption(f"⏱️ {duration_min}:{duration_sec:02d} • by {song.get('added_by', 'Unknown')}")
-                            else:
-                                st.caption(f"by {song.get('added_by', 'Unknown')}")
-                        with col_s2:
-                            if st.button("↑", key=f"up_{i}", help="Move up"):
-                                if i > 0:
-                                    manager.move_in_queue(room_name, i, i-1, username)
-                                    st.rerun()
-                        with col_s3:
-                            if st.button("🗑", key=f"del_{i}", help="Remove"):
-                                manager.remove_from_queue(room_name, i, username)
-                                st.rerun()
-                        
-                        st.divider()
-                
-                # Queue management buttons
-                st.markdown("### 🛠️ Queue Tools")
-                col_qm1, col_qm2 = st.columns(2)
-                with col_qm1:
-                    if st.button("Clear All", use_container_width=True):
-                        if st.checkbox("Are you sure? This cannot be undone!"):
-                            manager.clear_queue(room_name, username)
-                            st.rerun()
-                with col_qm2:
-                    if st.button("Skip All", use_container_width=True, disabled=True):
-                        st.info("Coming soon!")
-            
-            else:
-                st.markdown("""
-                <div style="
-                    height: 300px; 
-                    display: flex; 
-                    flex-direction: column; 
-                    justify-content: center; 
-                    align-items: center; 
-                    text-align: center;
-                    color: #888;
-                ">
-                    <h1 style="font-size: 64px; margin: 0;">🎵</h1>
-                    <h3>Queue is empty</h3>
-                    <p>Add some songs to get started!</p>
-                </div>
-                """, unsafe_allow_html=True)
+        queue_panel(room_name, username)
+    run_timer.lap('queue')
 
 # --- FOOTER ---
 st.divider()
@@ -1027,9 +748,5 @@ with footer_cols[1]:
     st.caption(f"User: **{username}**")
 with footer_cols[2]:
     st.caption(f"Auto-skip: {'✅ ON' if room_data.get('auto_skip_enabled', True) else '❌ OFF'}")
-
-# --- CLEANUP ---
-# Clean up inactive rooms periodically
-if 'last_cleanup' not in st.session_state or time.time() - st.session_state.last_cleanup > 300:
-    cleaned = manager.cleanup_inactive_rooms()
-    st.session_state.last_cleanup = time.time()
\ No newline at end of file
+run_timer.lap('footer')
+run_timer.finish(room=room_name, queue=len(room_data['queue']), chat=len(room_data['chat']))
\ No newline at end of file
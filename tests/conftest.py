@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The modules live at the top of the repo rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Keep metadata and room snapshots in memory rather than in the working directory
+os.environ['SYNCROOM_VIDEO_CACHE'] = ''
+os.environ['SYNCROOM_STREAMLIT_SNAPSHOT'] = ''
+os.environ['SYNCROOM_SNAPSHOT'] = ''
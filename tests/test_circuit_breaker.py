@@ -0,0 +1,77 @@
+"""CircuitBreaker state changes"""
+import threading
+import time
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+RESET = 0.05
+
+
+def tripped(failures=3):
+    breaker = CircuitBreaker(failures, RESET)
+    for _ in range(failures):
+        assert breaker.allow()
+        breaker.record_failure()
+    return breaker
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(3, RESET)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_a_success_resets_the_count():
+    breaker = CircuitBreaker(3, RESET)
+    for outcome in ['fail', 'fail', 'ok', 'fail', 'fail']:
+        assert breaker.allow()
+        breaker.record_failure() if outcome == 'fail' else breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = tripped()
+    time.sleep(RESET * 1.5)
+    allowed = []
+    threads = [threading.Thread(target=lambda: allowed.append(breaker.allow())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(allowed) == [False] * 7 + [True]
+    assert breaker.state == HALF_OPEN
+
+
+def test_trial_success_closes():
+    breaker = tripped()
+    time.sleep(RESET * 1.5)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_trial_failure_opens_again_for_another_timeout():
+    breaker = tripped()
+    time.sleep(RESET * 1.5)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    time.sleep(RESET * 1.5)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+
+
+def test_zero_failures_disables_the_breaker():
+    breaker = CircuitBreaker(0, RESET)
+    for _ in range(10):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
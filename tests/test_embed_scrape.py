@@ -0,0 +1,157 @@
+"""Streaming embed-page duration scrape, against pages served from a local server"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from video_info import (
+    EMBED_CHUNK_SIZE, EMBED_MATCH_OVERLAP, LookupFailed, scan_embed_duration, scrape_embed_duration
+)
+
+FILLER = b'<script>var ytcfg={"EXPERIMENT_FLAGS":{"web_player_flag":true}};</script>\n'
+SEND_CHUNK = 4 * 1024
+
+
+def page_with(size, *fields):
+    """size bytes of filler with each (offset, field) written over it"""
+    page = (FILLER * (size // len(FILLER) + 1))[:size]
+    for offset, field in fields:
+        page = page[:offset] + field + page[offset + len(field):]
+    return page
+
+
+class PageServer:
+    """Serves self.pages[name] at /embed/<name>, trickled in SEND_CHUNK writes, and notes hang-ups"""
+    def __init__(self):
+        self.pages = {}  # name -> (status, body, delay between writes)
+        self.sent = {}  # name -> bytes written before the transfer ended
+        self.hung_up = {}  # name -> Event set when the client goes away mid-page
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def do_GET(self):
+                name = self.path.rsplit('/', 1)[-1]
+                status, body, delay = server.pages[name]
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                sent = 0
+                try:
+                    for start in range(0, len(body), SEND_CHUNK):
+                        self.wfile.write(body[start:start + SEND_CHUNK])
+                        self.wfile.flush()
+                        sent += len(body[start:start + SEND_CHUNK])
+                        time.sleep(delay)
+                except (BrokenPipeError, ConnectionResetError):
+                    server.hung_up[name].set()
+                finally:
+                    server.sent[name] = sent
+            
+            def log_message(self, *args):
+                pass
+        
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+    
+    def serve(self, name, body, status=200, delay=0):
+        self.pages[name] = (status, body, delay)
+        self.hung_up[name] = threading.Event()
+        return f'http://127.0.0.1:{self.httpd.server_port}/embed/{name}'
+
+
+@pytest.fixture(scope='module')
+def pages():
+    server = PageServer()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+def test_field_split_across_chunks_is_found(pages):
+    field = b'"length_seconds": "213"'
+    # Straddles the first EMBED_CHUNK_SIZE read
+    url = pages.serve('split', page_with(4 * EMBED_CHUNK_SIZE, (EMBED_CHUNK_SIZE - 10, field)))
+    duration, read = scrape_embed_duration(url)
+    assert duration == 213
+    assert read == 2 * EMBED_CHUNK_SIZE
+
+
+@pytest.mark.parametrize('cut', range(1, len(b'"approxDurationMs": "213480"')))
+def test_field_split_at_any_byte(cut):
+    field = b'"approxDurationMs": "213480"'
+    first = page_with(1000) + field[:cut]
+    second = field[cut:] + page_with(1000)
+    assert scan_embed_duration([first, second]) == (213, len(first) + len(second))
+
+
+def test_split_wider_than_the_overlap_is_not_stitched():
+    # Only EMBED_MATCH_OVERLAP bytes of the previous chunk are searched again
+    field = b'data-duration="213"'
+    chunks = [page_with(1000) + field[:5], b' ' * EMBED_MATCH_OVERLAP + field[5:]]
+    assert scan_embed_duration(chunks)[0] is None
+
+
+def test_byte_ceiling_stops_the_read(pages):
+    size = 40 * EMBED_CHUNK_SIZE
+    url = pages.serve('late', page_with(size, (size - 100, b'data-duration="213"')))
+    max_bytes = 4 * EMBED_CHUNK_SIZE
+    duration, read = scrape_embed_duration(url, max_bytes=max_bytes)
+    assert duration is None
+    assert max_bytes <= read < max_bytes + EMBED_CHUNK_SIZE
+    # The same page without a ceiling in the way
+    assert scrape_embed_duration(url, max_bytes=2 * size) == (213, size)
+
+
+def test_missing_field_reads_the_whole_page(pages):
+    size = 5 * EMBED_CHUNK_SIZE + 123
+    url = pages.serve('missing', page_with(size))
+    assert scrape_embed_duration(url) == (None, size)
+
+
+def test_connection_closes_once_a_field_is_found(pages):
+    # 64 writes 20 ms apart: well over a second to send the lot
+    size = 64 * SEND_CHUNK
+    url = pages.serve('early', page_with(size, (100, b'"length_seconds": "213"')), delay=0.02)
+    started = time.monotonic()
+    duration, read = scrape_embed_duration(url)
+    elapsed = time.monotonic() - started
+    assert duration == 213
+    assert read < size
+    assert elapsed < 0.75
+    # The server sees the hang-up on one of its next writes
+    assert pages.hung_up['early'].wait(5)
+    assert pages.sent['early'] < size
+
+
+@pytest.mark.parametrize('status', [429, 500, 502, 503])
+def test_outage_statuses_raise_lookup_failed(pages, status):
+    url = pages.serve(f'status-{status}', b'busy', status=status)
+    with pytest.raises(LookupFailed):
+        scrape_embed_duration(url)
+
+
+@pytest.mark.parametrize('status', [401, 404])
+def test_other_errors_are_an_answer(pages, status):
+    url = pages.serve(f'status-{status}', b'<html>no such video</html>', status=status)
+    assert scrape_embed_duration(url) == (None, 0)
+
+
+@pytest.mark.parametrize('fields, expected', [
+    # Within a chunk, whichever field comes first in the page wins...
+    ([(200, b'"duration": "99"'), (400, b'"length_seconds": "213"')], 99),
+    ([(200, b'"length_seconds": "213"'), (400, b'"duration": "99"')], 213),
+    # ...approxDurationMs being converted from milliseconds
+    ([(200, b'"approxDurationMs": "187900"'), (400, b'data-duration="213"')], 187),
+    # ...and across chunks, the earlier chunk's field, without reading on
+    ([(100, b'data-duration="42"'), (3 * EMBED_CHUNK_SIZE, b'"length_seconds": "213"')], 42),
+])
+def test_first_field_in_the_page_wins(pages, fields, expected):
+    url = pages.serve('several', page_with(4 * EMBED_CHUNK_SIZE, *fields))
+    duration, read = scrape_embed_duration(url)
+    assert duration == expected
+    assert read == EMBED_CHUNK_SIZE
@@ -0,0 +1,106 @@
+"""FailedLookups: negative-cache expiry, background retries and listeners"""
+import threading
+import time
+
+from video_info import FailedLookups, placeholder_video_info
+
+TTL = 0.1
+VIDEO_ID = 'dQw4w9WgXcQ'
+FALLBACK = dict(placeholder_video_info(VIDEO_ID), fallback=True)
+REAL = {'title': 'Never Gonna Give You Up', 'thumbnail': 't', 'author': 'Rick Astley', 'duration': 213}
+
+
+class Fetcher:
+    """A fetch() that fails (recording the fallback again, as _fetch_video_info does) `failures` times first"""
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+        self.lookups = None
+        self.called = threading.Event()
+    
+    def __call__(self, video_id):
+        self.calls += 1
+        self.called.set()
+        if self.calls <= self.failures:
+            self.lookups.record(video_id, FALLBACK)
+            return FALLBACK
+        self.lookups.succeeded(video_id)
+        return REAL
+
+
+def failed_lookups(fetcher, max_retries=5):
+    lookups = FailedLookups(fetcher, ttl=TTL, max_retries=max_retries)
+    fetcher.lookups = lookups
+    return lookups
+
+
+def wait_for(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_entry_expires_into_one_retry_that_notifies_listeners():
+    fetcher = Fetcher()
+    lookups = failed_lookups(fetcher)
+    heard = []
+    lookups.add_listener(lambda video_id, info: heard.append((video_id, info)))
+    
+    lookups.record(VIDEO_ID, FALLBACK)
+    assert lookups.get(VIDEO_ID) == FALLBACK
+    assert fetcher.calls == 0
+    
+    assert fetcher.called.wait(2)
+    assert lookups.get(VIDEO_ID) is None
+    assert wait_for(lambda: heard)
+    time.sleep(3 * TTL)
+    assert fetcher.calls == 1
+    assert heard == [(VIDEO_ID, REAL)]
+
+
+def test_retry_with_nothing_new_notifies_nobody():
+    fetcher = Fetcher(failures=1)
+    lookups = failed_lookups(fetcher)
+    heard = []
+    lookups.add_listener(lambda video_id, info: heard.append(info))
+    
+    lookups.record(VIDEO_ID, FALLBACK)
+    assert wait_for(lambda: fetcher.calls == 2)
+    # The first retry got the same fallback back; only the second had news
+    assert wait_for(lambda: heard)
+    assert heard == [REAL]
+
+
+def test_retries_stop_at_the_limit():
+    fetcher = Fetcher(failures=100)
+    lookups = failed_lookups(fetcher, max_retries=3)
+    lookups.record(VIDEO_ID, FALLBACK)
+    assert wait_for(lambda: fetcher.calls == 3)
+    time.sleep(4 * TTL)
+    assert fetcher.calls == 3
+
+
+def test_record_without_retry_only_caches():
+    fetcher = Fetcher()
+    lookups = failed_lookups(fetcher)
+    lookups.record(VIDEO_ID, FALLBACK, retry=False)
+    assert lookups.get(VIDEO_ID) == FALLBACK
+    time.sleep(3 * TTL)
+    assert lookups.get(VIDEO_ID) is None
+    assert fetcher.calls == 0
+
+
+def test_a_failing_listener_does_not_stop_the_others():
+    fetcher = Fetcher()
+    lookups = failed_lookups(fetcher)
+    heard = []
+    
+    def broken(video_id, info):
+        raise RuntimeError('listener bug')
+    
+    lookups.add_listener(broken)
+    lookups.add_listener(lambda video_id, info: heard.append(info))
+    lookups.record(VIDEO_ID, FALLBACK)
+    assert wait_for(lambda: heard)
+    assert heard == [REAL]
@@ -0,0 +1,52 @@
+"""RoomManager change notification"""
+import threading
+import time
+
+from room_manager import RoomManager
+
+
+def test_wait_for_change_wakes_on_a_change():
+    manager = RoomManager()
+    manager.get_room('x')
+    since = manager.get_version('x')
+    woke = []
+    waiter = threading.Thread(target=lambda: woke.append(manager.wait_for_change('x', since, timeout=5)))
+    waiter.start()
+    time.sleep(0.05)
+    started = time.monotonic()
+    manager.add_msg('x', 'alice', 'hi')
+    waiter.join(5)
+    assert woke == [manager.get_version('x')]
+    assert woke[0] != since
+    assert time.monotonic() - started < 1
+
+
+def test_wait_for_change_times_out_without_one():
+    manager = RoomManager()
+    manager.get_room('x')
+    since = manager.get_version('x')
+    started = time.monotonic()
+    assert manager.wait_for_change('x', since, timeout=0.1) == since
+    assert time.monotonic() - started >= 0.1
+
+
+def test_wait_for_change_returns_at_once_if_already_moved():
+    manager = RoomManager()
+    manager.get_room('x')
+    since = manager.get_version('x')
+    manager.toggle_auto_skip('x')
+    assert manager.wait_for_change('x', since, timeout=5) == since + 1
+
+
+def test_wait_for_change_wakes_when_the_room_is_evicted():
+    manager = RoomManager()
+    manager.get_room('x')
+    manager.room_activity['x'] = time.time() - 10000
+    since = manager.get_version('x')
+    woke = []
+    waiter = threading.Thread(target=lambda: woke.append(manager.wait_for_change('x', since, timeout=5)))
+    waiter.start()
+    time.sleep(0.05)
+    assert manager.cleanup_inactive_rooms() == 1
+    waiter.join(5)
+    assert woke == [0]
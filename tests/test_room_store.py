@@ -0,0 +1,120 @@
+"""SQLiteRoomStore locking: rooms must not wait on each other, in a green server or across processes"""
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from room_store import MemoryRoomStore, RoomStore, SQLiteRoomStore
+from video_queue import VideoQueue
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def new_room():
+    return {'current_video': None, 'queue': VideoQueue(), 'users': [], 'version': 0}
+
+
+def run(script, *args, timeout=20):
+    """Run a Python snippet in a fresh interpreter (monkey-patching can't be undone in this one)"""
+    result = subprocess.run(
+        [sys.executable, '-c', textwrap.dedent(script), *args],
+        cwd=ROOT, capture_output=True, text=True, timeout=timeout
+    )
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def test_incomplete_store_fails_when_created():
+    class LockOnlyStore(RoomStore):
+        def lock(self, room):
+            pass
+    
+    with pytest.raises(TypeError):
+        LockOnlyStore()
+    assert isinstance(MemoryRoomStore(), RoomStore)
+
+
+def test_lock_saves_changes_and_nests(tmp_path):
+    store = SQLiteRoomStore(str(tmp_path / 'rooms.db'))
+    with store.lock('x'):
+        assert 'x' not in store
+        store['x'] = new_room()
+        with store.lock('x'):
+            store['x']['users'].append('alice')
+        store['x']['queue'].append({'id': 'dQw4w9WgXcQ', 'title': 'Song'})
+        store.log_op('x', {'v': 1, 'op': 'append'})
+    
+    # A second store on the same file, as another worker would open it
+    other = SQLiteRoomStore(str(tmp_path / 'rooms.db'))
+    assert other['x']['users'] == ['alice']
+    assert [video['id'] for video in other['x']['queue']] == ['dQw4w9WgXcQ']
+    assert other.ops('x') == [{'v': 1, 'op': 'append'}]
+    assert list(other) == ['x']
+
+
+def test_lock_releases_after_an_error(tmp_path):
+    store = SQLiteRoomStore(str(tmp_path / 'rooms.db'))
+    with pytest.raises(RuntimeError):
+        with store.lock('x'):
+            store['x'] = new_room()
+            raise RuntimeError('handler failed')
+    # The state is still saved, as before, and the room can be taken again
+    with store.lock('x'):
+        assert store['x']['version'] == 0
+
+
+def test_rooms_do_not_block_each_other_under_eventlet(tmp_path):
+    pytest.importorskip('eventlet')
+    # Two greenlets hold different rooms while yielding, as a handler does
+    # while it broadcasts. Neither may wait for the other.
+    elapsed = run('''
+        import eventlet
+        eventlet.monkey_patch()
+        import sys, time
+        from room_store import SQLiteRoomStore
+        from video_queue import VideoQueue
+        
+        store = SQLiteRoomStore(sys.argv[1])
+        
+        def handler(room):
+            with store.lock(room):
+                store[room] = {'current_video': None, 'queue': VideoQueue(), 'users': [room], 'version': 0}
+                store.log_op(room, {'v': 1, 'op': 'join'})
+                eventlet.sleep(0.5)
+        
+        started = time.monotonic()
+        pool = eventlet.GreenPool()
+        for room in ('x', 'y'):
+            pool.spawn(handler, room)
+        pool.waitall()
+        assert store['x']['users'] == ['x'] and store['y']['users'] == ['y']
+        print(time.monotonic() - started)
+    ''', str(tmp_path / 'rooms.db'))
+    assert float(elapsed) < 0.9
+
+
+def test_same_room_is_serialized_across_processes(tmp_path):
+    path = str(tmp_path / 'rooms.db')
+    store = SQLiteRoomStore(path)
+    with store.lock('x'):
+        store['x'] = new_room()
+    
+    script = '''
+        import sys
+        from room_store import SQLiteRoomStore
+        
+        store = SQLiteRoomStore(sys.argv[1])
+        for _ in range(100):
+            with store.lock('x'):
+                store['x']['version'] += 1
+    '''
+    workers = [
+        subprocess.Popen([sys.executable, '-c', textwrap.dedent(script), path], cwd=ROOT)
+        for _ in range(3)
+    ]
+    for worker in workers:
+        assert worker.wait(timeout=60) == 0
+    # Every increment survives: no two processes held the room at once
+    assert store['x']['version'] == 300
@@ -0,0 +1,43 @@
+"""Per-sender rate limiting for chat"""
+import threading
+import time
+
+
+class TokenBucket:
+    """Allows `rate` events per second on average, in bursts of up to `burst`.
+
+    The bucket starts full and refills continuously; each event spends one
+    token. A rate of 0 disables the limit.
+    """
+    __slots__ = ('rate', 'burst', '_tokens', '_updated', '_lock')
+    
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def take(self):
+        """Spend a token if there is one; False means the event should be refused"""
+        if not self.rate:
+            return True
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+    
+    def wait_time(self):
+        """Seconds until the next token is available"""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            self._refill()
+            return max(0.0, (1 - self._tokens) / self.rate)
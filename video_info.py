@@ -0,0 +1,530 @@
+"""YouTube metadata lookup shared by the Streamlit and Socket.IO front ends"""
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from circuit_breaker import OPEN, CircuitBreaker
+from metrics import Counter, Gauge, Histogram
+from scheduler import RoomScheduler
+
+# One pooled, keep-alive session for every metadata request
+http_session = requests.Session()
+http_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# Matches the video ID in watch, short-link, embed, /v/ and shorts URLs
+VIDEO_URL_PATTERN = re.compile(
+    r'(?:youtube\.com/(?:watch\?(?:[^\s#]*?&)?v=|embed/|v/|shorts/)|youtu\.be/)([\w-]{11})'
+)
+VIDEO_ID_PATTERN = re.compile(r'^[\w-]{11}$')
+
+# Any of the embed page's duration fields, in one pass: approxDurationMs is in
+# milliseconds, the others in seconds. The page is streamed and searched
+# chunk by chunk, and reading stops at the first match or the byte ceiling.
+EMBED_URL = 'https://www.youtube.com/embed/{}'
+EMBED_DURATION_PATTERN = re.compile(
+    rb'"length_seconds":\s*"(\d+)"|"approxDurationMs":\s*"(\d+)"|"duration":\s*"(\d+)"|data-duration="(\d+)"'
+)
+EMBED_CHUNK_SIZE = 16 * 1024
+EMBED_MAX_BYTES = int(os.environ.get('SYNCROOM_EMBED_MAX_BYTES', 2 * 1024 * 1024))
+# A chunk is searched along with this much of the previous one, so a field split between them is found
+EMBED_MATCH_OVERLAP = 256
+EMBED_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# source is 'oembed' (title, thumbnail) or 'embed_scrape' (duration)
+FETCH_SECONDS = Histogram('syncroom_video_fetch_seconds', 'YouTube metadata request latency', ['source'])
+FETCH_FAILURES = Counter(
+    'syncroom_video_fetch_failures_total', 'YouTube metadata requests that errored or found nothing', ['source']
+)
+# result is 'cached', 'fetched', 'placeholder' (the lookup failed) or 'failed_recently'
+# (a lookup that failed within SYNCROOM_NEGATIVE_TTL, served without asking YouTube again)
+VIDEO_INFO_LOOKUPS = Counter('syncroom_video_info_lookups_total', 'get_video_info calls by outcome', ['result'])
+FETCH_SHORT_CIRCUITS = Counter(
+    'syncroom_video_fetch_short_circuits_total', 'YouTube metadata requests skipped by an open circuit breaker',
+    ['source']
+)
+
+# After BREAKER_FAILURES errors in a row from an endpoint, stop calling it for
+# BREAKER_RESET seconds and fall back to placeholder metadata straight away.
+# A failed lookup is served from memory for NEGATIVE_TTL seconds and retried
+# in the background when that runs out, up to REFRESH_RETRIES times.
+BREAKER_FAILURES = int(os.environ.get('SYNCROOM_BREAKER_FAILURES', 5))
+BREAKER_RESET = float(os.environ.get('SYNCROOM_BREAKER_RESET', 30))
+NEGATIVE_TTL = float(os.environ.get('SYNCROOM_NEGATIVE_TTL', 60))
+REFRESH_RETRIES = 5
+# Lookups that have to ask YouTube start at most this many times per second,
+# across every import and single add in the process
+LOOKUP_RATE = float(os.environ.get('SYNCROOM_LOOKUP_RATE', 10))
+breakers = {
+    'oembed': CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET),
+    'embed_scrape': CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET),
+}
+Gauge('syncroom_video_breaker_open', '1 while requests to the endpoint are short-circuited', ['source']).set_function(
+    lambda: {source: int(breaker.state == OPEN) for source, breaker in breakers.items()}
+)
+
+
+class LookupFailed(Exception):
+    """A metadata endpoint errored, timed out, answered 429/5xx, or has its breaker open"""
+
+def extract_video_id(url):
+    """Extract YouTube video ID from various URL formats"""
+    # Clean the URL
+    url = url.strip()
+    
+    match = VIDEO_URL_PATTERN.search(url)
+    if match:
+        return match.group(1)
+    
+    # Also check if it's just a video ID
+    if VIDEO_ID_PATTERN.match(url):
+        return url
+    
+    return None
+
+def extract_video_ids(urls):
+    """Extract unique video IDs, in order, from a list of URLs/IDs or a pasted text blob"""
+    if isinstance(urls, str):
+        urls = re.split(r'[\s,]+', urls)
+    
+    video_ids = {}
+    for url in urls:
+        video_id = extract_video_id(url) if url else None
+        if video_id:
+            video_ids[video_id] = True
+    return list(video_ids)
+
+class VideoInfoCache:
+    """LRU cache of video metadata keyed by video ID, with TTL expiry and optional SQLite persistence"""
+    def __init__(self, max_entries=1000, ttl=7 * 24 * 3600, db_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # video_id -> (stored_at, info)
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS video_info ("
+                    "video_id TEXT PRIMARY KEY, info TEXT NOT NULL, stored_at REAL NOT NULL)"
+                )
+                self._db.execute("DELETE FROM video_info WHERE stored_at < ?", (time.time() - ttl,))
+                self._db.commit()
+            except sqlite3.Error:
+                # Fall back to memory-only caching if the file can't be used
+                self._db = None
+    
+    def get(self, video_id):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry is None and self._db is not None:
+                entry = self._load(video_id)
+                if entry is not None:
+                    self._entries[video_id] = entry
+            
+            if entry is None or now - entry[0] > self.ttl:
+                self._entries.pop(video_id, None)
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(video_id)
+            self.hits += 1
+            return dict(entry[1])
+    
+    def peek(self, video_id):
+        """Return cached info only if present in memory, without touching the counters or disk"""
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                return None
+            self._entries.move_to_end(video_id)
+            return dict(entry[1])
+    
+    def set(self, video_id, info):
+        entry = (time.time(), dict(info))
+        with self._lock:
+            self._entries[video_id] = entry
+            self._entries.move_to_end(video_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO video_info (video_id, info, stored_at) VALUES (?, ?, ?)",
+                        (video_id, json.dumps(entry[1]), entry[0])
+                    )
+                    self._db.commit()
+                except sqlite3.Error:
+                    pass
+    
+    def _load(self, video_id):
+        try:
+            row = self._db.execute(
+                "SELECT stored_at, info FROM video_info WHERE video_id = ?", (video_id,)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        return (row[0], json.loads(row[1]))
+    
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'size': len(self._entries)
+            }
+
+_video_cache = None
+_video_cache_lock = threading.Lock()
+
+def get_video_cache():
+    """Process-wide metadata cache, shared by every room and every Streamlit rerun"""
+    global _video_cache
+    with _video_cache_lock:
+        if _video_cache is None:
+            # Set SYNCROOM_VIDEO_CACHE to an empty string to keep the cache in memory only
+            db_path = os.environ.get('SYNCROOM_VIDEO_CACHE', 'video_cache.db')
+            _video_cache = VideoInfoCache(db_path=db_path or None)
+    return _video_cache
+
+Gauge('syncroom_video_cache_entries', 'Video metadata entries held in memory').set_function(
+    lambda: get_video_cache().stats()['size']
+)
+
+class FailedLookups:
+    """Negative cache of failed lookups, each retried in the background once its entry expires.
+
+    record() keeps the fallback metadata for `ttl` seconds, so asking again
+    meanwhile costs nothing, and schedules `fetch(video_id)` for when it runs
+    out. A fetch that fails records again, up to `max_retries` times in a row.
+    Whenever a retry turns up different metadata it is passed to every
+    add_listener() callback as callback(video_id, info), so whoever is still
+    showing the fallback can patch it.
+    """
+    def __init__(self, fetch, ttl=NEGATIVE_TTL, max_retries=REFRESH_RETRIES):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_retries = max_retries
+        self.cache = VideoInfoCache(ttl=ttl)
+        self._retries = {}  # video_id -> retries scheduled since the last success
+        self._listeners = []
+        self._lock = threading.Lock()
+        # Started on the first failure
+        self._scheduler = None
+        self._executor = None
+    
+    def get(self, video_id):
+        return self.cache.peek(video_id)
+    
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+    
+    def record(self, video_id, info, retry=True):
+        self.cache.set(video_id, info)
+        if not retry:
+            return
+        with self._lock:
+            retries = self._retries.get(video_id, 0)
+            if retries >= self.max_retries:
+                # Give up; the next request for the video starts over
+                del self._retries[video_id]
+                return
+            self._retries[video_id] = retries + 1
+            if self._scheduler is None:
+                self._scheduler = RoomScheduler(name="video-refresh")
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="video-refresh")
+        self._scheduler.schedule(video_id, time.time() + self.ttl, self._due, info)
+    
+    def succeeded(self, video_id):
+        with self._lock:
+            self._retries.pop(video_id, None)
+    
+    def _due(self, video_id, recorded):
+        # Off the timer thread, so a slow fetch doesn't hold up other retries
+        self._executor.submit(self._retry, video_id, recorded)
+    
+    def _retry(self, video_id, recorded):
+        info = self.fetch(video_id)
+        if info == recorded:
+            return
+        for callback in list(self._listeners):
+            try:
+                callback(video_id, info)
+            except Exception:
+                # One failing listener must not keep the rest from hearing
+                pass
+
+failed_lookups = FailedLookups(lambda video_id: _fetch_video_info(video_id))
+
+def _call_endpoint(source, fetch):
+    """fetch() through the source's circuit breaker, raising LookupFailed if it fails or is short-circuited"""
+    breaker = breakers[source]
+    if not breaker.allow():
+        FETCH_SHORT_CIRCUITS.labels(source).inc()
+        raise LookupFailed(f'{source}: circuit open')
+    try:
+        with FETCH_SECONDS.labels(source).time():
+            result = fetch()
+    except Exception as error:
+        breaker.record_failure()
+        FETCH_FAILURES.labels(source).inc()
+        raise LookupFailed(f'{source}: {error!r}') from error
+    breaker.record_success()
+    return result
+
+def _raise_for_outage(response):
+    # A 404 or 401 is an answer about the video; these mean the endpoint is struggling
+    if response.status_code == 429 or response.status_code >= 500:
+        raise LookupFailed(f'HTTP {response.status_code}')
+
+def _fetch_oembed(video_id):
+    oembed_url = f"https://www.youtube.com/oembed?url=https://www.youtube.com/watch?v={video_id}&format=json"
+    response = http_session.get(oembed_url, timeout=3)
+    _raise_for_outage(response)
+    if response.status_code != 200:
+        return None
+    return response.json()
+
+def get_video_info(video_id):
+    """Fetch video title, thumbnail, and duration using YouTube API"""
+    cache = get_video_cache()
+    cached = cache.get(video_id)
+    if cached is not None:
+        VIDEO_INFO_LOOKUPS.labels('cached').inc()
+        return cached
+    
+    failed = failed_lookups.get(video_id)
+    if failed is not None:
+        VIDEO_INFO_LOOKUPS.labels('failed_recently').inc()
+        return failed
+    return _fetch_video_info(video_id)
+
+def _fetch_video_info(video_id):
+    try:
+        # Try to get video info from YouTube oEmbed (title and thumbnail)
+        data = _call_endpoint('oembed', lambda: _fetch_oembed(video_id))
+    except LookupFailed:
+        # Fallback if API fails, marked so whoever holds it knows to ask again
+        video_info = dict(placeholder_video_info(video_id), fallback=True)
+        failed_lookups.record(video_id, video_info)
+        VIDEO_INFO_LOOKUPS.labels('placeholder').inc()
+        return video_info
+    
+    if data is not None:
+        title = data.get('title', f'Video {video_id}')
+        thumbnail = data.get('thumbnail_url', f'https://img.youtube.com/vi/{video_id}/0.jpg')
+        author = data.get('author_name', 'Unknown')
+    else:
+        FETCH_FAILURES.labels('oembed').inc()
+        title = f'Video {video_id}'
+        thumbnail = f'https://img.youtube.com/vi/{video_id}/0.jpg'
+        author = 'Unknown'
+    
+    # Try to get duration from YouTube (various methods)
+    complete = True
+    try:
+        duration = _scrape_duration(video_id)
+    except LookupFailed:
+        duration, complete = None, False
+    duration_guessed = duration is None
+    if duration_guessed:
+        duration = guess_duration(video_id)
+    
+    video_info = {
+        'title': title,
+        'thumbnail': thumbnail,
+        'author': author,
+        'duration': duration
+    }
+    if duration_guessed:
+        # Good enough to show, not to time the video by
+        video_info['duration_guessed'] = True
+    if complete and not duration_guessed:
+        get_video_cache().set(video_id, video_info)
+        failed_lookups.succeeded(video_id)
+        VIDEO_INFO_LOOKUPS.labels('fetched').inc()
+    elif complete:
+        # The page answered without a duration: asking again soon won't help,
+        # but a guess mustn't stick for as long as real metadata
+        failed_lookups.succeeded(video_id)
+        failed_lookups.record(video_id, video_info, retry=False)
+        VIDEO_INFO_LOOKUPS.labels('fetched').inc()
+    else:
+        # Real title, guessed duration: keep it only until the retry
+        video_info['fallback'] = True
+        failed_lookups.record(video_id, video_info)
+        VIDEO_INFO_LOOKUPS.labels('placeholder').inc()
+    return video_info
+
+def timer_duration(info):
+    """Duration to time the video by: 0 (unknown) if it was only guessed, so it never ends a video early"""
+    return 0 if info.get('duration_guessed') else info['duration']
+
+def placeholder_video_info(video_id):
+    """Metadata shown until (or instead of) the real info is fetched"""
+    return {
+        'title': f'Video {video_id}',
+        'thumbnail': f'https://img.youtube.com/vi/{video_id}/0.jpg',
+        'author': 'Unknown',
+        'duration': 0  # Unknown duration
+    }
+
+def scan_embed_duration(chunks, max_bytes=EMBED_MAX_BYTES):
+    """(duration in seconds or None, bytes read) from the first duration field in a stream of byte chunks"""
+    tail = b''
+    read = 0
+    for chunk in chunks:
+        read += len(chunk)
+        window = tail + chunk
+        match = EMBED_DURATION_PATTERN.search(window)
+        if match:
+            length_seconds, duration_ms, duration, data_duration = match.groups()
+            if duration_ms is not None:
+                return int(duration_ms) // 1000, read
+            return int(length_seconds or duration or data_duration), read
+        if read >= max_bytes:
+            break
+        tail = window[-EMBED_MATCH_OVERLAP:]
+    return None, read
+
+def scrape_embed_duration(embed_url, max_bytes=EMBED_MAX_BYTES, timeout=5):
+    """(duration in seconds or None, bytes read) from an embed page, closing the connection once it's found"""
+    with http_session.get(embed_url, headers=EMBED_HEADERS, timeout=timeout, stream=True) as response:
+        _raise_for_outage(response)
+        if response.status_code != 200:
+            return None, 0
+        return scan_embed_duration(response.iter_content(EMBED_CHUNK_SIZE), max_bytes)
+
+def _scrape_duration(video_id):
+    """Duration from the embed page, or None if it has none; LookupFailed if the endpoint is failing"""
+    duration = _call_endpoint('embed_scrape', lambda: scrape_embed_duration(EMBED_URL.format(video_id))[0])
+    if duration is None:
+        FETCH_FAILURES.labels('embed_scrape').inc()
+    return duration
+
+def get_video_duration(video_id):
+    """Get video duration in seconds using various methods"""
+    try:
+        # Method 1: Try to extract from YouTube embed page
+        duration = _scrape_duration(video_id)
+        if duration is not None:
+            return duration
+    except LookupFailed:
+        pass
+    
+    # Method 2: Use YouTube Data API if you have an API key
+    # Uncomment and add your API key if you have one
+    """
+    try:
+        api_key = "YOUR_YOUTUBE_API_KEY"  # Replace with your API key
+        api_url = f"https://www.googleapis.com/youtube/v3/videos?id={video_id}&part=contentDetails&key={api_key}"
+        response = requests.get(api_url, timeout=3)
+        if response.status_code == 200:
+            data = response.json()
+            if 'items' in data and len(data['items']) > 0:
+                duration_str = data['items'][0]['contentDetails']['duration']
+                # Parse ISO 8601 duration (e.g., PT1H30M15S)
+                import isodate
+                duration = isodate.parse_duration(duration_str)
+                return int(duration.total_seconds())
+    except:
+        pass
+    """
+    
+    return guess_duration(video_id)
+
+def guess_duration(video_id):
+    # Method 3: Use a fallback based on video type
+    # Check if it's a short (typically less than 60 seconds)
+    if re.search(r'^shorts', video_id, re.I):
+        return 60  # Assume 60 seconds for shorts
+    
+    # Default fallback - most music videos are 3-5 minutes
+    return 240  # Default to 4 minutes (240 seconds)
+
+class VideoInfoResolver:
+    """Resolves video metadata on a background thread pool, sharing one fetch per video ID.
+
+    Lookups that miss both caches wait their turn on a rate limiter first.
+    The process shares one instance, video_resolver, so concurrent imports
+    and single adds draw on the same pool and the same rate.
+    """
+    def __init__(self, max_workers=8, rate=LOOKUP_RATE):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="video-info")
+        self._limiter = RateLimiter(rate)
+        self._in_flight = {}  # video_id -> Future
+        self._lock = threading.Lock()
+    
+    def resolve(self, video_id):
+        with self._lock:
+            future = self._in_flight.get(video_id)
+            if future is not None:
+                return future
+            future = self._executor.submit(self._lookup, video_id)
+            self._in_flight[video_id] = future
+        
+        future.add_done_callback(lambda f: self._finish(video_id, f))
+        return future
+    
+    def resolve_many(self, video_ids):
+        """Resolve many videos at once, yielding (video_id, info) as each completes"""
+        futures = {self.resolve(video_id): video_id for video_id in dict.fromkeys(video_ids)}
+        for future in as_completed(futures):
+            video_id = futures[future]
+            try:
+                video_info = future.result()
+            except Exception:
+                video_info = dict(placeholder_video_info(video_id), fallback=True)
+            yield video_id, video_info
+    
+    def _lookup(self, video_id):
+        # Cached entries (and recent failures) skip the rate limiter entirely
+        if get_video_cache().peek(video_id) is None and failed_lookups.get(video_id) is None:
+            self._limiter.acquire()
+        return get_video_info(video_id)
+    
+    def _finish(self, video_id, future):
+        with self._lock:
+            if self._in_flight.get(video_id) is future:
+                del self._in_flight[video_id]
+
+
+class RateLimiter:
+    """Spaces out calls across threads so at most `rate` start per second"""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+video_resolver = VideoInfoResolver()
+
+def fetch_video_infos(video_ids):
+    """Fetch metadata for many videos through the shared resolver, yielding (video_id, info) as each completes"""
+    return video_resolver.resolve_many(video_ids)
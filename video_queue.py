@@ -0,0 +1,100 @@
+"""Play queue shared by the Streamlit and Socket.IO front ends"""
+import uuid
+from collections import OrderedDict
+from itertools import islice
+
+
+def new_entry_id():
+    return uuid.uuid4().hex[:12]
+
+
+class VideoQueue:
+    """Ordered play queue with O(1) push/pop at both ends and O(1) removal by entry ID.
+
+    Every queued video dict gets an 'entry_id' (the same video can be queued
+    more than once), which is what remove/move address.
+    """
+    def __init__(self, videos=()):
+        self._entries = OrderedDict()  # entry_id -> video dict
+        for video in videos:
+            self.append(video)
+    
+    def _key(self, video):
+        if 'entry_id' not in video:
+            video['entry_id'] = new_entry_id()
+        return video['entry_id']
+    
+    def append(self, video):
+        self._entries[self._key(video)] = video
+        return video
+    
+    def extend(self, videos):
+        for video in videos:
+            self.append(video)
+    
+    def appendleft(self, video):
+        """Insert as the next video to play"""
+        entry_id = self._key(video)
+        self._entries[entry_id] = video
+        self._entries.move_to_end(entry_id, last=False)
+        return video
+    
+    def popleft(self):
+        return self._entries.popitem(last=False)[1]
+    
+    def remove(self, entry_id):
+        """Remove an entry by ID, returning it (or None if it isn't queued)"""
+        return self._entries.pop(entry_id, None)
+    
+    def move(self, entry_id, position):
+        """Move an entry to `position` (clamped to the queue bounds). Returns False if it isn't queued."""
+        video = self._entries.pop(entry_id, None)
+        if video is None:
+            return False
+        
+        position = max(0, min(position, len(self._entries)))
+        if position == 0:
+            self.appendleft(video)
+            return True
+        
+        # Re-append everything that should come after the moved entry
+        self._entries[entry_id] = video
+        for key in list(islice(self._entries, position, len(self._entries) - 1)):
+            self._entries.move_to_end(key)
+        return True
+    
+    def index(self, entry_id):
+        for i, key in enumerate(self._entries):
+            if key == entry_id:
+                return i
+        return -1
+    
+    def get(self, entry_id):
+        return self._entries.get(entry_id)
+    
+    def clear(self):
+        self._entries.clear()
+    
+    def to_list(self):
+        return list(self._entries.values())
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.to_list()[index]
+        if index == 0 and self._entries:
+            return next(iter(self._entries.values()))
+        if index == -1 and self._entries:
+            return next(reversed(self._entries.values()))
+        return self.to_list()[index]
+    
+    def __iter__(self):
+        return iter(list(self._entries.values()))
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def __bool__(self):
+        return bool(self._entries)
+    
+    def __contains__(self, entry_id):
+        return entry_id in self._entries
@@ -0,0 +1,125 @@
+"""Per-connection Socket.IO wire encoding: JSON by default, msgpack for clients that speak it.
+
+A client picks msgpack simply by sending msgpack: the Socket.IO CONNECT
+packet it opens with arrives as a binary frame (socket.io-msgpack-parser in
+the browser, MsgPackPacket in python-socketio). Everything the server sends
+that connection is msgpack from then on; every other connection keeps JSON.
+
+Broadcasts are still encoded once: a packet's JSON form carries its packet,
+and the msgpack form is built the first time a msgpack recipient needs it
+and then reused for the rest of the room. Without the msgpack package, or
+on a python-socketio whose internals install() hooks have changed, every
+connection stays on JSON.
+"""
+import threading
+
+from engineio import packet as eio_packet
+from socketio import packet
+
+try:
+    import msgpack
+except ImportError:  # optional: JSON only
+    msgpack = None
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+# Private socketio.Server methods install() wraps; they are not a public API,
+# so a release that renames any of them leaves the server on plain JSON
+SERVER_HOOKS = ('_handle_eio_message', '_handle_eio_disconnect', '_send_packet', '_send_eio_packet')
+
+
+class _EncodedPacket(str):
+    """A packet's JSON text, able to produce the same packet as one msgpack Engine.IO message"""
+    packet = None
+    _msgpack = None
+    
+    def msgpack_message(self):
+        # Racing threads may both build it; either result is identical
+        message = self._msgpack
+        if message is None:
+            message = eio_packet.Packet(eio_packet.MESSAGE, self.packet.encode_msgpack())
+            self._msgpack = message
+        return message
+
+
+class CodecPacket(packet.Packet):
+    """Socket.IO packet that decodes text frames as JSON and binary frames as msgpack"""
+    
+    def encode(self):
+        encoded = super().encode()
+        if isinstance(encoded, str):
+            encoded = _EncodedPacket(encoded)
+            encoded.packet = self
+        return encoded
+    
+    def encode_msgpack(self):
+        return msgpack.dumps(self._to_dict())
+    
+    def decode(self, encoded_packet):
+        if isinstance(encoded_packet, bytes) and msgpack is not None:
+            decoded = msgpack.loads(encoded_packet)
+            self.packet_type = decoded['type']
+            self.data = decoded.get('data')
+            self.id = decoded.get('id')
+            self.namespace = decoded['nsp']
+            return 0
+        return super().decode(encoded_packet)
+
+
+class ConnectionCodecs:
+    """Tracks each connection's encoding and sends it packets in that encoding.
+
+    install() hooks a socketio.Server created with serializer=CodecPacket,
+    and returns whether msgpack is available to its clients.
+    """
+    def __init__(self):
+        self.codecs = {}  # Engine.IO sid -> JSON or MSGPACK
+        self._lock = threading.Lock()
+    
+    def install(self, server):
+        if msgpack is None:
+            return False
+        if not all(hasattr(server, name) for name in SERVER_HOOKS) or not hasattr(packet.Packet, '_to_dict'):
+            return False
+        handle_message = server._handle_eio_message
+        handle_disconnect = server._handle_eio_disconnect
+        send_packet = server._send_packet
+        send_eio_packet = server._send_eio_packet
+        
+        def on_message(eio_sid, data):
+            if eio_sid not in self.codecs:
+                # The first packet (CONNECT) decides
+                with self._lock:
+                    self.codecs[eio_sid] = MSGPACK if isinstance(data, bytes) else JSON
+            return handle_message(eio_sid, data)
+        
+        def on_disconnect(eio_sid, *args):
+            try:
+                return handle_disconnect(eio_sid, *args)
+            finally:
+                with self._lock:
+                    self.codecs.pop(eio_sid, None)
+        
+        def send_packet_as_codec(eio_sid, pkt):
+            if self.codecs.get(eio_sid) == MSGPACK:
+                server.eio.send(eio_sid, pkt.encode_msgpack())
+            else:
+                send_packet(eio_sid, pkt)
+        
+        def send_eio_packet_as_codec(eio_sid, eio_pkt):
+            if isinstance(eio_pkt.data, _EncodedPacket) and self.codecs.get(eio_sid) == MSGPACK:
+                eio_pkt = eio_pkt.data.msgpack_message()
+            send_eio_packet(eio_sid, eio_pkt)
+        
+        server.eio.on('message', on_message)
+        server.eio.on('disconnect', on_disconnect)
+        server._send_packet = send_packet_as_codec
+        server._send_eio_packet = send_eio_packet_as_codec
+        return True
+    
+    def counts(self):
+        """Open connections per encoding"""
+        counts = {JSON: 0, MSGPACK: 0}
+        for codec in list(self.codecs.values()):
+            counts[codec] += 1
+        return counts
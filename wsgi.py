@@ -0,0 +1,36 @@
+"""Production entry point for the Socket.IO server.
+
+    python wsgi.py                                      # eventlet, the default
+    SYNCROOM_ASYNC_MODE=gevent python wsgi.py
+    SYNCROOM_ASYNC_MODE=threading gunicorn -w 1 --threads 500 wsgi:app
+
+The green modes run on Flask-SocketIO's embedded eventlet/gevent server (current
+gunicorn releases no longer ship an eventlet worker). Either way the standard
+library has to be monkey-patched before app.py, or anything it imports
+(requests, threading, socket), is loaded; importing app directly would leave
+blocking sockets and real threads behind.
+"""
+import os
+
+ASYNC_MODE = os.environ.setdefault('SYNCROOM_ASYNC_MODE', 'eventlet')
+
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+from app import app, socketio  # noqa: E402
+
+# Cap on concurrent connections (each is a green thread) in the green modes
+MAX_CONNECTIONS = int(os.environ.get('SYNCROOM_MAX_CONNECTIONS', 4000))
+
+if __name__ == '__main__':
+    server_options = {}
+    if ASYNC_MODE == 'eventlet':
+        server_options['max_size'] = MAX_CONNECTIONS
+    elif ASYNC_MODE == 'gevent':
+        server_options['spawn'] = MAX_CONNECTIONS
+    socketio.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)),
+                 allow_unsafe_werkzeug=True, **server_options)
@@ -0,0 +1,31 @@
+"""YouTube player for the Streamlit UI that survives reruns.
+
+An st.components.v1.html embed is rebuilt whenever its HTML changes, and a
+`?start=` offset changes every second. This player is a custom component
+instead: Streamlit keeps its iframe across reruns and only posts the room's
+playback state to it, and the page in player_frontend/ turns changes in that
+state into load/seek/play/pause calls on the YouTube IFrame API.
+"""
+import os
+import time
+
+import streamlit.components.v1 as components
+
+_player = components.declare_component(
+    'youtube_player', path=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'player_frontend')
+)
+
+
+def youtube_player(room, height=450, key='youtube_player'):
+    """Show (or keep showing) the room's current video, in step with the room's clock"""
+    video = room['current_video']
+    _player(
+        video_id=video['id'],
+        start_time=video['start_time'],
+        total_pause_duration=room.get('total_pause_duration', 0),
+        pause_time=room['pause_time'] if room['paused'] else None,
+        server_time=time.time(),
+        height=height,
+        key=key,
+        default=None
+    )